@@ -1,10 +1,48 @@
-from typing import List
-from fastapi import FastAPI, Query, Body
+import asyncio
+import hmac
+import json
+import os
+import signal
+import threading
+import time
+from typing import List, Literal, Optional
+from fastapi import FastAPI, Query, Body, Header, Request, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from src.embedded_store import load_vector_db
-from src.retriever import build_topic_doc_graph, retrieve_chunks, retrieve_documents, query_both_levels
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from src import metrics, query_cache
+from src.batcher import QueryBatcher
+from src.blog_watcher import BlogWatcher
+from src.executor import (
+    GENERATION_QUEUE,
+    GENERATION_WORKERS,
+    ExecutorBusyError,
+    InferenceExecutor,
+)
+from src.catalog import get_catalog
+from src.context_builder import CONTEXT_TOKEN_BUDGET, pack_context
+from src.filters import build_where
+from src.generation import get_generator
+from src.models import embedding_stats, warmup, loaded_models
+from src.snapshots import IndexManager
+from src.retriever import (
+    RERANK_CANDIDATES,
+    RERANK_TIMEOUT_MS,
+    build_topic_doc_graph,
+    embed_queries,
+    retrieve_chunks,
+    retrieve_documents,
+    query_both_levels,
+)
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse ghi thời gian serialize vào stage "serialize"."""
 
-app = FastAPI(title="RAG Blog Assistant API")
+    def render(self, content) -> bytes:
+        with metrics.timer("serialize"):
+            return super().render(content)
+
+
+app = FastAPI(title="RAG Blog Assistant API", default_response_class=TimedJSONResponse)
 
 # CORS middleware để cho phép frontend truy cập
 app.add_middleware(
@@ -15,14 +53,200 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load vector DB khi server start
-vectordb = load_vector_db()
+# Header Server-Timing (embed, search, ... của từng request) + đếm request theo route
+app.add_middleware(metrics.ServerTimingMiddleware)
+
+# Load vector DB khi server start (model embedding chỉ load ở query đầu tiên).
+# Nếu thư mục có snapshot (CURRENT + versions/) thì dùng version hiện tại và
+# có thể hot reload qua POST /admin/reload hoặc SIGHUP.
+index = IndexManager(os.getenv("RAG_PERSIST_DIR", "vectorstore"))
+
+# Embedding + search chạy trên executor riêng, không dùng threadpool mặc định
+inference = InferenceExecutor()
+
+# Sinh câu trả lời trên pool riêng có giới hạn: đầy → 503 như inference
+generation = InferenceExecutor(GENERATION_WORKERS, GENERATION_QUEUE, name="generation")
+
+# Gom embedding của các query đồng thời thành 1 batch (RAG_MICROBATCH=0 để tắt)
+batcher = None
+if os.getenv("RAG_MICROBATCH", "1") == "1":
+    batcher = QueryBatcher(inference, lambda queries: index.run(embed_queries, queries))
+
+
+def _collect_stats():
+    """Đưa stats() sẵn có (cache, executor, batcher, index, blog watcher) ra /metrics."""
+    caches = query_cache.stats()
+    yield "rag_query_cache_entries", "gauge", "Số entry trong cache", [
+        ({"cache": name}, stats["size"]) for name, stats in caches.items()
+    ]
+    yield "rag_query_cache_hits_total", "counter", "Số lần cache hit", [
+        ({"cache": name}, stats["hits"]) for name, stats in caches.items()
+    ]
+    yield "rag_query_cache_misses_total", "counter", "Số lần cache miss", [
+        ({"cache": name}, stats["misses"]) for name, stats in caches.items()
+    ]
+    models = embedding_stats()
+    yield "rag_embedding_cache_hits_total", "counter", "Embedding lấy từ cache trên đĩa", [
+        ({"model": name}, stats["hits"]) for name, stats in models.items()
+    ]
+    yield "rag_embedding_cache_misses_total", "counter", "Embedding phải chạy model", [
+        ({"model": name}, stats["misses"]) for name, stats in models.items()
+    ]
+
+    executor = inference.stats()
+    yield "rag_inference_workers", "gauge", "Số thread inference", [({}, executor["workers"])]
+    yield "rag_inference_in_flight", "gauge", "Việc đang chạy + đang chờ trên executor", [({}, executor["in_flight"])]
+    yield "rag_inference_rejected_total", "counter", "Request bị từ chối vì queue đầy", [({}, executor["rejected"])]
+    executor = generation.stats()
+    yield "rag_generation_in_flight", "gauge", "Việc sinh câu trả lời đang chạy + đang chờ", [({}, executor["in_flight"])]
+    yield "rag_generation_rejected_total", "counter", "Request chat bị từ chối vì queue generation đầy", [({}, executor["rejected"])]
+
+    if batcher is not None:
+        batches = batcher.stats()
+        yield "rag_batcher_batches_total", "counter", "Số batch embedding", [({}, batches["batches"])]
+        yield "rag_batcher_queries_total", "counter", "Số query đã qua batcher", [({}, batches["queries"])]
+
+    current = index.stats()
+    yield "rag_index_info", "gauge", "Version index đang phục vụ", [({"version": current["version"] or ""}, 1)]
+    yield "rag_index_reloads_total", "counter", "Số lần hot reload", [({}, current["reloads"])]
+    yield "rag_index_inflight", "gauge", "Query đang chạy trên version hiện tại", [({}, current["inflight"])]
+    yield "rag_index_load_seconds", "gauge", "Thời gian load version hiện tại", [({}, current["load_seconds"])]
+
+    if blog_watcher is not None:
+        watcher = blog_watcher.stats()
+        yield "rag_blog_syncs_total", "counter", "Số lần sync blog", [({}, watcher["syncs"])]
+        yield "rag_blog_freshness_lag_seconds", "gauge", "Độ trễ từ lúc sửa file tới khi sync xong (lần gần nhất)", [
+            ({}, watcher["last_freshness_lag_seconds"])
+        ]
+
+
+metrics.register_collector(_collect_stats)
+
+
+async def run_query(query: str, search):
+    """
+    Chạy search(vector) cho 1 query trên executor.
+    Embedding của query được micro-batch nếu bật batcher.
+    """
+    if batcher is None:
+        return await inference.run(search, None)
+    return await batcher.submit(query, search)
+
+
+def _where_or_400(**kwargs):
+    try:
+        return build_where(**kwargs)
+    except (TypeError, ValueError) as e:  # field lạ / ngày sai định dạng
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def metadata_filter(
+    doc_id: Optional[str] = Query(None, description="Chỉ tìm trong 1 document"),
+    source_file: Optional[str] = Query(None),
+    collection: Optional[str] = Query(None, description="vd: hugo_blogs_blogs"),
+    type: Optional[str] = Query(None, description="vd: blog_post"),
+    tag: Optional[List[str]] = Query(None, description="Lặp lại để yêu cầu nhiều tag"),
+    date_from: Optional[str] = Query(None, description="ISO date, vd: 2024-01-01"),
+    date_to: Optional[str] = Query(None, description="ISO date"),
+):
+    """Query params lọc metadata → `where` của Chroma (None nếu không lọc)."""
+    return _where_or_400(
+        doc_id=doc_id,
+        source_file=source_file,
+        collection=collection,
+        type=type,
+        tags=tag,
+        date_from=date_from,
+        date_to=date_to,
+    )
+
+
+# Token cho /admin/* (header X-Admin-Token). Không đặt → chỉ nhận request từ
+# loopback không có header Origin (chặn trang web gọi vào qua CORS "*")
+ADMIN_TOKEN = os.getenv("RAG_ADMIN_TOKEN")
+_LOOPBACK_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+
+def require_admin(request: Request, x_admin_token: Optional[str] = Header(None)):
+    if ADMIN_TOKEN:
+        if not x_admin_token or not hmac.compare_digest(
+            x_admin_token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")
+        ):
+            raise HTTPException(status_code=401, detail="Invalid or missing X-Admin-Token")
+        return
+    host = request.client.host if request.client else None
+    if host not in _LOOPBACK_HOSTS or "origin" in request.headers:
+        raise HTTPException(
+            status_code=403,
+            detail="Admin endpoints only accept local requests unless RAG_ADMIN_TOKEN is set",
+        )
+
+
+@app.exception_handler(ExecutorBusyError)
+async def executor_busy_handler(request: Request, exc: ExecutorBusyError):
+    """Queue inference đầy → 503 + Retry-After để client thử lại sau."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please retry later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.on_event("startup")
+def warmup_models():
+    """RAG_WARMUP=1 → load model embedding ở background ngay khi server start."""
+    if os.getenv("RAG_WARMUP", "0") == "1":
+        threading.Thread(target=warmup, daemon=True).start()
+
+
+# RAG_WATCH_BLOG_DIR → thread nền tự sync blog vào vectordb đang dùng
+blog_watcher = None
+
+
+@app.on_event("startup")
+def start_blog_watcher():
+    global blog_watcher
+    blog_dir = os.getenv("RAG_WATCH_BLOG_DIR")
+    if not blog_dir:
+        return
+    if index.version is not None:
+        # Dùng snapshot: ghi vào version mới rồi reload, không ghi vào version đang phục vụ
+        blog_watcher = BlogWatcher(blog_dir, snapshot_root=index.root, on_publish=index.reload)
+    else:
+        blog_watcher = BlogWatcher(
+            blog_dir, persist_dir=index.vectordb._persist_directory, vectordb=index.vectordb
+        )
+        index.on_swap(blog_watcher.use_vectordb)
+    blog_watcher.start()
+
+
+@app.on_event("startup")
+def install_reload_signal():
+    """SIGHUP → load version index mới ở background (không có trên Windows)."""
+    # signal chỉ cài được từ main thread (uvicorn: có; test client: không)
+    if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGHUP, lambda signum, frame: index.reload_async())
+
+
+@app.on_event("shutdown")
+def shutdown_inference():
+    if blog_watcher is not None:
+        blog_watcher.stop(timeout=5)
+    inference.shutdown()
+    generation.shutdown()
 
 
 @app.get("/query_chunks")
-def query_chunks_api(q: str = Query(...), k: int = 3):
+async def query_chunks_api(
+    q: str = Query(...),
+    k: int = 3,
+    mode: Literal["vector", "hybrid"] = Query("vector", description="hybrid = vector + BM25"),
+    where: Optional[dict] = Depends(metadata_filter),
+):
     """Truy vấn theo chunk."""
-    docs = retrieve_chunks(vectordb, q, k)
+    docs = await run_query(
+        q, lambda vector: index.run(retrieve_chunks, q, k, vector=vector, mode=mode, filter=where)
+    )
     return {
         "query": q,
         "chunks": [
@@ -36,9 +260,17 @@ def query_chunks_api(q: str = Query(...), k: int = 3):
     }
 
 @app.get("/query_documents")
-def query_documents_api(q: str = Query(...), k: int = 2, chunk_k: int = 5):
+async def query_documents_api(
+    q: str = Query(...),
+    k: int = 2,
+    chunk_k: int = 5,
+    aggregate: Literal["count", "sum", "max"] = Query("count", description="Cách tính điểm document"),
+    where: Optional[dict] = Depends(metadata_filter),
+):
     """Truy vấn theo document."""
-    ranked_docs = retrieve_documents(vectordb, q, k=k, chunk_k=chunk_k)
+    ranked_docs = await inference.run(
+        index.run, retrieve_documents, q, k=k, chunk_k=chunk_k, aggregate=aggregate, filter=where
+    )
     return {
         "query": q,
         "documents": [
@@ -49,9 +281,20 @@ def query_documents_api(q: str = Query(...), k: int = 2, chunk_k: int = 5):
 
 
 @app.get("/query_both")
-def query_both_api(q: str = Query(...), k_doc: int = 2, k_chunk: int = 3):
+async def query_both_api(
+    q: str = Query(...),
+    k_doc: int = 2,
+    k_chunk: int = 3,
+    aggregate: Literal["count", "sum", "max"] = Query("count", description="Cách tính điểm document"),
+    where: Optional[dict] = Depends(metadata_filter),
+):
     """Truy vấn cả document-level và chunk-level."""
-    results = query_both_levels(vectordb, q, k_doc, k_chunk)
+    results = await run_query(
+        q,
+        lambda vector: index.run(
+            query_both_levels, q, k_doc, k_chunk, aggregate=aggregate, vector=vector, filter=where
+        ),
+    )
     
     chunk_json = [
         {
@@ -69,22 +312,40 @@ def query_both_api(q: str = Query(...), k_doc: int = 2, k_chunk: int = 3):
 
 
 @app.get("/list_documents")
-def list_documents():
-    """Lấy danh sách tất cả tài liệu trong vectorstore."""
-    collection = vectordb._collection.get(include=["metadatas"])
-    metadatas = collection["metadatas"]
+async def list_documents(
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor của trang trước"),
+    source_file: Optional[str] = Query(None),
+    collection: Optional[str] = Query(None),
+    type: Optional[str] = Query(None),
+    q: Optional[str] = Query(None, description="Tìm trong source_file / title"),
+):
+    """
+    Danh sách tài liệu trong vectorstore (đọc từ catalog, phân trang theo cursor).
 
-    docs = {}
-    for meta in metadatas:
-        if meta and "doc_id" in meta:
-            docs[meta["doc_id"]] = meta.get("source_file", "unknown")
+    Returns:
+        {
+            "documents": [{"doc_id", "source_file", "title", "collection", "type",
+                           "chunks", "bytes", "ingested_at"}],
+            "next_cursor": str | None,
+            "total": int
+        }
+    """
+    def list_page(vectordb):
+        catalog = get_catalog(vectordb._persist_directory, vectordb)
+        return catalog.list(
+            limit=limit, cursor=cursor, source_file=source_file,
+            collection=collection, type=type, q=q,
+        )
 
-    results = [{"doc_id": k, "source_file": v} for k, v in docs.items()]
-    return {"documents": results}
+    try:
+        return await inference.run(index.run, list_page)
+    except ValueError as e:  # cursor sai
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/graph")
-def graph_api(
+async def graph_api(
     topics: List[str] = Body(..., example=["RAG", "Cryptanalysis", "Consensus Algorithm"]),
     top_k: int = Query(5, description="Số documents mỗi topic")
 ):
@@ -93,14 +354,113 @@ def graph_api(
     - Input: danh sách chủ đề (topics)
     - Output: JSON gồm nodes và edges
     """
-    graph = build_topic_doc_graph(vectordb, topics, top_k=top_k)
+    graph = await inference.run(index.run, build_topic_doc_graph, topics, top_k=top_k)
     return graph
 
 
+def _source_info(doc) -> dict:
+    metadata = doc.metadata
+    title = metadata.get('title', 'Untitled')
+    filename = metadata.get('filename', '')
+
+    # Create URL (assuming blog structure)
+    # Ví dụ: java-socket-co-ban.md -> /blogs/java-socket-co-ban/
+    blog_slug = filename.replace('.md', '') if filename else ''
+    url = f"/blogs/{blog_slug}/" if blog_slug else "#"
+
+    # Get excerpt (first 200 chars)
+    excerpt = doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
+
+    return {
+        "title": title,
+        "url": url,
+        "excerpt": excerpt,
+        "filename": filename
+    }
+
+
+def _stream_event(event: dict, format: str) -> str:
+    """1 event → 1 dòng NDJSON hoặc 1 message SSE."""
+    data = json.dumps(event, ensure_ascii=False)
+    if format == "sse":
+        return f"event: {event['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+def _produce_tokens(generator, question, docs, loop, tokens, cancelled):
+    """
+    Chạy generator (code đồng bộ, có thể gọi LLM) trên executor generation,
+    đẩy từng token sang event loop. Dừng sớm khi client ngắt kết nối.
+    """
+    def put(kind, value=None):
+        try:
+            loop.call_soon_threadsafe(tokens.put_nowait, (kind, value))
+        except RuntimeError:  # event loop đã đóng
+            cancelled.set()
+
+    stream = generator.stream(question, docs)
+    try:
+        for token in stream:
+            if cancelled.is_set():
+                return
+            put("token", token)
+    except Exception as e:
+        put("error", str(e))
+        return
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    put("done")
+
+
+async def _stream_chat(question, sources, context, tokens, cancelled, timings, start, format):
+    """
+    sources ngay khi retrieve xong → từng token của generator → done (kèm timings).
+    ttfb_ms: từ lúc nhận request tới byte đầu tiên (event sources);
+    first_token_ms: tới token đầu tiên của generator; total_ms: tới khi xong.
+    """
+    try:
+        timings["ttfb_ms"] = (time.perf_counter() - start) * 1000
+        yield _stream_event(
+            {"type": "sources", "question": question, "sources": sources,
+             "total_sources": len(sources), "context": context, "timings": dict(timings)},
+            format,
+        )
+        generate_start = time.perf_counter()
+        while True:
+            kind, value = await tokens.get()
+            if kind == "done":
+                break
+            if kind == "error":
+                # Header đã gửi → không đổi được status code, báo lỗi trong stream
+                yield _stream_event({"type": "error", "detail": value}, format)
+                return
+            if "first_token_ms" not in timings:
+                timings["first_token_ms"] = (time.perf_counter() - start) * 1000
+            yield _stream_event({"type": "token", "text": value}, format)
+    finally:
+        cancelled.set()  # client ngắt giữa chừng → producer dừng, trả slot cho executor
+    metrics.observe_stage("generate", time.perf_counter() - generate_start)
+    timings["total_ms"] = (time.perf_counter() - start) * 1000
+    yield _stream_event({"type": "done", "timings": timings}, format)
+
+
 @app.post("/chat")
-def chat_api(
+async def chat_api(
     question: str = Body(..., embed=True),
-    k: int = Body(3, embed=True)
+    k: int = Body(3, embed=True),
+    mode: Literal["vector", "hybrid"] = Body("vector", embed=True),
+    rerank: bool = Body(False, embed=True),
+    rerank_candidates: int = Body(RERANK_CANDIDATES, embed=True, ge=1, le=100),
+    rerank_timeout_ms: float = Body(RERANK_TIMEOUT_MS, embed=True, gt=0),
+    filters: Optional[dict] = Body(
+        None, embed=True,
+        example={"collection": "hugo_blogs_blogs", "tags": ["java"], "date_from": "2024-01-01"},
+    ),
+    generator: Optional[str] = Body(None, embed=True, description="Mặc định RAG_GENERATOR"),
+    context_tokens: int = Body(CONTEXT_TOKEN_BUDGET, embed=True, ge=1, description="Ngân sách token của context"),
+    stream: Optional[Literal["ndjson", "sse"]] = Body(None, embed=True),
 ):
     """
     Chat endpoint cho blog assistant.
@@ -109,61 +469,119 @@ def chat_api(
     Args:
         question: Câu hỏi của người dùng
         k: Số lượng chunks để retrieve (default: 3)
+        mode: "vector" hoặc "hybrid" (vector + BM25)
+        rerank: Re-rank kết quả bằng cross-encoder
+        rerank_candidates: Số candidate đưa vào cross-encoder
+        rerank_timeout_ms: Quá thời gian này thì giữ thứ tự vector search
+        filters: Lọc metadata (doc_id, source_file, collection, type, tags, date_from, date_to)
+        generator: Tên generator sinh câu trả lời ("extractive", "fake", ...)
+        context_tokens: Chunk được gộp / khử trùng lặp rồi cắt cho vừa số token này
+        stream: "ndjson" hoặc "sse" → trả về dạng stream các event
+            {"type": "sources", ...} → {"type": "token", "text"}* → {"type": "done", "timings"}
     
     Returns:
         {
             "question": str,
             "answer": str,
-            "sources": [{"title": str, "url": str, "excerpt": str}]
+            "sources": [{"title": str, "url": str, "excerpt": str}],
+            "context": {"input_chunks": int, "blocks": int, "tokens": int, ...},
+            "timings": {"retrieve_ms": float, "rerank_ms": float, ...}
         }
     """
+    where = _where_or_400(**(filters or {}))
+    try:
+        answer_generator = get_generator(generator)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     # Retrieve relevant chunks
-    docs = retrieve_chunks(vectordb, question, k=k)
-    
-    # Build context from retrieved chunks
-    context_parts = []
-    sources = []
-    
-    for i, doc in enumerate(docs, start=1):
-        # Add to context
-        context_parts.append(f"[Nguồn {i}]\n{doc.page_content}\n")
-        
-        # Build source info
-        metadata = doc.metadata
-        title = metadata.get('title', 'Untitled')
-        filename = metadata.get('filename', '')
-        
-        # Create URL (assuming blog structure)
-        # Ví dụ: java-socket-co-ban.md -> /blogs/java-socket-co-ban/
-        blog_slug = filename.replace('.md', '') if filename else ''
-        url = f"/blogs/{blog_slug}/" if blog_slug else "#"
-        
-        # Get excerpt (first 200 chars)
-        excerpt = doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
-        
-        sources.append({
-            "title": title,
-            "url": url,
-            "excerpt": excerpt,
-            "filename": filename
-        })
-    
-    # Combine context
-    full_context = "\n".join(context_parts)
-    
-    # Generate answer (simple concatenation for now)
-    # TODO: Integrate with LLM for better answers
-    answer = f"Dựa trên các bài viết trong blog, đây là những thông tin liên quan đến câu hỏi của bạn:\n\n{full_context}"
+    start = time.perf_counter()
+    timings = {}
+    docs = await run_query(
+        question,
+        lambda vector: index.run(
+            retrieve_chunks, question, k=k, vector=vector, mode=mode, filter=where,
+            rerank_results=rerank,
+            rerank_candidates=rerank_candidates,
+            rerank_timeout_ms=rerank_timeout_ms,
+            timings=timings,
+        ),
+    )
+
+    # Gộp chunk chồng lấn, bỏ đoạn trùng, cắt theo ngân sách token
+    context_start = time.perf_counter()
+    context = {}
+    with metrics.timer("context"):
+        docs = pack_context(docs, token_budget=context_tokens, stats=context)
+    timings["context_ms"] = (time.perf_counter() - context_start) * 1000
+    sources = [_source_info(doc) for doc in docs]
+
+    if stream:
+        # Gửi producer trước khi trả response: queue generation đầy → 503 thay vì stream lỗi
+        tokens = asyncio.Queue()
+        cancelled = threading.Event()
+        generation.submit(
+            _produce_tokens, answer_generator, question, docs,
+            asyncio.get_running_loop(), tokens, cancelled,
+        )
+        media_type = "text/event-stream" if stream == "sse" else "application/x-ndjson"
+        return StreamingResponse(
+            _stream_chat(question, sources, context, tokens, cancelled, timings, start, stream),
+            media_type=media_type,
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    # Generate answer (extractive mặc định; LLM qua register_generator)
+    generate_start = time.perf_counter()
+    def generate():
+        with metrics.timer("generate"):
+            return "".join(answer_generator.stream(question, docs))
+
+    answer = await generation.run(generate)
+    timings["generate_ms"] = (time.perf_counter() - generate_start) * 1000
     
     return {
         "question": question,
         "answer": answer,
         "sources": sources,
-        "total_sources": len(sources)
+        "total_sources": len(sources),
+        "context": context,
+        "timings": {**timings, "total_ms": (time.perf_counter() - start) * 1000},
     }
 
 
 @app.get("/health")
-def health_check():
-    """Health check endpoint."""
-    return {"status": "healthy", "message": "RAG Blog Assistant API is running"}
\ No newline at end of file
+async def health_check():
+    """Health check endpoint (không đi qua executor → luôn trả lời nhanh)."""
+    return {
+        "status": "healthy",
+        "message": "RAG Blog Assistant API is running",
+        "loaded_models": loaded_models(),
+        "index": index.stats(),
+        "inference": inference.stats(),
+        "generation": generation.stats(),
+        "batcher": batcher.stats() if batcher else None,
+        "blog_watcher": blog_watcher.stats() if blog_watcher else None,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_api():
+    """Metrics ở định dạng text của Prometheus (stage timings, request, cache, executor, index)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/index")
+async def index_status():
+    """Version index đang phục vụ, thời điểm / thời gian load, version mới nhất có sẵn."""
+    return index.stats()
+
+
+@app.post("/admin/reload", status_code=202, dependencies=[Depends(require_admin)])
+async def reload_index(force: bool = Query(False, description="Load lại kể cả khi version không đổi")):
+    """
+    Load version index mới (theo CURRENT) ở background rồi đổi sang nó.
+    Query đang chạy vẫn dùng version cũ tới khi xong.
+    """
+    started = index.reload_async(force=force)
+    return {"started": started, **index.stats()}
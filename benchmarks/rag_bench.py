@@ -0,0 +1,359 @@
+"""
+Benchmark end-to-end cho RAG API, chạy lặp lại được và không cần mạng:
+
+    1. Ingest: PDF trong data/ + N bài markdown tổng hợp → chunks/sec, thời
+       gian từng stage (load / split / embed + ghi)
+    2. Recall@k: câu hỏi có nhãn (mỗi bài tổng hợp có 1 "fact" riêng, PDF thì
+       lấy 1 câu trong chunk) → document đúng có nằm trong top-k không
+    3. Latency: gọi từng endpoint với nhiều request đồng thời → p50/p95/p99, QPS
+    4. Bộ nhớ: peak RSS sau mỗi phase
+    5. Thời gian theo stage (embed, search, vote, serialize, ...) từ src.metrics
+
+Model chỉ được load từ cache local (HF_HUB_OFFLINE=1). Kết quả ghi ra JSON
+để so sánh giữa các lần chạy:
+    python -m benchmarks.rag_bench --posts 200 --concurrency 8 --output bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ENDPOINTS = ("query_chunks", "query_documents", "query_both", "chat", "chat_stream", "graph", "list_documents")
+
+_TOPICS = [
+    "TCP handshake", "socket timeout", "consensus protocol", "leader election", "vector index",
+    "embedding model", "retrieval pipeline", "cache eviction", "thread pool", "message queue",
+    "load balancer", "packet loss", "Raft log", "Byzantine fault", "HTTP keep-alive",
+]
+_FILLER = (
+    "This section walks through {topic} with a small example. "
+    "We look at how {topic} behaves under load and which settings matter most. "
+    "A common mistake is to tune {topic} before measuring where time is spent. "
+    "The code below keeps {topic} simple so the trade-offs stay visible.\n\n"
+)
+_SYLLABLES = ["ka", "ri", "mo", "zu", "te", "lan", "vor", "qui", "sen", "dax", "pel", "nor"]
+_ATTRIBUTES = ["default port", "codename", "retry limit", "release year", "maintainer", "buffer size"]
+
+
+def _word(rng, syllables: int = 3) -> str:
+    return "".join(rng.choice(_SYLLABLES) for _ in range(syllables))
+
+
+def make_posts(blog_dir: str, n: int, paragraphs: int = 6, seed: int = 0):
+    """
+    Sinh n bài markdown (có frontmatter) vào blog_dir.
+    Mỗi bài có 1 câu fact duy nhất → trả về [(đường dẫn, câu hỏi về fact đó)].
+    """
+    rng = random.Random(seed)
+    os.makedirs(blog_dir, exist_ok=True)
+    labeled = []
+    for i in range(n):
+        topics = rng.sample(_TOPICS, 3)
+        entity = f"{_word(rng)} {_word(rng, 2)}"
+        attribute = rng.choice(_ATTRIBUTES)
+        value = _word(rng, 4)
+        body = [_FILLER.format(topic=rng.choice(topics)) for _ in range(paragraphs)]
+        body.insert(rng.randrange(len(body) + 1), f"The {attribute} of {entity} is {value}.\n\n")
+        path = os.path.join(blog_dir, f"post-{i:05d}.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(
+                "---\n"
+                f"title: \"{topics[0].title()} notes {i}\"\n"
+                f"date: 2024-{1 + i % 12:02d}-{1 + i % 28:02d}\n"
+                f"tags: [{', '.join(topics)}]\n"
+                "---\n\n"
+                + "".join(body)
+            )
+        labeled.append((path, f"What is the {attribute} of {entity}?"))
+    return labeled
+
+
+def peak_rss_mb():
+    """Peak RSS của process (MB), None nếu không đo được trên hệ điều hành này."""
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:  # Windows
+        try:
+            import psutil
+
+            return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+        except (ImportError, AttributeError):
+            return None
+
+
+def percentiles(values_ms) -> dict:
+    if not values_ms:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None}
+    values = np.asarray(values_ms)
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+    }
+
+
+def ingest_pdfs(pdf_paths, persist_dir: str) -> dict:
+    """Ingest từng PDF, đo riêng load / split / embed + ghi."""
+    from langchain_community.document_loaders import PyPDFLoader
+
+    from src.embedded_store import create_or_update_vector_db
+    from src.loader import get_semantic_splitter
+
+    stages = {"load_seconds": 0.0, "split_seconds": 0.0, "upsert_seconds": 0.0}
+    chunks_total = 0
+    for path in pdf_paths:
+        t0 = time.perf_counter()
+        pages = PyPDFLoader(path).load()
+        t1 = time.perf_counter()
+        chunks = get_semantic_splitter().split_documents(pages)
+        t2 = time.perf_counter()
+        create_or_update_vector_db(chunks, path, persist_dir=persist_dir)
+        t3 = time.perf_counter()
+        stages["load_seconds"] += t1 - t0
+        stages["split_seconds"] += t2 - t1
+        stages["upsert_seconds"] += t3 - t2
+        chunks_total += len(chunks)
+
+    total = sum(stages.values())
+    return {
+        "files": len(pdf_paths),
+        "chunks": chunks_total,
+        **{name: round(seconds, 3) for name, seconds in stages.items()},
+        "total_seconds": round(total, 3),
+        "chunks_per_sec": round(chunks_total / total, 1) if total else None,
+    }
+
+
+def ingest_posts(blog_dir: str, persist_dir: str) -> dict:
+    """Ingest blog tổng hợp qua sync_blog_dir; load / split đo thêm 1 lượt không ghi."""
+    from src.blog_sync import sync_blog_dir
+    from src.markdown_loader import HugoBlogLoader, split_markdown_documents
+
+    loader = HugoBlogLoader(blog_dir)
+    t0 = time.perf_counter()
+    documents = loader.load_files(loader.list_files())
+    t1 = time.perf_counter()
+    split_markdown_documents(documents)
+    t2 = time.perf_counter()
+
+    summary = sync_blog_dir(blog_dir, persist_dir=persist_dir)
+    return {
+        "files": len(documents),
+        "chunks": summary["chunks_written"],
+        "load_seconds": round(t1 - t0, 3),
+        "split_seconds": round(t2 - t1, 3),
+        "sync_seconds": round(summary["seconds"], 3),
+        "chunks_per_sec": round(summary["chunks_written"] / summary["seconds"], 1) if summary["seconds"] else None,
+    }
+
+
+def pdf_queries(vectordb, pdf_paths, per_file: int, seed: int = 0):
+    """Câu hỏi có nhãn cho PDF: 1 câu dài trong 1 chunk ngẫu nhiên của file đó."""
+    from src.embedded_store import generate_doc_id
+
+    rng = random.Random(seed)
+    labeled = []
+    for path in pdf_paths:
+        doc_id = generate_doc_id(path)
+        texts = vectordb._collection.get(where={"doc_id": doc_id}, include=["documents"])["documents"]
+        for text in rng.sample(texts, min(per_file, len(texts))):
+            sentences = [s.strip() for s in text.replace("\n", " ").split(". ") if len(s.split()) >= 8]
+            if sentences:
+                labeled.append((doc_id, max(sentences, key=len)))
+    return labeled
+
+
+def measure_recall(vectordb, labeled, k: int) -> dict:
+    """recall@k (document đúng nằm trong top-k chunk) và MRR, cho vector và hybrid."""
+    from src.retriever import retrieve_chunks
+
+    results = {"queries": len(labeled)}
+    for mode in ("vector", "hybrid"):
+        hits = 0
+        reciprocal = 0.0
+        for doc_id, query in labeled:
+            found = [doc.metadata.get("doc_id") for doc in retrieve_chunks(vectordb, query, k=k, mode=mode)]
+            if doc_id in found:
+                hits += 1
+                reciprocal += 1 / (found.index(doc_id) + 1)
+        results[mode] = {
+            f"recall@{k}": round(hits / len(labeled), 4) if labeled else None,
+            "mrr": round(reciprocal / len(labeled), 4) if labeled else None,
+        }
+    return results
+
+
+def _request(client, endpoint: str, query: str, k: int, topics):
+    """
+    Gọi 1 endpoint, trả về (latency ms, ttfb ms hoặc None, status).
+    ttfb lấy từ event done của server (test client gom cả body rồi mới trả về).
+    """
+    start = time.perf_counter()
+    ttfb = None
+    if endpoint == "query_chunks":
+        response = client.get("/query_chunks", params={"q": query, "k": k})
+    elif endpoint == "query_documents":
+        response = client.get("/query_documents", params={"q": query})
+    elif endpoint == "query_both":
+        response = client.get("/query_both", params={"q": query, "k_chunk": k})
+    elif endpoint == "chat":
+        response = client.post("/chat", json={"question": query, "k": k})
+    elif endpoint == "chat_stream":
+        with client.stream("POST", "/chat", json={"question": query, "k": k, "stream": "ndjson"}) as response:
+            for line in response.iter_lines():
+                event = json.loads(line) if line else {}
+                if event.get("type") == "done":
+                    ttfb = event["timings"]["ttfb_ms"]
+    elif endpoint == "graph":
+        response = client.post("/graph", params={"top_k": k}, json=topics)
+    else:
+        response = client.get("/list_documents", params={"limit": 50})
+    return (time.perf_counter() - start) * 1000, ttfb, response.status_code
+
+
+def measure_latency(client, endpoint: str, queries, requests: int, concurrency: int, k: int) -> dict:
+    rng = random.Random(endpoint)
+    jobs = [
+        (queries[i % len(queries)], rng.sample(queries, min(5, len(queries))))
+        for i in range(requests)
+    ]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(lambda job: _request(client, endpoint, job[0], k, job[1]), jobs))
+    wall = time.perf_counter() - start
+
+    ok = [latency for latency, _, status in results if status == 200]
+    row = {
+        "endpoint": endpoint,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": len(results) - len(ok),
+        "qps": round(len(results) / wall, 1),
+        **percentiles(ok),
+    }
+    ttfbs = [ttfb for _, ttfb, status in results if ttfb is not None and status == 200]
+    if ttfbs:
+        row["server_ttfb"] = percentiles(ttfbs)
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingest / latency / recall của RAG API.")
+    parser.add_argument("--pdf-dir", default="data", help="Thư mục PDF (bỏ qua nếu không có)")
+    parser.add_argument("--no-pdf", action="store_true", help="Chỉ dùng bài markdown tổng hợp")
+    parser.add_argument("--posts", type=int, default=100, help="Số bài markdown tổng hợp")
+    parser.add_argument("--pdf-queries", type=int, default=5, help="Số câu hỏi có nhãn mỗi PDF")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=200, help="Số request mỗi endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--endpoints", nargs="*", default=list(ENDPOINTS), choices=ENDPOINTS)
+    parser.add_argument("--backend", default=None, help="chroma / numpy / faiss (mặc định RAG_VECTOR_BACKEND)")
+    parser.add_argument("--result-cache", action="store_true", help="Bật cache kết quả search khi đo latency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="Giữ lại thư mục tạm (vectorstore, blog)")
+    parser.add_argument("--output", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="rag_bench_")
+    persist_dir = os.path.join(workdir, "vectorstore")
+    blog_dir = os.path.join(workdir, "blogs")
+
+    # Phải đặt trước khi import src / api (các module đọc env lúc import)
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    os.environ.setdefault("RAG_EMBEDDING_CACHE", os.path.join(workdir, "embeddings.sqlite3"))
+    os.environ["RAG_PERSIST_DIR"] = persist_dir
+    os.environ["RAG_RESULT_CACHE"] = "1" if args.result_cache else "0"
+    if args.backend:
+        os.environ["RAG_VECTOR_BACKEND"] = args.backend
+
+    report = {"config": vars(args), "environment": {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "backend": os.getenv("RAG_VECTOR_BACKEND", "chroma"),
+    }}
+    try:
+        from src.blog_sync import collection_name_for, post_doc_id
+        from src.embedded_store import load_vector_db
+
+        pdf_paths = []
+        if not args.no_pdf and os.path.isdir(args.pdf_dir):
+            pdf_paths = sorted(
+                os.path.join(args.pdf_dir, name)
+                for name in os.listdir(args.pdf_dir) if name.lower().endswith(".pdf")
+            )
+
+        print(f"⏳ Ingesting {len(pdf_paths)} PDFs + {args.posts} synthetic posts into {persist_dir}")
+        posts = make_posts(blog_dir, args.posts, seed=args.seed)
+        report["ingest"] = {
+            "pdf": ingest_pdfs(pdf_paths, persist_dir) if pdf_paths else None,
+            "markdown": ingest_posts(blog_dir, persist_dir),
+        }
+        report["memory"] = {"after_ingest_peak_rss_mb": peak_rss_mb()}
+
+        vectordb = load_vector_db(persist_dir)
+        collection = collection_name_for(blog_dir)
+        labeled = [(post_doc_id(collection, path), question) for path, question in posts]
+        labeled += pdf_queries(vectordb, pdf_paths, args.pdf_queries, seed=args.seed)
+        print(f"⏳ Measuring recall@{args.k} on {len(labeled)} labeled queries")
+        report["recall"] = measure_recall(vectordb, labeled, args.k)
+        report["memory"]["after_recall_peak_rss_mb"] = peak_rss_mb()
+
+        from fastapi.testclient import TestClient
+
+        from api.app import app
+
+        queries = [question for _, question in labeled]
+        report["latency"] = []
+        with TestClient(app) as client:
+            for endpoint in args.endpoints:
+                print(f"⏳ {endpoint}: {args.requests} requests, concurrency {args.concurrency}")
+                report["latency"].append(
+                    measure_latency(client, endpoint, queries, args.requests, args.concurrency, args.k)
+                )
+        report["memory"]["after_latency_peak_rss_mb"] = peak_rss_mb()
+
+        from src.metrics import stage_summary
+
+        # Thời gian theo stage (ingest + mọi request ở trên) từ src.metrics
+        report["stages"] = stage_summary()
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print("\n📊 Ingest:")
+    for name, stats in report["ingest"].items():
+        if stats:
+            print(f"   - {name}: " + ", ".join(f"{key}={value}" for key, value in stats.items()))
+    print("📊 Recall:", json.dumps(report["recall"]))
+    print("📊 Latency:")
+    for row in report["latency"]:
+        print("   " + ", ".join(f"{key}={value}" for key, value in row.items()))
+    print("📊 Stages:")
+    for stage, stats in report["stages"].items():
+        print(f"   - {stage}: " + ", ".join(f"{key}={value}" for key, value in stats.items()))
+    print("📊 Memory:", json.dumps(report["memory"]))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Wrote {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
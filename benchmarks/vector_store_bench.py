@@ -0,0 +1,140 @@
+"""
+So sánh các backend vectorstore (Chroma HNSW, NumPy exact search, FAISS
+flat / HNSW / IVF-PQ) trên cùng 1 tập vector tổng hợp: thời gian build,
+latency 1 query (p50/p95), QPS (từng query và theo batch), số byte index
+mỗi vector và recall@k so với kết quả chính xác.
+
+Chạy offline, không cần model embedding:
+    python -m benchmarks.vector_store_bench --n 5000 --queries 200 --k 10
+"""
+
+import argparse
+import json
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from src.embedded_store import _normalize, load_vector_db
+
+BACKENDS = {
+    "chroma": {"backend": "chroma"},
+    "numpy-f32": {"backend": "numpy", "dtype": "float32"},
+    "numpy-f16": {"backend": "numpy", "dtype": "float16"},
+    "numpy-int8": {"backend": "numpy", "dtype": "int8"},
+    "numpy-int8-norescore": {"backend": "numpy", "dtype": "int8", "rescore": 0},
+    "faiss-flat": {"backend": "faiss", "index_type": "flat"},
+    "faiss-hnsw": {"backend": "faiss", "index_type": "hnsw"},
+    "faiss-ivfpq": {"backend": "faiss", "index_type": "ivfpq", "nlist": 64, "nprobe": 8, "train_size": 4096},
+}
+
+
+def make_corpus(n: int, dim: int, clusters: int = 50, seed: int = 0):
+    """Vector có cụm (giống embedding thật hơn vector ngẫu nhiên đều)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    labels = rng.integers(0, clusters, size=n)
+    vectors = centers[labels] + 0.6 * rng.normal(size=(n, dim))
+    return _normalize(vectors)
+
+
+def make_queries(corpus, n: int, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    picks = corpus[rng.integers(0, len(corpus), size=n)]
+    return _normalize(picks + 0.3 * rng.normal(size=picks.shape) / np.sqrt(picks.shape[1]))
+
+
+def exact_top_k(corpus, queries, k: int):
+    scores = queries @ corpus.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def build(vectordb, corpus, batch_size: int = 1000):
+    start = time.perf_counter()
+    for i in range(0, len(corpus), batch_size):
+        ids = [str(j) for j in range(i, min(i + batch_size, len(corpus)))]
+        vectordb._collection.upsert(
+            ids=ids,
+            embeddings=corpus[i:i + batch_size],
+            metadatas=[{"n": int(j)} for j in ids],
+            documents=[f"chunk {j}" for j in ids],
+        )
+    return time.perf_counter() - start
+
+
+def recall_at_k(found, truth) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def bench_backend(name, options, corpus, queries, truth, k: int, batch: int):
+    persist_dir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    try:
+        vectordb = load_vector_db(persist_dir, **options)
+        build_seconds = build(vectordb, corpus)
+        collection = vectordb._collection
+
+        latencies = []
+        found = []
+        for q in queries:
+            t0 = time.perf_counter()
+            result = collection.query(query_embeddings=[q], n_results=k, include=[])
+            latencies.append((time.perf_counter() - t0) * 1000)
+            found.append([int(i) for i in result["ids"][0]])
+
+        t0 = time.perf_counter()
+        for i in range(0, len(queries), batch):
+            collection.query(query_embeddings=queries[i:i + batch], n_results=k, include=[])
+        batch_seconds = time.perf_counter() - t0
+
+        memory = getattr(vectordb, "memory_bytes", None)
+        return {
+            "backend": name,
+            "build_seconds": round(build_seconds, 3),
+            "bytes_per_vector": round(memory() / len(corpus), 1) if memory else None,
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+            "qps_single": round(len(queries) / (sum(latencies) / 1000), 1),
+            "qps_batched": round(len(queries) / batch_seconds, 1),
+            f"recall@{k}": round(recall_at_k(found, truth), 4),
+        }
+    finally:
+        shutil.rmtree(persist_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark các backend vectorstore.")
+    parser.add_argument("--n", type=int, default=5000, help="Số vector trong corpus")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=32, help="Số query mỗi batch")
+    parser.add_argument("--backends", nargs="*", default=list(BACKENDS))
+    parser.add_argument("--output", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args(argv)
+
+    corpus = make_corpus(args.n, args.dim)
+    queries = make_queries(corpus, args.queries)
+    truth = exact_top_k(corpus, queries, args.k)
+
+    results = []
+    for name in args.backends:
+        print(f"⏳ Benchmarking {name}...")
+        results.append(
+            bench_backend(name, BACKENDS[name], corpus, queries, truth, args.k, args.batch)
+        )
+
+    print(f"\n📊 n={args.n}, dim={args.dim}, queries={args.queries}, k={args.k}")
+    for row in results:
+        print("   " + ", ".join(f"{key}={value}" for key, value in row.items()))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"✅ Wrote {args.output}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,73 @@
 """
 Script để embedding toàn bộ blog posts vào RAG system.
 Chạy script này để tạo vector database từ các blog posts.
+
+Chỉ các post được thêm / sửa / xoá kể từ lần chạy trước mới được embed lại
+(dựa trên manifest trong thư mục vectorstore). Dùng --full để embed lại hết.
 """
 
+import argparse
 import os
 import sys
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.markdown_loader import load_and_split_markdown
-from src.embedded_store import create_or_update_vector_db_from_collection, load_vector_db
+from src.blog_sync import print_sync_summary, sync_blog_dir
+from src.embedded_store import (
+    EMBED_BATCH_SIZE,
+    WRITE_BATCH_SIZE,
+    load_vector_db,
+)
+from src.snapshots import new_snapshot, resolve_persist_dir
 
 # Đường dẫn đến thư mục blogs
 BLOG_DIR = "c:/Code/DA_NetworkingPrograming/NetworkingPrograming/content/blogs"
 
 
-def embed_all_blogs(blog_dir: str, persist_dir: str = "vectorstore"):
+def embed_all_blogs(
+    blog_dir: str,
+    persist_dir: str = "vectorstore",
+    embed_batch_size: int = EMBED_BATCH_SIZE,
+    write_batch_size: int = WRITE_BATCH_SIZE,
+    full: bool = False,
+):
     """
-    Embedding toàn bộ blog posts vào vector database.
+    Embedding blog posts vào vector database (tăng dần theo manifest).
     
     Args:
         blog_dir: Đường dẫn đến thư mục chứa các file markdown
         persist_dir: Thư mục lưu vector database
+        embed_batch_size: Số chunk mỗi lần gọi model embedding
+        write_batch_size: Số chunk mỗi lần ghi xuống Chroma
+        full: True → embed lại toàn bộ post, bỏ qua manifest
     """
     print("🚀 Starting blog embedding process...")
     print(f"📂 Blog directory: {blog_dir}")
     print(f"💾 Vector store directory: {persist_dir}")
     print("-" * 60)
     
-    # 1. Load và split blogs thành chunks
-    print("\n📖 Loading and splitting blog posts...")
-    chunks = load_and_split_markdown(blog_dir, chunk_size=1000, chunk_overlap=200)
-    
-    if not chunks:
-        print("❌ No blog posts found!")
-        return
-    
-    # 2. Add doc_id cho toàn bộ blog collection
-    collection_name = f"hugo_blogs_{os.path.basename(blog_dir)}"
-    print(f"\n🔖 Collection name: {collection_name}")
-    
-    # 3. Create/Update vector database
-    print(f"\n💿 Creating/updating vector database...")
-    print(f"   Total chunks to embed: {len(chunks)}")
-    
-    # Sử dụng hàm mới cho collection
-    vectordb = create_or_update_vector_db_from_collection(
-        chunks, 
-        collection_name=collection_name,
-        persist_dir=persist_dir
+    # 1. So sánh với manifest → chỉ chunk + embed các post thay đổi
+    print("\n📖 Detecting changed blog posts...")
+    vectordb = load_vector_db(persist_dir)
+    summary = sync_blog_dir(
+        blog_dir,
+        persist_dir=persist_dir,
+        vectordb=vectordb,
+        full=full,
+        chunk_size=1000,
+        chunk_overlap=200,
+        embed_batch_size=embed_batch_size,
+        write_batch_size=write_batch_size,
     )
     
     print("\n" + "=" * 60)
     print("✅ Blog embedding completed successfully!")
     print("=" * 60)
-    print(f"\n📊 Summary:")
-    print(f"   - Total blog posts processed: {len(set(c.metadata.get('filename') for c in chunks))}")
-    print(f"   - Total chunks created: {len(chunks)}")
-    print(f"   - Collection: {collection_name}")
+    print_sync_summary(summary)
     print(f"   - Vector store location: {persist_dir}")
     
-    # 4. Test retrieval
+    # 2. Test retrieval
     print("\n🧪 Testing retrieval...")
     test_query = "TCP socket"
     results = vectordb.similarity_search(test_query, k=3)
@@ -75,10 +81,28 @@ def embed_all_blogs(blog_dir: str, persist_dir: str = "vectorstore"):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed Hugo blog posts vào vectorstore.")
+    parser.add_argument("--blog-dir", default=BLOG_DIR)
+    parser.add_argument("--persist-dir", default="vectorstore")
+    parser.add_argument("--full", action="store_true", help="Embed lại toàn bộ post")
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="Ghi vào version mới rồi mới đổi CURRENT (API đang chạy không thấy bản ghi dở)",
+    )
+    args = parser.parse_args()
+
     # Chạy embedding process
-    vectordb = embed_all_blogs(BLOG_DIR)
+    if args.snapshot:
+        with new_snapshot(args.persist_dir) as persist_dir:
+            vectordb = embed_all_blogs(args.blog_dir, persist_dir=persist_dir, full=args.full)
+    else:
+        vectordb = embed_all_blogs(
+            args.blog_dir, persist_dir=resolve_persist_dir(args.persist_dir), full=args.full
+        )
     
     print("\n💡 Next steps:")
     print("   1. Start the API server: uvicorn api.app:app --reload --port 8000")
+    print("      (already running with --snapshot? POST /admin/reload)")
     print("   2. Test queries using /query_chunks or /query_both endpoints")
     print("   3. Update chat-widget.js with the correct API endpoint")
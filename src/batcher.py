@@ -0,0 +1,154 @@
+"""
+Micro-batching cho embedding câu truy vấn trong API.
+
+Các request đến trong cùng 1 cửa sổ vài ms (hoặc đủ `max_batch` request)
+được gom lại: embed tất cả bằng 1 lần gọi model, sau đó search của từng
+request chạy song song trên executor và trả kết quả về đúng request đang
+chờ. Mỗi query vẫn chiếm 1 chỗ trong giới hạn của executor
+(RAG_INFERENCE_QUEUE), và chính chỗ đó chạy search của query.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import Counter
+
+from src.metrics import add_request_timing, histogram
+
+BATCH_WINDOW_MS = float(os.getenv("RAG_BATCH_WINDOW_MS", "5"))
+BATCH_MAX_SIZE = int(os.getenv("RAG_BATCH_MAX_SIZE", "16"))
+
+BATCH_SIZE = histogram(
+    "rag_batcher_batch_size", "Số query mỗi batch embedding", buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+
+
+class QueryBatcher:
+    """Gom các query đồng thời thành 1 batch embedding chạy trên executor."""
+
+    def __init__(self, executor, embed_fn, window_ms: float = BATCH_WINDOW_MS, max_batch: int = BATCH_MAX_SIZE):
+        """
+        Args:
+            executor: InferenceExecutor chạy batch
+            embed_fn: Hàm list[str] → list[vector]
+            window_ms: Thời gian chờ gom batch (tính từ query đầu tiên)
+            max_batch: Số query tối đa mỗi batch (đủ thì chạy ngay)
+        """
+        self.executor = executor
+        self.embed_fn = embed_fn
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batch_sizes = Counter()
+        self._pending = []
+        self._timer = None
+        self._lock = threading.Lock()
+
+    async def submit(self, query: str, search):
+        """
+        Đưa 1 query vào batch và chờ kết quả.
+
+        Args:
+            query: Câu truy vấn
+            search: Hàm vector → kết quả, chạy trên thread của executor
+        """
+        # Mỗi query giữ 1 chỗ trên executor ngay khi vào batch → queue đầy thì
+        # 503 cho đúng query đó, và 1 batch không vượt quá số chỗ được cấp
+        self.executor.reserve()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # search chạy trong context của request này (timing / metrics đúng request)
+        self._pending.append((query, search, future, contextvars.copy_context()))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush(loop)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush, loop)
+        return await future
+
+    def _flush(self, loop):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        with self._lock:
+            self.batch_sizes[len(batch)] += 1
+        BATCH_SIZE.observe(len(batch))
+        try:
+            # Embed dùng chung các chỗ đã giữ của batch (slots=0, không giữ thêm).
+            # Context rỗng: phần embed chung không tính riêng cho request nào
+            job = contextvars.Context().run(self.executor.submit_reserved, 0, self._embed, batch)
+        except Exception as e:  # executor đã shutdown
+            self.executor.release(len(batch))
+            for _, _, future, _ in batch:
+                self._deliver(future, None, e)
+            return
+        job.add_done_callback(lambda done: self._fan_out(loop, batch, done))
+
+    def _embed(self, batch):
+        """Chạy trên thread executor: 1 lần embed cho cả batch."""
+        start = time.perf_counter()
+        vectors = self.embed_fn([query for query, _, _, _ in batch])
+        return vectors, time.perf_counter() - start
+
+    def _fan_out(self, loop, batch, job):
+        """Embed xong: mỗi query dùng chỗ đã giữ của nó để search song song trên executor."""
+        try:
+            vectors, elapsed = job.result()
+        except Exception as e:  # embed lỗi hoặc executor shutdown huỷ job
+            self.executor.release(len(batch))
+            for _, _, future, _ in batch:
+                loop.call_soon_threadsafe(self._deliver, future, None, e)
+            return
+
+        for (_, search, future, context), vector in zip(batch, vectors):
+            try:
+                # search chạy trong context của request (timing / metrics đúng request)
+                search_job = self.executor.submit_reserved(
+                    1, context.run, self._search, search, vector, elapsed
+                )
+            except Exception as e:  # executor đã shutdown (chỗ đã được trả)
+                loop.call_soon_threadsafe(self._deliver, future, None, e)
+                continue
+            search_job.add_done_callback(
+                lambda done, future=future: self._resolve(loop, future, done)
+            )
+
+    @staticmethod
+    def _search(search, vector, embed_seconds):
+        add_request_timing("embed", embed_seconds)
+        return search(vector)
+
+    def _resolve(self, loop, future, job):
+        try:
+            result, error = job.result(), None
+        except Exception as e:
+            result, error = None, e
+        loop.call_soon_threadsafe(self._deliver, future, result, error)
+
+    @staticmethod
+    def _deliver(future, result, error):
+        if future.done():  # request đã bị huỷ
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def stats(self) -> dict:
+        with self._lock:
+            sizes = dict(sorted(self.batch_sizes.items()))
+        batches = sum(sizes.values())
+        queries = sum(size * n for size, n in sizes.items())
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "batches": batches,
+            "queries": queries,
+            "mean_batch_size": queries / batches if batches else 0.0,
+            "batch_size_distribution": sizes,
+        }
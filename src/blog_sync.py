@@ -0,0 +1,147 @@
+"""
+Đồng bộ tăng dần thư mục Hugo blog vào vectorstore.
+Chỉ những post được thêm / sửa / xoá kể từ lần chạy trước mới được
+chunk + embed lại, dựa trên manifest dấu vân tay file.
+"""
+
+import hashlib
+import os
+import time
+
+from src.embedded_store import (
+    EMBED_BATCH_SIZE,
+    WRITE_BATCH_SIZE,
+    deferred_writes,
+    delete_document,
+    load_vector_db,
+    upsert_document_chunks,
+)
+from src.manifest import FileManifest
+from src.markdown_loader import HugoBlogLoader, split_markdown_documents
+from src.sparse_index import refresh_sparse_index
+
+
+def collection_name_for(blog_dir: str) -> str:
+    return f"hugo_blogs_{os.path.basename(os.path.normpath(blog_dir))}"
+
+
+def post_doc_id(collection_name: str, filepath: str) -> str:
+    """doc_id của 1 blog post: cố định theo collection + tên file."""
+    return hashlib.md5(f"{collection_name}/{os.path.basename(filepath)}".encode()).hexdigest()
+
+
+def manifest_path_for(persist_dir: str, collection_name: str) -> str:
+    return os.path.join(persist_dir, f"manifest_{collection_name}.json")
+
+
+def has_pending_changes(blog_dir: str, persist_dir: str) -> bool:
+    """True nếu blog_dir khác manifest trong persist_dir (chưa có manifest cũng tính). Không ghi gì."""
+    manifest = FileManifest(manifest_path_for(persist_dir, collection_name_for(blog_dir)))
+    if not manifest.exists:
+        return True
+    return manifest.scan(HugoBlogLoader(blog_dir).list_files()).changed
+
+
+def sync_blog_dir(
+    blog_dir: str,
+    persist_dir: str = "vectorstore",
+    vectordb=None,
+    full: bool = False,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    embed_batch_size: int = EMBED_BATCH_SIZE,
+    write_batch_size: int = WRITE_BATCH_SIZE,
+):
+    """
+    Đồng bộ blog_dir vào vectorstore, mỗi post là 1 doc_id riêng.
+
+    Args:
+        blog_dir: Thư mục chứa các file markdown
+        persist_dir: Thư mục lưu vector database (và manifest)
+        vectordb: Vectorstore đã mở sẵn (None → mở từ persist_dir)
+        full: True → upsert lại mọi post còn trên đĩa (post đã xoá vẫn bị gỡ)
+
+    Returns:
+        dict tóm tắt: added / modified / deleted / unchanged / skipped, số chunk, thời gian
+    """
+    start = time.perf_counter()
+    if vectordb is None:
+        vectordb = load_vector_db(persist_dir)
+    collection_name = collection_name_for(blog_dir)
+    manifest = FileManifest(manifest_path_for(persist_dir, collection_name))
+    loader = HugoBlogLoader(blog_dir)
+
+    if not manifest.exists:
+        # Lần đầu chạy bản tăng dần: xoá chunk kiểu cũ (1 doc_id cho cả collection)
+        legacy_doc_id = hashlib.md5(collection_name.encode()).hexdigest()
+        removed = delete_document(legacy_doc_id, vectordb=vectordb)
+        if removed:
+            print(f"🗑️  Removed {removed} legacy collection-level chunks")
+
+    diff = manifest.scan(loader.list_files())
+    if full:
+        # Vẫn so với manifest để biết post nào đã bị xoá; post còn lại coi như đã sửa
+        diff.modified += diff.unchanged
+        diff.unchanged = []
+
+    chunks_written = 0
+    chunks_deleted = 0
+    skipped = []
+    # Ghi hoãn: numpy / faiss chỉ lưu ma trận 1 lần ở cuối lần sync
+    with deferred_writes(vectordb):
+        for filepath in diff.added + diff.modified:
+            doc_id = post_doc_id(collection_name, filepath)
+            documents = loader.load_files([filepath])
+            chunks = split_markdown_documents(documents, chunk_size, chunk_overlap) if documents else []
+            if not chunks:
+                # Đọc lỗi / không có nội dung: giữ chunk cũ và manifest cũ → lần sau thử lại
+                print(f"⚠️  Skipped {filepath}: no content loaded, will retry on next sync")
+                skipped.append(filepath)
+                continue
+            _, added, deleted = upsert_document_chunks(
+                chunks,
+                doc_id,
+                {"collection": collection_name, "source_file": filepath},
+                vectordb=vectordb,
+                embed_batch_size=embed_batch_size,
+                write_batch_size=write_batch_size,
+            )
+            chunks_written += added
+            chunks_deleted += deleted
+            manifest.update(filepath, doc_id)
+
+        for filepath in diff.deleted:
+            entry = manifest.remove(filepath)
+            doc_id = (entry or {}).get("doc_id") or post_doc_id(collection_name, filepath)
+            chunks_deleted += delete_document(doc_id, vectordb=vectordb)
+
+    manifest.save()
+    if chunks_written or chunks_deleted:
+        # BM25 build ở đây (lúc ingest) thay vì ở query hybrid đầu tiên
+        refresh_sparse_index(vectordb)
+    elapsed = time.perf_counter() - start
+    return {
+        "collection": collection_name,
+        "added": diff.added,
+        "modified": diff.modified,
+        "deleted": diff.deleted,
+        "unchanged": len(diff.unchanged),
+        "skipped": skipped,
+        "chunks_written": chunks_written,
+        "chunks_deleted": chunks_deleted,
+        "seconds": elapsed,
+    }
+
+
+def print_sync_summary(summary: dict):
+    print(f"\n📊 Sync summary ({summary['collection']}):")
+    print(f"   - Added:     {len(summary['added'])}")
+    print(f"   - Modified:  {len(summary['modified'])}")
+    print(f"   - Deleted:   {len(summary['deleted'])}")
+    print(f"   - Unchanged: {summary['unchanged']}")
+    print(f"   - Skipped:   {len(summary['skipped'])}")
+    print(f"   - Chunks written / deleted: {summary['chunks_written']} / {summary['chunks_deleted']}")
+    print(f"   - Time: {summary['seconds']:.2f}s")
+    for label, key in (("+", "added"), ("~", "modified"), ("-", "deleted"), ("!", "skipped")):
+        for path in summary[key]:
+            print(f"      {label} {os.path.basename(path)}")
@@ -0,0 +1,206 @@
+"""
+Theo dõi thư mục Hugo blog và tự đồng bộ vào vectorstore khi có thay đổi.
+
+Dùng polling (os.stat, chạy được trên mọi OS) với debounce: một loạt chỉnh
+sửa liên tiếp chỉ kích hoạt 1 lần sync tăng dần (blog_sync.sync_blog_dir)
+sau khi thư mục "yên" trong `debounce` giây.
+
+Chạy riêng:
+    python -m src.blog_watcher --blog-dir content/blogs
+hoặc trong API: đặt RAG_WATCH_BLOG_DIR, watcher chạy ở thread nền và dùng
+chung vectordb với API.
+
+Thư mục dùng snapshot (CURRENT + versions/): watcher không ghi vào version
+đang phục vụ mà ghi vào 1 snapshot mới (new_snapshot), publish rồi gọi
+`on_publish` (trong API: index.reload).
+"""
+
+import argparse
+import os
+import threading
+import time
+
+from src.blog_sync import has_pending_changes, print_sync_summary, sync_blog_dir
+from src.markdown_loader import HugoBlogLoader
+from src.snapshots import current_version, new_snapshot, resolve_persist_dir
+
+
+class BlogWatcher:
+    """Polling thư mục blog, gom các thay đổi liên tiếp rồi sync 1 lần."""
+
+    def __init__(
+        self,
+        blog_dir: str,
+        persist_dir: str = "vectorstore",
+        vectordb=None,
+        poll_interval: float = 1.0,
+        debounce: float = 2.0,
+        snapshot_root: str = None,
+        on_publish=None,
+    ):
+        """
+        Args:
+            blog_dir: Thư mục chứa các file markdown
+            persist_dir: Thư mục lưu vector database
+            vectordb: Vectorstore dùng chung (vd: của API), None → tự mở
+            poll_interval: Số giây giữa 2 lần quét thư mục
+            debounce: Số giây thư mục phải không đổi trước khi sync
+            snapshot_root: Thư mục gốc có CURRENT + versions/ → mỗi lần sync
+                ghi vào 1 snapshot mới (bỏ qua persist_dir / vectordb)
+            on_publish: Hàm gọi sau khi publish snapshot (vd: index.reload)
+        """
+        self.blog_dir = blog_dir
+        self.persist_dir = persist_dir
+        self.vectordb = vectordb
+        self.snapshot_root = snapshot_root
+        self.on_publish = on_publish
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.loader = HugoBlogLoader(blog_dir)
+
+        self.syncs = 0
+        self.last_lag = None
+        self.max_lag = 0.0
+        self.last_summary = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def snapshot(self) -> dict:
+        """{path: (mtime_ns, size)} của các file markdown hiện có."""
+        state = {}
+        for path in self.loader.list_files():
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:  # file bị xoá giữa chừng
+                continue
+            state[path] = (st.st_mtime_ns, st.st_size)
+        return state
+
+    def use_vectordb(self, vectordb):
+        """Đổi sang vectordb khác (vd: API vừa hot reload sang snapshot mới)."""
+        self.vectordb = vectordb
+        self.persist_dir = vectordb._persist_directory
+
+    def sync(self, changed_since: float = None):
+        """
+        Sync tăng dần và đo độ trễ từ lúc file đổi tới lúc index cập nhật.
+        None nếu dùng snapshot và không có gì đổi (không tạo version mới).
+        """
+        if self.snapshot_root is None:
+            summary = sync_blog_dir(self.blog_dir, self.persist_dir, vectordb=self.vectordb)
+        else:
+            summary = self._sync_snapshot()
+            if summary is None:
+                return None
+        self.syncs += 1
+        self.last_summary = summary
+        if changed_since is not None:
+            self.last_lag = time.time() - changed_since
+            self.max_lag = max(self.max_lag, self.last_lag)
+        return summary
+
+    def _sync_snapshot(self):
+        """Ghi vào version mới rồi publish, không bao giờ ghi vào version đang phục vụ."""
+        if not has_pending_changes(self.blog_dir, resolve_persist_dir(self.snapshot_root)):
+            return None
+        with new_snapshot(self.snapshot_root) as persist_dir:
+            summary = sync_blog_dir(self.blog_dir, persist_dir)
+        if self.on_publish is not None:
+            self.on_publish()
+        return summary
+
+    def run(self):
+        """Vòng lặp chính, chạy tới khi stop() được gọi."""
+        print(f"👀 Watching {self.blog_dir} (poll {self.poll_interval}s, debounce {self.debounce}s)")
+        # Lần đầu: bắt kịp các thay đổi xảy ra khi watcher chưa chạy
+        self._sync_logged()
+
+        last_state = self.snapshot()
+        first_change = None   # thời điểm (wall clock) thay đổi sớm nhất chưa sync
+        last_change = None    # thời điểm (monotonic) phát hiện thay đổi gần nhất
+        while not self._stop.wait(self.poll_interval):
+            state = self.snapshot()
+            if state != last_state:
+                if first_change is None:
+                    first_change = self._earliest_change(last_state, state)
+                last_change = time.monotonic()
+                last_state = state
+                continue
+
+            if last_change is not None and time.monotonic() - last_change >= self.debounce:
+                if self._sync_logged(changed_since=first_change):
+                    print(f"   - Freshness lag: {self.last_lag:.2f}s")
+                first_change = None
+                last_change = None
+
+    def _sync_logged(self, changed_since: float = None) -> bool:
+        """sync() + in tóm tắt; lỗi chỉ được ghi lại để thread watcher không chết."""
+        try:
+            summary = self.sync(changed_since=changed_since)
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"⚠️ Blog sync failed: {e}")
+            return False
+        self.last_error = None
+        if summary is None:
+            return False
+        print_sync_summary(summary)
+        return True
+
+    @staticmethod
+    def _earliest_change(old: dict, new: dict) -> float:
+        """Thời điểm sớm nhất có file đổi (mtime), hoặc bây giờ nếu chỉ có file bị xoá."""
+        times = [
+            mtime_ns / 1e9
+            for path, (mtime_ns, size) in new.items()
+            if old.get(path) != (mtime_ns, size)
+        ]
+        return min(times) if times else time.time()
+
+    def start(self) -> threading.Thread:
+        """Chạy watcher ở thread nền (daemon)."""
+        self._thread = threading.Thread(target=self.run, name="blog-watcher", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "blog_dir": self.blog_dir,
+            "syncs": self.syncs,
+            "last_freshness_lag_seconds": self.last_lag,
+            "max_freshness_lag_seconds": self.max_lag,
+            "last_error": self.last_error,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Theo dõi thư mục blog và sync vào vectorstore.")
+    parser.add_argument("--blog-dir", required=True)
+    parser.add_argument("--persist-dir", default="vectorstore")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--debounce", type=float, default=2.0)
+    args = parser.parse_args(argv)
+
+    # Thư mục dùng snapshot: publish version mới, API load qua /admin/reload hoặc SIGHUP
+    snapshot_root = args.persist_dir if current_version(args.persist_dir) else None
+    watcher = BlogWatcher(
+        args.blog_dir,
+        persist_dir=resolve_persist_dir(args.persist_dir),
+        poll_interval=args.poll_interval,
+        debounce=args.debounce,
+        snapshot_root=snapshot_root,
+    )
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print("\n👋 Watcher stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Catalog tài liệu (SQLite) nằm cạnh vectorstore: `<persist_dir>/catalog.sqlite3`.
+
+Mỗi doc_id 1 dòng (source, title, collection, type, số chunk, số byte, thời
+điểm ingest), cập nhật mỗi lần upsert / xoá chunk. /list_documents đọc từ
+đây nên không phải kéo metadata của mọi chunk trong collection.
+
+Nằm trong persist_dir nên đi theo snapshot. Vectorstore cũ chưa có catalog
+được build lại 1 lần từ metadata của các chunk ở lần mở đầu tiên.
+"""
+
+import base64
+import os
+import sqlite3
+import threading
+import time
+
+CATALOG_FILE = "catalog.sqlite3"
+REBUILD_PAGE_SIZE = 5000
+MAX_PAGE_SIZE = 500
+
+_COLUMNS = ("doc_id", "source_file", "title", "collection", "type", "chunks", "bytes", "ingested_at")
+
+
+def encode_cursor(doc_id: str) -> str:
+    return base64.urlsafe_b64encode(doc_id.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        doc_id = base64.b64decode(cursor.encode("ascii"), altchars=b"-_", validate=True).decode("utf-8")
+    except (ValueError, UnicodeError):
+        doc_id = None
+    if not doc_id:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return doc_id
+
+
+class DocumentCatalog:
+    """Bảng SQLite doc_id → thông tin tài liệu."""
+
+    def __init__(self, persist_dir: str):
+        """
+        Args:
+            persist_dir: Thư mục vectorstore (catalog nằm trong đó)
+        """
+        self.path = os.path.join(persist_dir, CATALOG_FILE)
+        self._lock = threading.Lock()
+
+        os.makedirs(persist_dir, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id TEXT PRIMARY KEY,
+                source_file TEXT,
+                title TEXT,
+                collection TEXT,
+                type TEXT,
+                chunks INTEGER NOT NULL,
+                bytes INTEGER NOT NULL,
+                ingested_at REAL NOT NULL
+            )
+            """
+        )
+        for column in ("source_file", "collection", "type"):
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS documents_{column} ON documents ({column}, doc_id)"
+            )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+    @property
+    def needs_rebuild(self) -> bool:
+        """True nếu catalog chưa từng được build (file mới tạo hoặc build dở)."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM info WHERE key = 'built'").fetchone()
+        return row is None
+
+    def record(self, doc_id, metadata: dict, chunks: int, size: int, changed: bool = True):
+        """
+        Ghi / cập nhật 1 tài liệu sau khi upsert chunk của nó.
+        changed=False (không chunk nào đổi) → giữ nguyên ingested_at cũ.
+        """
+        metadata = metadata or {}
+        row = (
+            doc_id,
+            metadata.get("source_file") or metadata.get("source"),
+            metadata.get("title"),
+            metadata.get("collection"),
+            metadata.get("type"),
+            chunks,
+            size,
+            time.time(),
+        )
+        update_time = "excluded.ingested_at" if changed else "documents.ingested_at"
+        with self._lock:
+            self._conn.execute(
+                f"""
+                INSERT INTO documents ({", ".join(_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(doc_id) DO UPDATE SET
+                    source_file = excluded.source_file,
+                    title = excluded.title,
+                    collection = excluded.collection,
+                    type = excluded.type,
+                    chunks = excluded.chunks,
+                    bytes = excluded.bytes,
+                    ingested_at = {update_time}
+                """,
+                row,
+            )
+            self._conn.commit()
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            self._conn.commit()
+
+    def remove_source(self, source_file, keep_doc_id=None):
+        """Xoá các phiên bản cũ của 1 file (doc_id khác keep_doc_id)."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM documents WHERE source_file = ? AND doc_id != ?",
+                (source_file, keep_doc_id or ""),
+            )
+            self._conn.commit()
+
+    def rebuild(self, vectordb, page_size: int = REBUILD_PAGE_SIZE):
+        """Build lại toàn bộ catalog từ metadata của các chunk (duyệt theo trang)."""
+        start = time.perf_counter()
+        docs = {}
+        offset = 0
+        while True:
+            page = vectordb._collection.get(
+                include=["metadatas", "documents"], limit=page_size, offset=offset
+            )
+            metadatas = page["metadatas"] or []
+            for meta, text in zip(metadatas, page["documents"] or [""] * len(metadatas)):
+                if not meta or "doc_id" not in meta:
+                    continue
+                info = docs.setdefault(meta["doc_id"], [meta, 0, 0])
+                info[1] += 1
+                info[2] += len((text or "").encode("utf-8"))
+            if len(metadatas) < page_size:
+                break
+            offset += page_size
+
+        now = time.time()
+        rows = [
+            (
+                doc_id,
+                meta.get("source_file") or meta.get("source"),
+                meta.get("title"),
+                meta.get("collection"),
+                meta.get("type"),
+                chunks,
+                size,
+                now,
+            )
+            for doc_id, (meta, chunks, size) in docs.items()
+        ]
+        with self._lock:
+            self._conn.execute("DELETE FROM documents")
+            self._conn.executemany(
+                f"INSERT INTO documents ({', '.join(_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.execute("INSERT OR REPLACE INTO info VALUES ('built', ?)", (str(now),))
+            self._conn.commit()
+        print(f"📇 Rebuilt document catalog: {len(rows)} documents in {time.perf_counter() - start:.2f}s")
+        return len(rows)
+
+    def mark_built(self):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO info VALUES ('built', ?)", (str(time.time()),))
+            self._conn.commit()
+
+    def list(
+        self,
+        limit: int = 100,
+        cursor: str = None,
+        source_file: str = None,
+        collection: str = None,
+        type: str = None,
+        q: str = None,
+    ) -> dict:
+        """
+        1 trang tài liệu theo thứ tự doc_id (keyset pagination).
+
+        Args:
+            cursor: next_cursor của trang trước
+            q: Tìm chuỗi con trong source_file / title
+
+        Returns:
+            {"documents": [...], "next_cursor": str | None, "total": int}
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        conditions = []
+        params = []
+        for column, value in (("source_file", source_file), ("collection", collection), ("type", type)):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if q:
+            # q là chuỗi con thật: %, _ và \ không phải wildcard
+            pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            conditions.append("(source_file LIKE ? ESCAPE '\\' OR title LIKE ? ESCAPE '\\')")
+            params += [pattern, pattern]
+        filter_sql = " AND ".join(conditions) or "1"
+
+        page_sql = filter_sql
+        page_params = list(params)
+        if cursor:
+            page_sql += " AND doc_id > ?"
+            page_params.append(decode_cursor(cursor))
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM documents WHERE {page_sql} ORDER BY doc_id LIMIT ?",
+                page_params + [limit + 1],
+            ).fetchall()
+            total = self._conn.execute(
+                f"SELECT COUNT(*) FROM documents WHERE {filter_sql}", params
+            ).fetchone()[0]
+
+        documents = [dict(zip(_COLUMNS, row)) for row in rows[:limit]]
+        next_cursor = encode_cursor(documents[-1]["doc_id"]) if len(rows) > limit else None
+        return {"documents": documents, "next_cursor": next_cursor, "total": total}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_catalogs = {}
+_lock = threading.Lock()
+
+
+def get_catalog(persist_dir, vectordb=None) -> DocumentCatalog:
+    """
+    Catalog của 1 persist_dir (mở 1 lần rồi dùng lại). Nếu catalog chưa được
+    build và có vectordb thì build từ các chunk đang có trước khi trả về.
+    """
+    with _lock:
+        catalog = _catalogs.get(persist_dir)
+        if catalog is None:
+            catalog = _catalogs[persist_dir] = DocumentCatalog(persist_dir)
+        if vectordb is not None and catalog.needs_rebuild:
+            if vectordb._collection.count():
+                catalog.rebuild(vectordb)
+            else:
+                catalog.mark_built()
+    return catalog
+
+
+def close_catalog(persist_dir):
+    """
+    Đóng catalog đã mở của 1 persist_dir (vd: snapshot cũ sau khi reload).
+    Chỉ gọi khi không còn query nào dùng persist_dir này.
+    """
+    with _lock:
+        catalog = _catalogs.pop(persist_dir, None)
+    if catalog is not None:
+        catalog.close()
@@ -0,0 +1,241 @@
+"""
+Dựng context cho /chat từ các chunk đã retrieve.
+
+Chunk được split với chunk_overlap nên top-k thường lặp lại cùng 1 đoạn văn.
+pack_context:
+    1. Gộp các chunk liền kề / chồng lấn của cùng 1 document thành 1 khối
+    2. Bỏ các câu / đoạn gần trùng với phần đã chọn (shingle hashing)
+    3. Xếp theo độ liên quan (thứ tự retrieve) và cắt theo ngân sách token
+
+Đếm token bằng tiktoken nếu có (và đã có sẵn file encoding), không thì ước
+lượng ~4 ký tự / token.
+"""
+
+import os
+import re
+import zlib
+
+from langchain_core.documents import Document
+
+# Ngân sách token mặc định cho toàn bộ context
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+TOKENIZER_ENCODING = os.getenv("RAG_TOKENIZER_ENCODING", "cl100k_base")
+SHINGLE_SIZE = 5  # số từ mỗi shingle
+DUPLICATE_THRESHOLD = float(os.getenv("RAG_CONTEXT_DUP_THRESHOLD", "0.8"))
+MIN_OVERLAP_CHARS = 20  # overlap ngắn hơn → coi như 2 chunk không liền nhau
+MIN_SEGMENT_WORDS = 4  # câu ngắn hơn không bao giờ bị bỏ vì trùng
+MIN_TRUNCATE_TOKENS = 64  # phần ngân sách còn lại ít hơn → không cắt khối để nhét vào
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Câu / đoạn kèm khoảng trắng phía sau → nối lại ra đúng text gốc
+_SEGMENT_RE = re.compile(r".+?(?:[.!?](?=\s)|\n\s*\n|$)\s*", re.S)
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception:  # chưa cài / không tải được file encoding khi offline
+            _encoding = False
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cắt text còn tối đa max_tokens, ưu tiên cắt ở ranh giới từ."""
+    encoding = _get_encoding()
+    if encoding:
+        tokens = encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        cut = encoding.decode(tokens[:max_tokens - 1])  # chừa 1 token cho " ..."
+    else:
+        if len(text) <= max_tokens * 4:
+            return text
+        cut = text[: (max_tokens - 1) * 4]
+    space = cut.rfind(" ")
+    if space > len(cut) // 2:
+        cut = cut[:space]
+    return cut.rstrip() + " ..."
+
+
+def _overlap(a: str, b: str, max_overlap: int) -> int:
+    """Độ dài đoạn cuối của a trùng với đầu của b (0 nếu không có)."""
+    probe = b[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    pos = a.find(probe, max(0, len(a) - max_overlap))
+    while pos != -1:
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        pos = a.find(probe, pos + 1)
+    return 0
+
+
+def _merge_text(a: str, b: str):
+    """Ghép 2 chunk nếu chồng lấn / chứa nhau, None nếu không ghép được."""
+    if b in a:
+        return a
+    if a in b:
+        return b
+    max_overlap = min(len(a), len(b))
+    n = _overlap(a, b, max_overlap)
+    if n:
+        return a + b[n:]
+    n = _overlap(b, a, max_overlap)
+    if n:
+        return b + a[n:]
+    return None
+
+
+def _merge_by_position(a: Document, b: Document):
+    """Ghép theo start_index (nếu splitter có ghi) khi 2 chunk liền kề / chồng lấn."""
+    start_a, start_b = a.metadata.get("start_index"), b.metadata.get("start_index")
+    if start_a is None or start_b is None:
+        return None
+    if start_b < start_a:
+        a, b, start_a, start_b = b, a, start_b, start_a
+    text_a, text_b = a.page_content, b.page_content
+    end_a = start_a + len(text_a)
+    if start_b > end_a:
+        return None
+    if start_b + len(text_b) <= end_a:
+        return text_a
+    return text_a + text_b[end_a - start_b:]
+
+
+def _source_key(doc: Document):
+    meta = doc.metadata
+    return meta.get("doc_id") or meta.get("source_file") or meta.get("source")
+
+
+def merge_chunks(docs):
+    """
+    Gộp các chunk liền kề / chồng lấn của cùng 1 document.
+    Giữ thứ tự theo chunk liên quan nhất của mỗi khối.
+
+    Returns: [(Document, số chunk đã gộp)]
+    """
+    blocks = []  # [doc, count, source_key]
+    for doc in docs:
+        key = _source_key(doc)
+        merged = False
+        if key is not None:
+            for block in blocks:
+                if block[2] != key:
+                    continue
+                text = _merge_by_position(block[0], doc)
+                if text is None:
+                    text = _merge_text(block[0].page_content, doc.page_content)
+                if text is not None:
+                    start = min(
+                        (d.metadata["start_index"] for d in (block[0], doc) if "start_index" in d.metadata),
+                        default=None,
+                    )
+                    metadata = dict(block[0].metadata)
+                    if start is not None:
+                        metadata["start_index"] = start
+                    block[0] = Document(id=block[0].id, page_content=text, metadata=metadata)
+                    block[1] += 1
+                    merged = True
+                    break
+        if not merged:
+            blocks.append([doc, 1, key])
+    return [(doc, count) for doc, count, _ in blocks]
+
+
+def _shingles(words):
+    if len(words) < SHINGLE_SIZE:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))} if words else set()
+    return {
+        zlib.crc32(" ".join(words[i:i + SHINGLE_SIZE]).encode("utf-8"))
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def _dedupe(text: str, seen: set):
+    """
+    Bỏ các câu gần như đã có trong seen (hoặc ở phần trước của chính text).
+    Returns: (text còn lại, số câu bị bỏ, shingle của phần còn lại)
+    """
+    kept = []
+    added = set()
+    dropped = 0
+    for segment in _SEGMENT_RE.findall(text):
+        words = _WORD_RE.findall(segment.lower())
+        shingles = _shingles(words)
+        if len(words) >= MIN_SEGMENT_WORDS and shingles:
+            duplicated = (shingles & seen) | (shingles & added)
+            if len(duplicated) / len(shingles) >= DUPLICATE_THRESHOLD:
+                dropped += 1
+                continue
+        kept.append(segment)
+        added |= shingles
+    return "".join(kept).strip(), dropped, added
+
+
+def pack_context(docs, token_budget: int = None, stats: dict = None):
+    """
+    Gộp, khử trùng lặp và cắt các chunk (đã xếp theo độ liên quan) theo ngân sách token.
+
+    Args:
+        docs: Chunk theo thứ tự liên quan giảm dần
+        token_budget: Tổng số token tối đa (mặc định RAG_CONTEXT_TOKENS)
+        stats: Dict (tuỳ chọn) để ghi lại số chunk / khối / token trước và sau
+
+    Returns:
+        List Document (mỗi cái là 1 khối context), metadata có thêm "merged_chunks"
+    """
+    token_budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    blocks = merge_chunks(docs)
+
+    packed = []
+    seen = set()
+    used = 0
+    dropped_segments = 0
+    truncated = False
+    for doc, count in blocks:
+        text, dropped, shingles = _dedupe(doc.page_content, seen)
+        dropped_segments += dropped
+        if not text:
+            continue
+        tokens = count_tokens(text)
+        remaining = token_budget - used
+        if tokens > remaining:
+            if remaining <= 0:
+                break
+            if remaining < MIN_TRUNCATE_TOKENS and packed:
+                continue  # khối sau có thể nhỏ hơn và vẫn vừa
+            text = truncate_tokens(text, remaining)
+            tokens = count_tokens(text)
+            truncated = True
+        seen |= shingles
+        packed.append(
+            Document(id=doc.id, page_content=text, metadata={**doc.metadata, "merged_chunks": count})
+        )
+        used += tokens
+        if truncated:
+            break
+
+    if stats is not None:
+        stats.update({
+            "input_chunks": len(docs),
+            "input_tokens": sum(count_tokens(doc.page_content) for doc in docs),
+            "blocks": len(packed),
+            "tokens": used,
+            "token_budget": token_budget,
+            "dropped_segments": dropped_segments,
+            "truncated": truncated,
+        })
+    return packed
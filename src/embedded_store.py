@@ -1,40 +1,351 @@
 import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+import numpy as np
 from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
+from src.catalog import get_catalog
+from src.metrics import counter, observe_stage
+from src.models import LazyEmbeddings, CHUNK_EMBEDDING_MODEL, ENCODE_BATCH_SIZE
+from src.numpy_store import NumpyVectorStore
+
+embeddings = LazyEmbeddings(CHUNK_EMBEDDING_MODEL)
+
+# Backend lưu vector: "chroma" (HNSW), "numpy" (exact search, hợp với vài nghìn chunk)
+# hoặc "faiss" (flat / hnsw / ivfpq cho corpus lớn)
+VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "chroma")
+NUMPY_DTYPE = os.getenv("RAG_NUMPY_DTYPE", "float32")
+FAISS_INDEX_TYPE = os.getenv("RAG_FAISS_INDEX", "flat")
+FAISS_NLIST = int(os.getenv("RAG_FAISS_NLIST", "100"))
+FAISS_NPROBE = int(os.getenv("RAG_FAISS_NPROBE", "8"))
+
+# Số chunk mỗi lần gọi model embedding / mỗi lần ghi xuống Chroma
+EMBED_BATCH_SIZE = ENCODE_BATCH_SIZE
+WRITE_BATCH_SIZE = int(os.getenv("RAG_WRITE_BATCH_SIZE", "256"))
+
+INGEST_CHUNKS = counter("rag_ingest_chunks_total", "Số chunk đã ghi / cập nhật metadata / xoá khỏi vectorstore", ("op",))
+
+# File đánh dấu phiên bản index, đổi mỗi khi ingest thêm / xoá chunk
+INDEX_VERSION_FILE = "index_version"
+
+
+def index_version(persist_dir):
+    """Phiên bản hiện tại của index (0 nếu chưa từng ingest). Chỉ tốn 1 lần stat."""
+    if not persist_dir:
+        return 0
+    try:
+        st = os.stat(os.path.join(persist_dir, INDEX_VERSION_FILE))
+    except FileNotFoundError:
+        return 0
+    # os.replace tạo inode mới nên (inode, mtime) luôn đổi sau mỗi lần bump
+    return hash((st.st_ino, st.st_mtime_ns))
+
+
+def bump_index_version(persist_dir):
+    """Đánh dấu index đã thay đổi → cache kết quả truy vấn cũ hết hiệu lực."""
+    if not persist_dir:
+        return
+    os.makedirs(persist_dir, exist_ok=True)
+    path = os.path.join(persist_dir, INDEX_VERSION_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(time.time_ns()))
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def deferred_writes(vectordb):
+    """
+    Gom mọi upsert / delete trong khối lệnh và lưu xuống đĩa 1 lần khi thoát
+    (backend numpy / faiss). Chroma tự ghi tăng dần nên không đổi gì.
+    """
+    begin = getattr(vectordb, "begin_deferred", None)
+    if begin is None:
+        yield vectordb
+        return
+    begin()
+    try:
+        yield vectordb
+    finally:
+        if vectordb.end_deferred():
+            bump_index_version(vectordb._persist_directory)
+
+
+def _open_store(persist_dir, backend=None, **options):
+    """
+    Mở vectorstore theo backend (mặc định RAG_VECTOR_BACKEND).
+    `options` được truyền cho class của backend (vd: dtype="float16" cho numpy).
+    """
+    backend = backend or VECTOR_BACKEND
+    if backend == "chroma":
+        return Chroma(persist_directory=persist_dir, embedding_function=embeddings, **options)
+    if backend == "numpy":
+        options.setdefault("dtype", NUMPY_DTYPE)
+        return NumpyVectorStore(persist_dir, embedding_function=embeddings, **options)
+    if backend == "faiss":
+        # Import muộn: chỉ cần faiss khi thật sự dùng backend này
+        from src.faiss_store import FaissVectorStore
+
+        options.setdefault("index_type", FAISS_INDEX_TYPE)
+        options.setdefault("nlist", FAISS_NLIST)
+        options.setdefault("nprobe", FAISS_NPROBE)
+        return FaissVectorStore(persist_dir, embedding_function=embeddings, **options)
+    raise ValueError(f"Unknown vector backend: {backend}")
 
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
 
 def generate_doc_id(file_path):
     """Tạo doc_id duy nhất dựa trên nội dung file."""
+    h = hashlib.md5()
     with open(file_path, "rb") as f:
-        data = f.read()
-    return hashlib.md5(data).hexdigest()
+        # Đọc từng block để không giữ cả file lớn trong RAM
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
 
-def create_or_update_vector_db(chunks, file_path, persist_dir="vectorstore"):
-    """Upsert vectorstore cho 1 file PDF."""
-    doc_id = generate_doc_id(file_path)
+def _chunk_id(doc_id, content):
+    """
+    ID ổn định cho 1 chunk: hash từ doc_id + nội dung.
+    Metadata không nằm trong ID (start_index, page đổi khi sửa đầu bài) →
+    metadata đổi được phát hiện riêng và chỉ cập nhật metadata, không embed lại.
+    """
+    return hashlib.md5(f"{doc_id}:{content}".encode("utf-8")).hexdigest()
+
+
+def _next_chunk_id(doc_id, content, seen):
+    """
+    ID cho chunk tiếp theo, thêm hậu tố nếu 2 chunk trùng nội dung.
+    `seen` đếm số lần xuất hiện của mỗi ID gốc trong cùng 1 doc.
+    """
+    base = _chunk_id(doc_id, content)
+    n = seen.get(base, 0)
+    seen[base] = n + 1
+    return base if n == 0 else f"{base}_{n}"
+
+
+def _existing_chunk_ids(vectordb, doc_id):
+    """Lấy ID các chunk đang lưu cho doc_id (lọc metadata, không lấy embedding)."""
+    result = vectordb.get(where={"doc_id": doc_id}, include=[])
+    return set(result["ids"])
+
+
+def _existing_chunks(vectordb, doc_id):
+    """{chunk_id: metadata} của các chunk đang lưu cho doc_id (không lấy embedding)."""
+    result = vectordb.get(where={"doc_id": doc_id}, include=["metadatas"])
+    return dict(zip(result["ids"], result["metadatas"]))
 
-    # Gắn doc_id vào metadata của từng chunk
-    for c in chunks:
-        c.metadata["doc_id"] = doc_id
-        c.metadata["source_file"] = file_path  # tiện để trace
 
-    vectordb = Chroma(persist_directory=persist_dir, embedding_function=embeddings)
+def _batched(items, size):
+    """Gom iterable (list hoặc generator) thành các batch kích thước cố định."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _normalize(vectors):
+    """L2-normalize 1 lần trước khi ghi (cosine = dot product khi truy vấn)."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def write_documents_batched(
+    vectordb,
+    items,
+    embed_batch_size=EMBED_BATCH_SIZE,
+    write_batch_size=WRITE_BATCH_SIZE,
+):
+    """
+    Embed + ghi chunk xuống Chroma theo batch thay vì 1 request khổng lồ.
+
+    Args:
+        vectordb: Vectorstore (Chroma, NumpyVectorStore hoặc FaissVectorStore)
+        items: Iterable các cặp (chunk_id, Document), có thể là generator
+        embed_batch_size: Số text mỗi lần gọi model embedding
+        write_batch_size: Số chunk mỗi lần ghi xuống Chroma
+
+    Returns:
+        dict thống kê: số chunk, thời gian embed / ghi, chunks/sec
+    """
+    embedder = vectordb.embeddings
+    written = 0
+    embed_seconds = 0.0
+    write_seconds = 0.0
+    start = time.perf_counter()
 
-    # Nếu doc_id đã tồn tại → xoá trước
-    existing_ids = [f"{doc_id}_{i}" for i in range(10_000)]  # số đủ lớn
-    vectordb.delete(ids=existing_ids)
-    print(f"🗑️  Deleted old chunks for doc {file_path} (doc_id={doc_id})")
+    for batch in _batched(items, write_batch_size):
+        ids = [chunk_id for chunk_id, _ in batch]
+        texts = [doc.page_content for _, doc in batch]
+        metadatas = [doc.metadata for _, doc in batch]
 
-    # Add chunks mới
-    vectordb.add_documents(chunks)
-    print(f"✅ Upserted {len(chunks)} chunks for doc {file_path}")
+        t0 = time.perf_counter()
+        vectors = []
+        for i in range(0, len(texts), embed_batch_size):
+            vectors.extend(embedder.embed_documents(texts[i:i + embed_batch_size]))
+        vectors = _normalize(vectors)
+        t1 = time.perf_counter()
+
+        vectordb._collection.upsert(
+            ids=ids, embeddings=vectors, metadatas=metadatas, documents=texts
+        )
+        t2 = time.perf_counter()
+        observe_stage("ingest_embed", t1 - t0)
+        observe_stage("ingest_write", t2 - t1)
+        INGEST_CHUNKS.inc(len(ids), op="written")
+        write_seconds += t2 - t1
+        embed_seconds += t1 - t0
+        written += len(ids)
+
+    elapsed = time.perf_counter() - start
+    rate = written / elapsed if elapsed > 0 else 0.0
+    if written:
+        print(
+            f"⚡ Embedded + wrote {written} chunks in {elapsed:.2f}s "
+            f"({rate:.1f} chunks/sec; embed {embed_seconds:.2f}s, write {write_seconds:.2f}s)"
+        )
+    return {
+        "chunks": written,
+        "embed_seconds": embed_seconds,
+        "write_seconds": write_seconds,
+        "chunks_per_sec": rate,
+    }
+
+
+def _upsert_chunks(
+    vectordb,
+    chunks,
+    doc_id,
+    metadata=None,
+    embed_batch_size=EMBED_BATCH_SIZE,
+    write_batch_size=WRITE_BATCH_SIZE,
+):
+    """
+    Upsert chunks của 1 doc_id: chỉ add chunk mới chưa có trong vectorstore,
+    chỉ cập nhật metadata của chunk cũ có metadata đổi (không embed lại) và
+    chỉ xoá chunk cũ không còn nữa.
+
+    `chunks` có thể là generator: chunk được gắn metadata rồi chuyển thẳng
+    cho writer theo batch, nên RAM không phụ thuộc độ dài tài liệu.
+
+    Returns:
+        (tổng số chunk, số chunk đã add, số chunk đã xoá)
+    """
+    start = time.perf_counter()
+    existing = _existing_chunks(vectordb, doc_id)
+    seen = {}
+    kept = set()
+    changed = []  # (chunk_id, metadata) của chunk giữ nguyên nội dung nhưng đổi metadata
+    info = {"bytes": 0, "metadata": dict(metadata or {})}
+
+    def new_chunks():
+        for c in chunks:
+            c.metadata["doc_id"] = doc_id
+            c.metadata.update(metadata or {})
+            if not seen:  # chunk đầu tiên (kể cả khi nội dung rỗng)
+                info["metadata"] = dict(c.metadata)
+            info["bytes"] += len(c.page_content.encode("utf-8"))
+            chunk_id = _next_chunk_id(doc_id, c.page_content, seen)
+            kept.add(chunk_id)
+            if chunk_id not in existing:
+                yield chunk_id, c
+            elif existing[chunk_id] != c.metadata:
+                changed.append((chunk_id, dict(c.metadata)))
+
+    stats = write_documents_batched(
+        vectordb, new_chunks(), embed_batch_size, write_batch_size
+    )
+
+    for batch in _batched(changed, write_batch_size):
+        vectordb._collection.update(
+            ids=[chunk_id for chunk_id, _ in batch],
+            metadatas=[meta for _, meta in batch],
+        )
+    if changed:
+        INGEST_CHUNKS.inc(len(changed), op="updated")
+
+    stale = existing.keys() - kept
+    if stale:
+        vectordb.delete(ids=list(stale))
+        INGEST_CHUNKS.inc(len(stale), op="deleted")
+
+    modified = bool(stats["chunks"] or changed or stale)
+    if modified:
+        bump_index_version(vectordb._persist_directory)
+
+    total = sum(seen.values())
+    catalog = get_catalog(vectordb._persist_directory, vectordb)
+    if total:
+        catalog.record(doc_id, info["metadata"], total, info["bytes"], changed=modified)
+    else:
+        catalog.remove(doc_id)
+    observe_stage("upsert", time.perf_counter() - start)
+
+    return total, stats["chunks"], len(stale)
+
+
+def _delete_previous_versions(vectordb, file_path, doc_id):
+    """Xoá chunk của các phiên bản cũ của cùng file (nội dung đổi → doc_id đổi)."""
+    result = vectordb.get(
+        where={"$and": [{"source_file": file_path}, {"doc_id": {"$ne": doc_id}}]},
+        include=[],
+    )
+    if result["ids"]:
+        vectordb.delete(ids=result["ids"])
+        INGEST_CHUNKS.inc(len(result["ids"]), op="deleted")
+        bump_index_version(vectordb._persist_directory)
+        get_catalog(vectordb._persist_directory, vectordb).remove_source(file_path, doc_id)
+    return len(result["ids"])
+
+
+def create_or_update_vector_db(
+    chunks,
+    file_path,
+    persist_dir="vectorstore",
+    embed_batch_size=EMBED_BATCH_SIZE,
+    write_batch_size=WRITE_BATCH_SIZE,
+    vectordb=None,
+    source=None,
+):
+    """
+    Upsert vectorstore cho 1 file PDF.
+    `chunks` có thể là list hoặc generator (vd: loader.iter_split).
+    `vectordb`: vectorstore đã mở sẵn (None → mở từ persist_dir).
+    `source`: nguồn gốc ghi vào metadata khi `file_path` chỉ là file tạm
+    (vd: URL đã tải về); None → dùng `file_path`.
+    """
+    doc_id = generate_doc_id(file_path)
+    source = source or file_path
+
+    if vectordb is None:
+        vectordb = _open_store(persist_dir)
+
+    # Gắn doc_id + source_file (tiện để trace) vào metadata của từng chunk.
+    # "source" của loader là đường dẫn file → thay bằng nguồn gốc để file tạm
+    # (tên ngẫu nhiên) không làm metadata đổi sau mỗi lần tải lại
+    deleted = _delete_previous_versions(vectordb, source, doc_id)
+    total, added, removed = _upsert_chunks(
+        vectordb, chunks, doc_id, {"source": source, "source_file": source},
+        embed_batch_size, write_batch_size,
+    )
+    deleted += removed
+    print(f"🗑️  Deleted {deleted} stale chunks for doc {source} (doc_id={doc_id})")
+    print(f"✅ Upserted {total} chunks for doc {source} ({added} new)")
     return vectordb
 
 
-def create_or_update_vector_db_from_collection(chunks, collection_name, persist_dir="vectorstore"):
+def create_or_update_vector_db_from_collection(
+    chunks,
+    collection_name,
+    persist_dir="vectorstore",
+    embed_batch_size=EMBED_BATCH_SIZE,
+    write_batch_size=WRITE_BATCH_SIZE,
+):
     """
     Upsert vectorstore cho một collection (ví dụ: blog posts).
     Dùng collection_name làm doc_id thay vì hash file content.
@@ -43,28 +354,65 @@ def create_or_update_vector_db_from_collection(chunks, collection_name, persist_
         chunks: List of Document chunks
         collection_name: Tên collection (dùng làm doc_id)
         persist_dir: Thư mục lưu vector database
+        embed_batch_size: Số chunk mỗi lần gọi model embedding
+        write_batch_size: Số chunk mỗi lần ghi xuống Chroma
     """
     doc_id = hashlib.md5(collection_name.encode()).hexdigest()
     
-    # Gắn doc_id vào metadata của từng chunk
-    for c in chunks:
-        c.metadata["doc_id"] = doc_id
-        c.metadata["collection"] = collection_name
+    vectordb = _open_store(persist_dir)
     
-    vectordb = Chroma(persist_directory=persist_dir, embedding_function=embeddings)
-    
-    # Nếu doc_id đã tồn tại → xoá trước
-    existing_ids = [f"{doc_id}_{i}" for i in range(10_000)]
-    vectordb.delete(ids=existing_ids)
-    print(f"🗑️  Deleted old chunks for collection {collection_name} (doc_id={doc_id})")
-    
-    # Add chunks mới
-    vectordb.add_documents(chunks)
-    print(f"✅ Upserted {len(chunks)} chunks for collection {collection_name}")
+    # Gắn doc_id + collection vào metadata của từng chunk
+    total, added, deleted = _upsert_chunks(
+        vectordb, chunks, doc_id, {"collection": collection_name},
+        embed_batch_size, write_batch_size,
+    )
+    print(f"🗑️  Deleted {deleted} stale chunks for collection {collection_name} (doc_id={doc_id})")
+    print(f"✅ Upserted {total} chunks for collection {collection_name} ({added} new)")
     return vectordb
 
 
-def load_vector_db(persist_dir="vectorstore"):
-    """Load lại vector DB đã lưu."""
-    vectordb = Chroma(persist_directory=persist_dir, embedding_function=embeddings)
+def upsert_document_chunks(
+    chunks,
+    doc_id,
+    metadata=None,
+    persist_dir="vectorstore",
+    vectordb=None,
+    embed_batch_size=EMBED_BATCH_SIZE,
+    write_batch_size=WRITE_BATCH_SIZE,
+):
+    """
+    Upsert chunks của 1 tài liệu với doc_id cho trước (vd: 1 blog post).
+
+    Returns:
+        (tổng số chunk, số chunk đã add, số chunk đã xoá)
+    """
+    if vectordb is None:
+        vectordb = _open_store(persist_dir)
+    return _upsert_chunks(
+        vectordb, chunks, doc_id, metadata, embed_batch_size, write_batch_size
+    )
+
+
+def delete_document(doc_id, persist_dir="vectorstore", vectordb=None):
+    """Xoá toàn bộ chunk của 1 doc_id. Trả về số chunk đã xoá."""
+    if vectordb is None:
+        vectordb = _open_store(persist_dir)
+    ids = list(_existing_chunk_ids(vectordb, doc_id))
+    if ids:
+        vectordb.delete(ids=ids)
+        INGEST_CHUNKS.inc(len(ids), op="deleted")
+        bump_index_version(vectordb._persist_directory)
+    get_catalog(vectordb._persist_directory, vectordb).remove(doc_id)
+    return len(ids)
+
+
+def load_vector_db(persist_dir="vectorstore", backend=None, **options):
+    """
+    Load lại vector DB đã lưu.
+
+    Args:
+        backend: "chroma", "numpy" hoặc "faiss" (None → RAG_VECTOR_BACKEND)
+        options: Tham số riêng của backend
+    """
+    vectordb = _open_store(persist_dir, backend, **options)
     return vectordb
\ No newline at end of file
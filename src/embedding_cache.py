@@ -0,0 +1,201 @@
+"""
+Embedding cache lưu trên đĩa (SQLite), dùng chung cho loader và vectorstore.
+Key = (tên model, hash của text đã chuẩn hoá) → re-ingest file không đổi
+sẽ không phải chạy lại model.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+# Nằm trong repo (không theo thư mục đang chạy) → API và ingest dùng chung 1 cache
+CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "embeddings.sqlite3"
+)
+MAX_ENTRIES = 500_000
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hoá text trước khi hash (Unicode NFC + gộp khoảng trắng)."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Bảng SQLite (model, text_hash) → vector float32, có LRU eviction."""
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = MAX_ENTRIES):
+        """
+        Args:
+            path: File SQLite lưu cache
+            max_entries: Số vector tối đa, vượt quá thì xoá entry ít dùng nhất
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)"
+        )
+        self._conn.commit()
+
+    def get_many(self, model: str, keys: List[str]) -> dict:
+        """Trả về {text_hash: vector} cho các key đã có trong cache."""
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            # SQLite giới hạn số tham số mỗi câu lệnh → chia nhỏ
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found],
+                )
+                self._conn.commit()
+
+            hits = sum(1 for k in keys if k in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, model: str, items: dict):
+        """Lưu {text_hash: vector} vào cache rồi evict nếu vượt max_entries."""
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (model, h, array("f", vector).tobytes(), now)
+            for h, vector in items.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN ("
+                "SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_cache() -> EmbeddingCache:
+    """Cache dùng chung trong process (mở SQLite 1 lần)."""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache(os.getenv("RAG_EMBEDDING_CACHE", CACHE_PATH))
+        return _shared_cache
+
+
+class CachedEmbeddings(Embeddings):
+    """Bọc 1 Embeddings: chỉ chạy model cho những text chưa có trong cache."""
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache: EmbeddingCache = None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache or get_shared_cache()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()  # embed_documents được gọi từ nhiều thread executor
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [text_key(t) for t in texts]
+        found = self.cache.get_many(self.model_name, keys)
+        hits = sum(1 for k in keys if k in found)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(keys) - hits
+
+        # Text trùng nhau trong cùng batch chỉ embed 1 lần
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_name, computed)
+            found.update(computed)
+
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed nhiều câu truy vấn trong 1 lần gọi model (không ghi cache đĩa)."""
+        return self.embeddings.embed_documents(texts)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "model": self.model_name,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
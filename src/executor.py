@@ -0,0 +1,104 @@
+"""
+Executor riêng cho việc nặng CPU (embedding, search) của API.
+
+Số việc đang chạy + đang chờ bị giới hạn: khi đầy, request bị từ chối ngay
+(ExecutorBusyError → 503 + Retry-After) thay vì xếp hàng vô hạn và kéo
+dài tail latency. Event loop không bao giờ bị block nên /health vẫn trả lời
+được khi inference bão hoà.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+INFERENCE_WORKERS = int(os.getenv("RAG_INFERENCE_WORKERS", "2"))
+INFERENCE_QUEUE = int(os.getenv("RAG_INFERENCE_QUEUE", "32"))
+# Sinh câu trả lời (có thể gọi LLM, chạy lâu) dùng pool riêng để không chiếm
+# thread của embedding / search
+GENERATION_WORKERS = int(os.getenv("RAG_GENERATION_WORKERS", "4"))
+GENERATION_QUEUE = int(os.getenv("RAG_GENERATION_QUEUE", "16"))
+RETRY_AFTER_SECONDS = int(os.getenv("RAG_RETRY_AFTER", "1"))
+
+
+class ExecutorBusyError(Exception):
+    """Queue của executor đã đầy."""
+
+    def __init__(self, retry_after: int = RETRY_AFTER_SECONDS):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """Thread pool có giới hạn số việc đang chạy + đang chờ."""
+
+    def __init__(
+        self,
+        max_workers: int = INFERENCE_WORKERS,
+        max_queue: int = INFERENCE_QUEUE,
+        retry_after: int = RETRY_AFTER_SECONDS,
+        name: str = "inference",
+    ):
+        """
+        Args:
+            max_workers: Số thread chạy inference song song
+            max_queue: Số việc được phép chờ khi tất cả thread đều bận
+            retry_after: Giá trị header Retry-After (giây) khi từ chối
+            name: Tiền tố tên thread của pool
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.rejected = 0
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix=name)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, slots: int = 1):
+        """
+        Giữ trước `slots` chỗ (đang chạy + đang chờ), raise ExecutorBusyError nếu
+        không đủ. Dùng khi 1 việc phục vụ nhiều request (vd: 1 batch của batcher).
+        """
+        with self._lock:
+            if self._in_flight + slots > self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorBusyError(self.retry_after)
+            self._in_flight += slots
+
+    def release(self, slots: int = 1):
+        with self._lock:
+            self._in_flight -= slots
+
+    def submit(self, fn, *args, **kwargs):
+        """Gửi việc vào pool → concurrent Future, raise ExecutorBusyError nếu đầy."""
+        self.reserve()
+        return self.submit_reserved(1, fn, *args, **kwargs)
+
+    def submit_reserved(self, slots: int, fn, *args, **kwargs):
+        """Gửi việc đã giữ `slots` chỗ bằng reserve(); trả lại đủ `slots` khi việc xong."""
+        try:
+            # Chạy trong context của người gọi → timer trong worker ghi đúng request
+            future = self._pool.submit(contextvars.copy_context().run, partial(fn, *args, **kwargs))
+        except BaseException:  # pool đã shutdown
+            self.release(slots)
+            raise
+        # Trả slot khi việc thật sự xong (kể cả khi client đã ngắt kết nối)
+        future.add_done_callback(lambda _future: self.release(slots))
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """Chạy fn trong pool và await kết quả mà không block event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,681 @@
+"""
+Vectorstore dùng FAISS cho corpus lớn, chọn được loại index:
+- "flat":  exact search (IndexFlatIP), 4·D byte / vector
+- "hnsw":  đồ thị HNSW, nhanh hơn khi rất nhiều vector, tốn RAM hơn flat
+- "ivfpq": IVF + Product Quantization, chỉ ~pq_m byte / vector
+
+Dữ liệu nằm trong `<persist_dir>/faiss/`:
+- `index-<gen>.faiss`: index chính, load bằng mmap ở phía đọc
+- `pending-<gen>.faiss`: vector chưa vào được index IVF vì index chưa train
+  (IVF cần đủ `train_size` vector mới train được; trước đó vẫn search exact)
+- `records.sqlite3`: label (int64) → chunk id, document, metadata và bảng
+  `info` (tên file index hiện tại, next_label, tombstone). Reader chỉ giữ
+  chunk id + metadata trong RAM, document được đọc theo label khi cần.
+- `meta.json`: đánh dấu đã đổi (reader stat file này để biết cần load lại)
+
+Ghi file index mới → commit SQLite (1 transaction: record + tên file mới)
+→ đổi meta.json. File index cũ được xoá nếu được (Windows không cho xoá
+file còn bị mmap → thử lại ở lần lưu sau). Ingest nhiều tài liệu nên bọc
+trong begin_deferred() / end_deferred() (embedded_store.deferred_writes) để
+index chỉ được đọc đầy đủ và ghi lại 1 lần cho cả lần ingest.
+
+FAISS chỉ biết label int64 nên mỗi chunk được cấp 1 label mới mỗi lần upsert;
+label cũ bị xoá (flat / ivfpq) hoặc đánh dấu tombstone (hnsw không xoá được,
+sẽ build lại khi tombstone quá nhiều).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from src.numpy_store import _match, _remove_stale_files
+
+STORE_DIR = "faiss"
+META_FILE = "meta.json"
+RECORDS_FILE = "records.sqlite3"
+# Số label mỗi câu SELECT ... IN (...) khi đọc document
+_FETCH_BATCH = 500
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+# Filter khớp ít chunk hơn ngưỡng này → tính exact trên đúng các chunk đó
+FILTER_EXACT_MAX = 4096
+# Tỉ lệ tombstone (hnsw) vượt ngưỡng này thì build lại index
+TOMBSTONE_REBUILD_RATIO = 0.2
+
+
+def _pq_subquantizers(dim: int, wanted: int) -> int:
+    """Số sub-quantizer lớn nhất ≤ wanted mà chia hết dim."""
+    for m in range(min(wanted, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def _flat_vectors(index):
+    """(labels, vectors) của 1 IndexIDMap2(IndexFlat) mà không cần reconstruct từng vector."""
+    labels = faiss.vector_to_array(index.id_map)
+    if not len(labels):
+        return labels, np.zeros((0, index.d), dtype=np.float32)
+    flat = faiss.downcast_index(index.index)
+    vectors = faiss.vector_to_array(flat.codes).view(np.float32).reshape(-1, index.d)
+    return labels, vectors
+
+
+class _State:
+    """Snapshot của store; ghi → tạo snapshot mới rồi thay tham chiếu."""
+
+    def __init__(self, index=None, pending=None, records=None, tombstones=None,
+                 next_label=0, dim=None, token=None, files=()):
+        self.index = index
+        self.pending = pending
+        self.records = records or {}        # label → (chunk_id, metadata)
+        self.labels = {chunk_id: label for label, (chunk_id, _) in self.records.items()}
+        self.tombstones = tombstones or set()
+        self.next_label = next_label
+        self.dim = dim
+        self.token = token
+        self.files = files
+        # Chỉ dùng ở bản đang ghi: document mới, label đổi metadata và label cần xoá khỏi SQLite
+        self.owner = None
+        self.added = {}                     # label → document
+        self.updated = set()
+        self.removed = set()
+        self.dirty = False
+
+
+class FaissVectorStore:
+    """Vectorstore FAISS, API tương thích phần Chroma mà repo dùng (giống NumpyVectorStore)."""
+
+    def __init__(
+        self,
+        persist_directory: str,
+        embedding_function=None,
+        index_type: str = "flat",
+        nlist: int = 100,
+        nprobe: int = 8,
+        pq_m: int = 48,
+        pq_bits: int = 8,
+        hnsw_m: int = 32,
+        ef_construction: int = 80,
+        ef_search: int = 64,
+        train_size: int = None,
+    ):
+        """
+        Args:
+            persist_directory: Thư mục vectorstore (dữ liệu nằm trong `<dir>/faiss/`)
+            embedding_function: Model embedding (LangChain Embeddings)
+            index_type: "flat", "hnsw" hoặc "ivfpq"
+            nlist / nprobe: Số cụm IVF / số cụm được quét mỗi query
+            pq_m / pq_bits: Số sub-quantizer và số bit mỗi mã PQ
+            hnsw_m / ef_construction / ef_search: Tham số đồ thị HNSW
+            train_size: Số vector cần có trước khi train IVF (mặc định 39·max(nlist, 2^pq_bits))
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown FAISS index type: {index_type}")
+        self._persist_directory = persist_directory
+        self._embedding_function = embedding_function
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.pq_bits = pq_bits
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.train_size = train_size or 39 * max(nlist, 2 ** pq_bits)
+        self.directory = os.path.join(persist_directory, STORE_DIR)
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = None
+        self._state = None
+        self._write = None
+        self._deferred = 0
+        self._reload()
+
+    # ---- Tương thích Chroma ----
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    # Như metadata của Chroma collection: distance = 1 - cosine
+    metadata = {"hnsw:space": "cosine"}
+
+    @property
+    def _collection(self):
+        return self
+
+    def _select_relevance_score_fn(self):
+        return lambda distance: 1.0 - distance
+
+    def count(self) -> int:
+        return len(self._view().labels)
+
+    def __len__(self):
+        return self.count()
+
+    # ---- Index ----
+
+    def _new_index(self, dim: int):
+        if self.index_type == "flat":
+            return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+        if self.index_type == "hnsw":
+            hnsw = faiss.IndexHNSWFlat(dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            hnsw.hnsw.efConstruction = self.ef_construction
+            return faiss.IndexIDMap2(hnsw)
+        m = _pq_subquantizers(dim, self.pq_m)
+        return faiss.IndexIVFPQ(
+            faiss.IndexFlatIP(dim), dim, self.nlist, m, self.pq_bits, faiss.METRIC_INNER_PRODUCT
+        )
+
+    def _search_params(self, state: _State, selector=None, exhaustive: bool = False):
+        if self.index_type == "hnsw":
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=max(self.ef_search, 1))
+        if self.index_type == "ivfpq":
+            nprobe = self.nlist if exhaustive else self.nprobe
+            return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+        return faiss.SearchParameters(sel=selector)
+
+    # ---- Đọc / ghi file ----
+
+    def _meta_path(self):
+        return os.path.join(self.directory, META_FILE)
+
+    def _token(self):
+        try:
+            st = os.stat(self._meta_path())
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns)
+
+    def _connect(self):
+        """Kết nối SQLite dùng chung (check_same_thread=False, mọi lệnh dưới _db_lock)."""
+        if self._db is None:
+            os.makedirs(self.directory, exist_ok=True)
+            db = sqlite3.connect(
+                os.path.join(self.directory, RECORDS_FILE), timeout=30, check_same_thread=False
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS records (
+                    label INTEGER PRIMARY KEY,
+                    chunk_id TEXT NOT NULL,
+                    document TEXT NOT NULL,
+                    metadata TEXT NOT NULL
+                )
+                """
+            )
+            db.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+            db.commit()
+            self._db = db
+        return self._db
+
+    def _migrate_legacy_meta(self, db):
+        """Store cũ lưu mọi record trong meta.json → chuyển 1 lần sang SQLite."""
+        try:
+            with open(self._meta_path(), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return
+        if "records" not in meta:
+            return
+        state = None
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if db.execute("SELECT 1 FROM info WHERE key = 'state'").fetchone() is None:
+                db.executemany(
+                    "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)",
+                    (
+                        (label, chunk_id, text, json.dumps(metadata or {}, ensure_ascii=False))
+                        for label, chunk_id, text, metadata in meta["records"]
+                    ),
+                )
+                state = {key: meta[key] for key in ("index_type", "index", "pending", "dim", "next_label")}
+                state["tombstones"] = meta.get("tombstones", [])
+                db.execute("INSERT INTO info VALUES ('state', ?)", (json.dumps(state),))
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        if state is not None:  # process khác có thể đã chuyển trước
+            print(f"📦 Moved {len(meta['records'])} FAISS records from meta.json to {RECORDS_FILE}")
+            self._write_meta(state["index"], state["pending"])
+
+    def _read_records(self):
+        """(info state, {label: (chunk_id, metadata)}) đọc trong cùng 1 transaction."""
+        with self._db_lock:
+            db = self._connect()
+            row = db.execute("SELECT value FROM info WHERE key = 'state'").fetchone()
+            if row is None:
+                self._migrate_legacy_meta(db)
+            db.execute("BEGIN")
+            try:
+                row = db.execute("SELECT value FROM info WHERE key = 'state'").fetchone()
+                rows = db.execute("SELECT label, chunk_id, metadata FROM records").fetchall() if row else []
+            finally:
+                db.commit()
+        if row is None:
+            return None, {}
+        return json.loads(row[0]), {
+            label: (chunk_id, json.loads(metadata)) for label, chunk_id, metadata in rows
+        }
+
+    def _documents(self, state: _State, labels):
+        """Document của các label: bản đang ghi lấy từ RAM, còn lại đọc SQLite."""
+        texts = {label: state.added[label] for label in labels if label in state.added}
+        missing = [label for label in labels if label not in texts]
+        with self._db_lock:
+            db = self._connect()
+            for i in range(0, len(missing), _FETCH_BATCH):
+                batch = missing[i:i + _FETCH_BATCH]
+                texts.update(
+                    db.execute(
+                        f"SELECT label, document FROM records WHERE label IN ({', '.join('?' * len(batch))})",
+                        batch,
+                    ).fetchall()
+                )
+        return [texts.get(label, "") for label in labels]
+
+    def _reload(self):
+        self._state = self._load()
+
+    def _load(self, writable: bool = False) -> _State:
+        """
+        Đọc snapshot từ đĩa. Phía đọc mmap index chính (chỉ trang được dùng
+        mới vào RAM); trước khi ghi thì đọc bản đầy đủ có thể sửa.
+        """
+        for _ in range(3):
+            token = self._token()
+            if token is None:
+                return _State()
+            meta, records = self._read_records()
+            if meta is None:
+                return _State(token=token)
+            if meta["index_type"] != self.index_type:
+                raise ValueError(
+                    f"{self.directory} holds a '{meta['index_type']}' index, not '{self.index_type}'"
+                )
+            flag = faiss.IO_FLAG_READ_ONLY if writable else faiss.IO_FLAG_MMAP
+            try:
+                index = faiss.read_index(os.path.join(self.directory, meta["index"]), flag)
+                pending = faiss.read_index(os.path.join(self.directory, meta["pending"]))
+            except RuntimeError:
+                if not os.path.exists(os.path.join(self.directory, meta["index"])):
+                    continue  # writer vừa thay file, đọc lại
+                raise
+            return _State(
+                index=index,
+                pending=pending,
+                records=records,
+                tombstones=set(meta.get("tombstones", [])),
+                next_label=meta["next_label"],
+                dim=meta["dim"],
+                token=token,
+                files=(meta["index"], meta["pending"]),
+            )
+        raise RuntimeError(f"Could not load FAISS store from {self.directory}")
+
+    def _current(self) -> _State:
+        """Snapshot hiện tại, load lại nếu process khác vừa ghi (1 lần stat)."""
+        token = self._token()
+        if token != self._state.token:
+            with self._lock:
+                if token != self._state.token:
+                    self._reload()
+        return self._state
+
+    def _view(self) -> _State:
+        """Thread đang ghi hoãn đọc được thay đổi chưa lưu của nó; thread khác đọc snapshot đã lưu."""
+        state = self._write
+        if state is not None and state.owner == threading.get_ident():
+            return state
+        return self._current()
+
+    def _write_meta(self, index_name, pending_name):
+        tmp_path = f"{self._meta_path()}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"index_type": self.index_type, "index": index_name, "pending": pending_name},
+                f,
+            )
+        os.replace(tmp_path, self._meta_path())
+
+    def _save(self, state: _State):
+        os.makedirs(self.directory, exist_ok=True)
+        generation = f"{os.getpid()}-{time.time_ns()}"
+        index_name = f"index-{generation}.faiss"
+        pending_name = f"pending-{generation}.faiss"
+        faiss.write_index(state.index, os.path.join(self.directory, index_name))
+        faiss.write_index(state.pending, os.path.join(self.directory, pending_name))
+
+        info = {
+            "index_type": self.index_type,
+            "index": index_name,
+            "pending": pending_name,
+            "dim": state.dim,
+            "next_label": state.next_label,
+            "tombstones": sorted(state.tombstones),
+        }
+        with self._db_lock:
+            db = self._connect()
+            try:
+                db.executemany(
+                    "DELETE FROM records WHERE label = ?", ((label,) for label in state.removed)
+                )
+                db.executemany(
+                    "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)",
+                    (
+                        (label, state.records[label][0], text,
+                         json.dumps(state.records[label][1], ensure_ascii=False))
+                        for label, text in state.added.items()
+                    ),
+                )
+                db.executemany(
+                    "UPDATE records SET metadata = ? WHERE label = ?",
+                    (
+                        (json.dumps(state.records[label][1], ensure_ascii=False), label)
+                        for label in state.updated
+                    ),
+                )
+                db.execute("INSERT OR REPLACE INTO info VALUES ('state', ?)", (json.dumps(info),))
+                db.commit()
+            except BaseException:
+                db.rollback()
+                raise
+        self._write_meta(index_name, pending_name)
+
+        # Bỏ snapshot cũ trước (đóng mmap của process này) rồi mới xoá file cũ
+        self._reload()
+        keep = {index_name, pending_name}
+        for pattern in ("index-*.faiss", "pending-*.faiss"):
+            _remove_stale_files(self.directory, pattern, keep)
+
+    def _writable_state(self, dim: int = None) -> _State:
+        """
+        Bản sửa được của snapshot (index đọc đầy đủ, không mmap), chỉ load 1
+        lần cho cả phiên ghi hoãn. Reader vẫn dùng snapshot cũ tới khi lưu.
+        """
+        state = self._write
+        if state is None:
+            state = self._write = self._load(writable=True)
+            state.owner = threading.get_ident()
+        if state.index is None and dim is not None:
+            state.index = self._new_index(dim)
+            state.pending = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+            state.dim = dim
+        return state
+
+    def begin_deferred(self):
+        """Từ giờ ghi chỉ vào bản trong RAM, lưu 1 lần ở end_deferred() (có thể lồng nhau)."""
+        with self._lock:
+            self._deferred += 1
+
+    def end_deferred(self) -> bool:
+        """Kết thúc ghi hoãn; lần end ngoài cùng lưu xuống đĩa. True nếu có dữ liệu được lưu."""
+        with self._lock:
+            self._deferred -= 1
+            if self._deferred > 0:
+                return False
+            return self._flush_locked()
+
+    def flush(self) -> bool:
+        with self._lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> bool:
+        state, self._write = self._write, None
+        if state is None or not state.dirty:
+            return False
+        self._save(state)
+        return True
+
+    # ---- Ghi ----
+
+    def _remove_labels(self, state: _State, labels):
+        if not labels:
+            return
+        ids = np.asarray(labels, dtype=np.int64)
+        state.pending.remove_ids(ids)
+        if self.index_type == "hnsw":
+            # HNSW không hỗ trợ xoá → tombstone, bỏ qua khi search
+            state.tombstones.update(int(label) for label in labels)
+        else:
+            state.index.remove_ids(ids)
+        for label in labels:
+            chunk_id, _ = state.records.pop(label, (None, None))
+            if state.labels.get(chunk_id) == label:
+                del state.labels[chunk_id]
+            state.updated.discard(label)
+            if state.added.pop(label, None) is None:
+                state.removed.add(label)
+        state.dirty = True
+
+    def _maybe_train(self, state: _State):
+        """IVF: đủ vector trong pending → train rồi chuyển hết sang index chính."""
+        if state.index.is_trained or state.pending.ntotal < self.train_size:
+            return
+        labels, vectors = _flat_vectors(state.pending)
+        print(f"⏳ Training FAISS {self.index_type} on {len(labels)} vectors...")
+        state.index.train(vectors)
+        state.index.add_with_ids(vectors, labels)
+        state.pending.reset()
+
+    def _maybe_rebuild(self, state: _State):
+        """HNSW: quá nhiều tombstone → build lại đồ thị từ vector còn sống."""
+        if self.index_type != "hnsw" or not state.tombstones:
+            return
+        if len(state.tombstones) < TOMBSTONE_REBUILD_RATIO * max(state.index.ntotal, 1):
+            return
+        live = np.asarray(
+            [label for label in state.records if label not in state.tombstones], dtype=np.int64
+        )
+        vectors = np.vstack([state.index.reconstruct(int(label)) for label in live]) if len(live) else None
+        state.index = self._new_index(state.dim)
+        if vectors is not None:
+            state.index.add_with_ids(vectors, live)
+        state.tombstones = set()
+
+    def upsert(self, ids, embeddings, metadatas=None, documents=None):
+        """Thêm mới hoặc thay thế chunk theo id. `embeddings` đã được normalize."""
+        vectors = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32))
+        metadatas = metadatas or [{}] * len(ids)
+        documents = documents or [""] * len(ids)
+        with self._lock:
+            state = self._writable_state(vectors.shape[1])
+            latest = {}  # id lặp lại trong cùng batch → lấy bản cuối
+            for i, chunk_id in enumerate(ids):
+                latest[chunk_id] = i
+            self._remove_labels(state, [state.labels[c] for c in latest if c in state.labels])
+
+            rows = list(latest.values())
+            labels = np.arange(state.next_label, state.next_label + len(rows), dtype=np.int64)
+            state.next_label += len(rows)
+            for label, row in zip(labels, rows):
+                state.records[int(label)] = (ids[row], metadatas[row] or {})
+                state.labels[ids[row]] = int(label)
+                state.added[int(label)] = documents[row]
+            state.dirty = state.dirty or bool(rows)
+
+            batch = vectors[rows]
+            if state.index.is_trained:
+                state.index.add_with_ids(batch, labels)
+            else:
+                state.pending.add_with_ids(batch, labels)
+                self._maybe_train(state)
+            self._maybe_rebuild(state)
+            if not self._deferred:
+                self._flush_locked()
+
+    def update(self, ids, metadatas):
+        """Chỉ thay metadata của các id đã có (giữ nguyên vector và document)."""
+        with self._lock:
+            state = self._writable_state()
+            for chunk_id, meta in zip(ids, metadatas):
+                label = state.labels.get(chunk_id)
+                if label is None:
+                    continue
+                state.records[label] = (chunk_id, meta or {})
+                if label not in state.added:
+                    state.updated.add(label)
+                state.dirty = True
+            if not self._deferred:
+                self._flush_locked()
+
+    def delete(self, ids=None, where=None):
+        with self._lock:
+            state = self._writable_state()
+            if state.index is not None:
+                drop = [state.labels[c] for c in (ids or []) if c in state.labels]
+                if where:
+                    drop.extend(
+                        label for label, (_, metadata) in state.records.items()
+                        if _match(metadata, where)
+                    )
+                drop = list(set(drop))
+                if drop:
+                    self._remove_labels(state, drop)
+                    self._maybe_rebuild(state)
+            if not self._deferred:
+                self._flush_locked()
+
+    # ---- Đọc ----
+
+    def get(self, ids=None, where=None, include=("metadatas", "documents"), limit=None, offset=None):
+        """Giống Chroma `get`: lọc theo ids và/hoặc where."""
+        state = self._view()
+        if ids is not None:
+            labels = [state.labels[c] for c in ids if c in state.labels]
+        else:
+            labels = list(state.records)
+        if where:
+            labels = [label for label in labels if _match(state.records[label][1], where)]
+        labels = labels[offset or 0:]
+        if limit is not None:
+            labels = labels[:limit]
+
+        return {
+            "ids": [state.records[label][0] for label in labels],
+            "documents": self._documents(state, labels) if "documents" in include else None,
+            "metadatas": [state.records[label][1] for label in labels] if "metadatas" in include else None,
+            "embeddings": None,
+        }
+
+    def _search_index(self, index, state, queries, k, allowed, exhaustive=False):
+        """Search 1 index FAISS với filter / tombstone → (scores, labels)."""
+        keep = []  # giữ selector sống tới hết lần search
+        selector = None
+        if allowed is not None:
+            selector = faiss.IDSelectorBatch(allowed)
+            keep.append(selector)
+        elif state.tombstones and index is state.index:
+            excluded = faiss.IDSelectorBatch(np.asarray(sorted(state.tombstones), dtype=np.int64))
+            selector = faiss.IDSelectorNot(excluded)
+            keep.extend([excluded, selector])
+        if index is state.pending:
+            params = faiss.SearchParameters(sel=selector)
+        else:
+            params = self._search_params(state, selector, exhaustive)
+        scores, labels = index.search(queries, k, params=params)
+        return scores, labels
+
+    def _exact(self, state, queries, k, allowed):
+        """Ít chunk khớp filter → lấy vector của đúng các chunk đó và tính exact."""
+        vectors = np.vstack([state.index.reconstruct(int(label)) for label in allowed])
+        scores = queries @ vectors.T
+        k = min(k, len(allowed))
+        top = np.argsort(-scores, axis=1)[:, :k]
+        return np.take_along_axis(scores, top, axis=1), allowed[top]
+
+    def search_vectors(self, query_embeddings, k: int, where: dict = None):
+        """
+        Top-k cho nhiều query cùng lúc.
+
+        Returns:
+            (state, labels (Q, k'), scores (Q, k')), label -1 = không có kết quả
+        """
+        state = self._current()
+        queries = np.ascontiguousarray(np.asarray(query_embeddings, dtype=np.float32))
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        faiss.normalize_L2(queries)
+        if state.index is None or k <= 0:
+            empty = np.zeros((len(queries), 0))
+            return state, empty.astype(np.int64), empty.astype(np.float32)
+
+        allowed = None
+        if where:
+            allowed = np.asarray(
+                [label for label, (_, metadata) in state.records.items() if _match(metadata, where)],
+                dtype=np.int64,
+            )
+            if not len(allowed):
+                empty = np.zeros((len(queries), 0))
+                return state, empty.astype(np.int64), empty.astype(np.float32)
+
+        parts = []
+        if state.pending.ntotal:
+            parts.append(self._search_index(state.pending, state, queries, k, allowed))
+        if state.index.ntotal:
+            small = allowed is not None and len(allowed) <= FILTER_EXACT_MAX
+            if small and self.index_type == "hnsw":
+                # HNSW + filter hẹp: duyệt đồ thị dễ không tới được chunk hợp lệ
+                parts.append(self._exact(state, queries, k, allowed))
+            else:
+                # IVF + filter hẹp → quét hết các cụm (selector loại phần còn lại)
+                parts.append(self._search_index(state.index, state, queries, k, allowed, exhaustive=small))
+
+        scores = np.hstack([p[0] for p in parts])
+        labels = np.hstack([p[1] for p in parts])
+        order = np.argsort(-scores, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, order, axis=1)
+        labels = np.take_along_axis(labels, order, axis=1)
+        return state, labels, scores
+
+    def query(self, query_embeddings, n_results: int = 4, where: dict = None, include=("metadatas", "documents", "distances")):
+        """Giống Chroma `query`: kết quả dạng list-of-lists, mỗi query 1 list."""
+        state, labels, scores = self.search_vectors(query_embeddings, n_results, where)
+        rows = [
+            [(int(l), float(s)) for l, s in zip(row_l, row_s) if l >= 0 and int(l) in state.records]
+            for row_l, row_s in zip(labels, scores)
+        ]
+        texts = {}
+        if "documents" in include:
+            found = list({label for row in rows for label, _ in row})
+            texts = dict(zip(found, self._documents(state, found)))
+        return {
+            "ids": [[state.records[l][0] for l, _ in row] for row in rows],
+            "distances": [[1.0 - s for _, s in row] for row in rows],
+            "documents": [[texts[l] for l, _ in row] for row in rows] if "documents" in include else None,
+            "metadatas": [[state.records[l][1] for l, _ in row] for row in rows] if "metadatas" in include else None,
+        }
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None):
+        vector = self._embedding_function.embed_query(query)
+        result = self.query([vector], n_results=k, where=filter)
+        return [
+            Document(id=chunk_id, page_content=text, metadata=meta or {})
+            for chunk_id, text, meta in zip(
+                result["ids"][0], result["documents"][0], result["metadatas"][0]
+            )
+        ]
+
+    def close(self):
+        """Bỏ index đang mmap và đóng SQLite (vd: version cũ sau hot reload); lần dùng sau mở lại."""
+        with self._lock:
+            self._write = None
+            self._state = _State(token=False)
+            with self._db_lock:
+                if self._db is not None:
+                    self._db.close()
+                    self._db = None
+
+    def memory_bytes(self) -> int:
+        """Kích thước file index (xấp xỉ RAM index chiếm nếu được đọc hết)."""
+        state = self._current()
+        return sum(os.path.getsize(os.path.join(self.directory, name)) for name in state.files)
@@ -0,0 +1,86 @@
+"""
+Metadata filter cho retrieval, dịch sang `where` của Chroma.
+
+Chroma chỉ cho metadata kiểu str / int / float / bool nên tags được lưu
+thành các cờ `tag_<slug>: True` trên từng chunk, và ngày đăng thêm
+`date_ts` (unix timestamp) để lọc theo khoảng thời gian.
+"""
+
+import re
+from datetime import datetime, timezone
+
+TAG_PREFIX = "tag_"
+
+
+def tag_key(tag: str) -> str:
+    """
+    Tên field metadata của 1 tag, vd: "Java Socket" → "tag_java_socket".
+    Khoảng trắng / "-" / "_" thành "_"; ký tự đặc biệt khác được thay bằng mã
+    Unicode (hex) để các tag khác nhau không trùng key: "C++" → "tag_c_2b_2b",
+    "C#" → "tag_c_23". (Chỉ tag viết sẵn dạng mã, vd "c_23", mới trùng.)
+    """
+    slug = re.sub(r"[\s_-]+", "_", tag.strip().lower()).strip("_")
+    slug = re.sub(r"[^\w]", lambda m: f"_{ord(m.group()):x}", slug)
+    return f"{TAG_PREFIX}{slug}"
+
+
+def tag_flags(tags) -> dict:
+    """{tag_<slug>: True} cho danh sách tag."""
+    return {tag_key(t): True for t in tags if t and t.strip()}
+
+
+def parse_date(value):
+    """Chuỗi ngày ISO (vd: 2024-05-01 hoặc 2024-05-01T10:00:00+07:00) → unix timestamp, lỗi → None."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).strip().strip('"').strip("'"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def build_where(
+    doc_id: str = None,
+    source_file: str = None,
+    collection: str = None,
+    type: str = None,
+    tags=None,
+    date_from: str = None,
+    date_to: str = None,
+):
+    """
+    Gộp các điều kiện lọc thành `where` của Chroma (None nếu không lọc gì).
+
+    Args:
+        tags: Danh sách tag, chunk phải có đủ tất cả
+        date_from / date_to: Khoảng ngày đăng (ISO, tính cả 2 đầu)
+    """
+    conditions = []
+    for field, value in (
+        ("doc_id", doc_id),
+        ("source_file", source_file),
+        ("collection", collection),
+        ("type", type),
+    ):
+        if value:
+            conditions.append({field: value})
+    for tag in tags or []:
+        if tag and tag.strip():
+            conditions.append({tag_key(tag): True})
+    for op, value in (("$gte", date_from), ("$lte", date_to)):
+        if value:
+            ts = parse_date(value)
+            if ts is None:
+                raise ValueError(f"Invalid date: {value}")
+            if op == "$lte" and len(value.strip()) == 10:  # chỉ có ngày → hết ngày đó
+                ts += 86399
+            conditions.append({"date_ts": {op: ts}})
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
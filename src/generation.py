@@ -0,0 +1,100 @@
+"""
+Sinh câu trả lời cho /chat từ các chunk đã retrieve.
+
+Mọi generator có cùng interface: `stream(question, docs)` trả về iterator các
+đoạn text (token) → /chat nối lại thành 1 chuỗi, /chat với `stream` gửi dần
+từng đoạn cho client. Muốn dùng LLM thì viết 1 class có `stream` rồi
+register_generator("ten", factory) và đặt RAG_GENERATOR=ten.
+
+Có sẵn:
+    extractive  ghép nguyên văn các chunk (cách /chat vẫn làm từ trước)
+    fake        text xác định theo câu hỏi + nguồn, có thể chậm giả lập LLM (test)
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+
+DEFAULT_GENERATOR = os.getenv("RAG_GENERATOR", "extractive")
+# Độ trễ mỗi token của fake generator (ms), để đo TTFB / total khi test
+FAKE_TOKEN_DELAY_MS = float(os.getenv("RAG_FAKE_TOKEN_DELAY_MS", "0"))
+
+ANSWER_PREFIX = "Dựa trên các bài viết trong blog, đây là những thông tin liên quan đến câu hỏi của bạn:\n\n"
+
+# Mỗi token = 1 từ + khoảng trắng phía sau → nối lại đúng bằng text gốc
+_TOKEN_RE = re.compile(r"\S+\s*|\s+")
+
+
+def split_tokens(text: str):
+    """Chia text thành các "token" (từ + khoảng trắng), nối lại ra đúng text."""
+    return _TOKEN_RE.findall(text)
+
+
+def build_context(docs) -> str:
+    """Ghép các chunk thành context có đánh số nguồn [Nguồn i]."""
+    return "\n".join(f"[Nguồn {i}]\n{doc.page_content}\n" for i, doc in enumerate(docs, start=1))
+
+
+class ExtractiveGenerator:
+    """Không dùng model: trả lời bằng chính các chunk đã retrieve."""
+
+    name = "extractive"
+
+    def stream(self, question: str, docs):
+        yield ANSWER_PREFIX
+        yield from split_tokens(build_context(docs))
+
+
+class FakeGenerator:
+    """Generator xác định cho test: cùng câu hỏi + nguồn → cùng câu trả lời."""
+
+    name = "fake"
+
+    def __init__(self, token_delay_ms: float = FAKE_TOKEN_DELAY_MS, max_tokens: int = 64):
+        self.token_delay_ms = token_delay_ms
+        self.max_tokens = max_tokens
+
+    def stream(self, question: str, docs):
+        seed = hashlib.md5(
+            "\x00".join([question, *(doc.page_content for doc in docs)]).encode("utf-8")
+        ).hexdigest()
+        words = split_tokens(" ".join(doc.page_content for doc in docs)) or ["(no context) "]
+        yield f"[fake:{seed[:8]}] "
+        for i in range(min(self.max_tokens, len(words))):
+            if self.token_delay_ms:
+                time.sleep(self.token_delay_ms / 1000)
+            # Chọn từ theo seed → xác định nhưng không chỉ lặp lại context
+            yield words[int(seed[i % 32], 16) * (i + 1) % len(words)]
+
+
+_factories = {
+    "extractive": ExtractiveGenerator,
+    "fake": FakeGenerator,
+}
+_generators = {}
+_lock = threading.Lock()
+
+
+def register_generator(name: str, factory):
+    """Thêm generator mới, factory() → object có stream(question, docs)."""
+    with _lock:
+        _factories[name] = factory
+        _generators.pop(name, None)
+
+
+def available_generators():
+    return sorted(_factories)
+
+
+def get_generator(name: str = None):
+    """Generator theo tên (mặc định RAG_GENERATOR), tạo 1 lần rồi dùng lại."""
+    name = name or DEFAULT_GENERATOR
+    if name not in _factories:
+        raise KeyError(f"Unknown generator: {name} (available: {', '.join(available_generators())})")
+    if name not in _generators:
+        with _lock:
+            if name not in _generators:
+                _generators[name] = _factories[name]()
+    return _generators[name]
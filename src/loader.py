@@ -1,20 +1,74 @@
+import re
 from langchain_community.document_loaders import PyPDFLoader
-from langchain_experimental.text_splitter import SemanticChunker
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.documents import Document
+from src.metrics import timer
+from src.models import LazyEmbeddings, SEMANTIC_SPLIT_MODEL
 
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-)
+embeddings = LazyEmbeddings(SEMANTIC_SPLIT_MODEL)
+
+_semantic_splitter = None
+
+
+def get_semantic_splitter():
+    """Tạo SemanticChunker ở lần dùng đầu (tránh import langchain_experimental khi không cần)."""
+    global _semantic_splitter
+    if _semantic_splitter is None:
+        from langchain_experimental.text_splitter import SemanticChunker
+
+        _semantic_splitter = SemanticChunker(
+            embeddings=embeddings,
+            breakpoint_threshold_type="gradient",
+            breakpoint_threshold_amount=0.8,
+        )
+    return _semantic_splitter
 
-semantic_splitter = SemanticChunker(
-    embeddings=embeddings,
-    breakpoint_threshold_type="gradient",
-    breakpoint_threshold_amount=0.8,
-)
 
 def load_and_split(file_path: str):
     """Load 1 file PDF và split thành chunks bằng Semantic Splitter."""
     loader = PyPDFLoader(file_path)
-    docs = loader.load()
-    chunks = semantic_splitter.split_documents(docs)
+    with timer("pdf_load"):
+        docs = loader.load()
+    with timer("pdf_split"):
+        chunks = get_semantic_splitter().split_documents(docs)
     return chunks
+
+
+def iter_split(file_path: str, carry_sentences: int = 8):
+    """
+    Đọc PDF từng trang và yield chunk ngay khi split xong (không giữ cả file).
+
+    Chunk cuối của mỗi trang có thể còn tiếp ở trang sau, nên tối đa
+    `carry_sentences` câu cuối được giữ lại và split chung với trang kế tiếp
+    → breakpoint ngữ nghĩa vẫn có thể nằm vắt qua ranh giới trang.
+    """
+    splitter = get_semantic_splitter()
+    loader = PyPDFLoader(file_path)
+
+    carry = []
+    carry_meta = None
+    for page in loader.lazy_load():
+        text = " ".join(carry + [page.page_content]) if carry else page.page_content
+        with timer("pdf_split"):
+            pieces = splitter.split_text(text)
+        if not pieces:
+            continue
+
+        # Chunk đầu tiên bắt đầu từ phần carry → metadata của trang trước
+        first_meta = carry_meta or page.metadata
+        *complete, last = pieces
+        for i, piece in enumerate(complete):
+            yield Document(page_content=piece, metadata=dict(first_meta if i == 0 else page.metadata))
+
+        sentences = re.split(splitter.sentence_split_regex, last)
+        last_meta = first_meta if not complete else page.metadata
+        if len(sentences) > carry_sentences:
+            head = " ".join(sentences[:-carry_sentences])
+            yield Document(page_content=head, metadata=dict(last_meta))
+            carry = sentences[-carry_sentences:]
+            carry_meta = page.metadata
+        else:
+            carry = sentences
+            carry_meta = last_meta
+
+    if carry:
+        yield Document(page_content=" ".join(carry), metadata=dict(carry_meta))
@@ -0,0 +1,101 @@
+"""
+Manifest lưu dấu vân tay (mtime, size, sha256) của từng file đã ingest,
+dùng để biết file nào được thêm / sửa / xoá kể từ lần chạy trước.
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from typing import List
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+@dataclass
+class ManifestDiff:
+    """Kết quả so sánh thư mục hiện tại với manifest."""
+
+    added: List[str] = field(default_factory=list)
+    modified: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.modified or self.deleted)
+
+
+class FileManifest:
+    """File JSON {path: {mtime, size, sha256, doc_id}}."""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Đường dẫn file manifest (.json)
+        """
+        self.path = path
+        self.files = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def scan(self, paths: List[str]) -> ManifestDiff:
+        """
+        So sánh danh sách file hiện có với manifest.
+        Chỉ hash lại file có mtime/size thay đổi; nếu hash không đổi thì
+        coi là unchanged (vd: chỉ bị touch).
+        """
+        diff = ManifestDiff()
+        current = set()
+        for path in paths:
+            current.add(path)
+            entry = self.files.get(path)
+            if entry is None:
+                diff.added.append(path)
+                continue
+
+            st = os.stat(path)
+            if st.st_mtime_ns == entry["mtime"] and st.st_size == entry["size"]:
+                diff.unchanged.append(path)
+            elif file_sha256(path) == entry["sha256"]:
+                entry["mtime"] = st.st_mtime_ns
+                diff.unchanged.append(path)
+            else:
+                diff.modified.append(path)
+
+        diff.deleted = [p for p in self.files if p not in current]
+        return diff
+
+    def update(self, path: str, doc_id: str = None):
+        """Ghi lại dấu vân tay hiện tại của file sau khi ingest xong."""
+        st = os.stat(path)
+        self.files[path] = {
+            "mtime": st.st_mtime_ns,
+            "size": st.st_size,
+            "sha256": file_sha256(path),
+            "doc_id": doc_id,
+        }
+
+    def remove(self, path: str):
+        return self.files.pop(path, None)
+
+    def save(self):
+        """Ghi manifest (ghi file tạm rồi rename để không bao giờ bị ghi dở)."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
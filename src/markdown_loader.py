@@ -8,6 +8,8 @@ import re
 from typing import List
 from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from src.filters import parse_date, tag_flags
+from src.metrics import timer
 
 class HugoBlogLoader:
     """Loader cho Hugo blog posts (markdown files)."""
@@ -19,19 +21,28 @@ class HugoBlogLoader:
         """
         self.blog_dir = blog_dir
         
+    def list_files(self) -> List[str]:
+        """Danh sách đường dẫn các file markdown (bỏ qua _index.md)."""
+        return [
+            os.path.join(self.blog_dir, filename)
+            for filename in sorted(os.listdir(self.blog_dir))
+            if filename.endswith('.md') and filename != '_index.md'
+        ]
+
     def load(self) -> List[Document]:
         """Load tất cả các file markdown trong blog_dir."""
-        documents = []
-        
-        for filename in os.listdir(self.blog_dir):
-            if filename.endswith('.md') and filename != '_index.md':
-                filepath = os.path.join(self.blog_dir, filename)
-                doc = self._load_single_file(filepath)
-                if doc:
-                    documents.append(doc)
-        
+        documents = self.load_files(self.list_files())
         print(f"✅ Loaded {len(documents)} blog posts from {self.blog_dir}")
         return documents
+
+    def load_files(self, filepaths: List[str]) -> List[Document]:
+        """Load 1 số file markdown cụ thể (dùng cho ingest tăng dần)."""
+        documents = []
+        for filepath in filepaths:
+            doc = self._load_single_file(filepath)
+            if doc:
+                documents.append(doc)
+        return documents
     
     def _load_single_file(self, filepath: str) -> Document:
         """Load một file markdown và trích xuất metadata."""
@@ -46,16 +57,24 @@ class HugoBlogLoader:
             title = frontmatter.get('title', os.path.basename(filepath))
             date = frontmatter.get('date', '')
             tags = frontmatter.get('tags', [])
+            if not isinstance(tags, list):
+                tags = [t.strip() for t in str(tags).split(',') if t.strip()]
             
             # Create metadata
+            # Chroma không nhận list → mỗi tag thành 1 cờ tag_<slug> để lọc được,
+            # 'tags' giữ dạng chuỗi chỉ để hiển thị
             metadata = {
                 'source': filepath,
                 'filename': os.path.basename(filepath),
                 'title': title,
                 'date': date,
-                'tags': ', '.join(tags) if isinstance(tags, list) else str(tags),  # Convert list to string
-                'type': 'blog_post'
+                'tags': ', '.join(tags),
+                'type': 'blog_post',
+                **tag_flags(tags),
             }
+            date_ts = parse_date(date)
+            if date_ts is not None:
+                metadata['date_ts'] = date_ts
             
             return Document(page_content=body, metadata=metadata)
             
@@ -107,20 +126,27 @@ def load_and_split_markdown(blog_dir: str, chunk_size: int = 1000, chunk_overlap
     """
     # Load documents
     loader = HugoBlogLoader(blog_dir)
-    documents = loader.load()
+    with timer("markdown_load"):
+        documents = loader.load()
     
     # Split into chunks
+    chunks = split_markdown_documents(documents, chunk_size, chunk_overlap)
+    
+    print(f"✅ Split into {len(chunks)} chunks")
+    return chunks
+
+
+def split_markdown_documents(documents: List[Document], chunk_size: int = 1000, chunk_overlap: int = 200):
+    """Split các blog post đã load thành chunks."""
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
         length_function=len,
-        separators=["\n\n", "\n", ". ", " ", ""]
+        separators=["\n\n", "\n", ". ", " ", ""],
+        add_start_index=True,  # vị trí trong bài → context builder ghép các chunk liền kề
     )
-    
-    chunks = text_splitter.split_documents(documents)
-    
-    print(f"✅ Split into {len(chunks)} chunks")
-    return chunks
+    with timer("markdown_split"):
+        return text_splitter.split_documents(documents)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,278 @@
+"""
+Metrics nhẹ trong bộ nhớ cho hot path: counter, histogram và timer theo stage.
+
+    with timer("search"):
+        ...
+
+ghi thời gian vào histogram `rag_stage_seconds{stage="search"}` và, nếu đang
+trong 1 request HTTP, vào danh sách timing của request đó (→ header
+Server-Timing). render() xuất mọi metric ở định dạng text của Prometheus
+cho endpoint /metrics.
+
+Mỗi lần đo chỉ tốn 2 lần perf_counter + 1 lock ngắn. RAG_METRICS=0 để tắt.
+Metrics nằm trong process: ingest chạy ở process khác thì không thấy trên
+/metrics của API.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+METRICS_ENABLED = os.getenv("RAG_METRICS", "1") == "1"
+
+# Bucket (giây) cho latency: 0.5ms → 10s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = {}
+_collectors = []
+_registry_lock = threading.Lock()
+
+# Danh sách (stage, giây) của request HTTP hiện tại, None khi không trong request
+_request_timings = ContextVar("rag_request_timings", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Giá trị chỉ tăng, theo từng bộ label."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple([labels.get(name, "") for name in self.labelnames])
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple([labels.get(name, "") for name in self.labelnames]), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """Phân bố giá trị theo bucket cố định (+ tổng và số lần đo)."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels → [đếm từng bucket (+Inf ở cuối), tổng, số lần]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple([labels.get(name, "") for name in self.labelnames])
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def summary(self) -> dict:
+        """{labels: {"count", "sum"}} — dùng cho benchmark / debug."""
+        with self._lock:
+            return {key: {"count": entry[2], "sum": entry[1]} for key, entry in self._values.items()}
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(entry[0]), entry[1], entry[2]) for key, entry in self._values.items()]
+        for key, counts, total, count in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(float(bound))}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+def _get_or_create(cls, name, help, labelnames, **kwargs):
+    metric = _metrics.get(name)
+    if metric is None:
+        with _registry_lock:
+            metric = _metrics.get(name)
+            if metric is None:
+                metric = _metrics[name] = cls(name, help, labelnames, **kwargs)
+    return metric
+
+
+def counter(name: str, help: str = "", labelnames=()) -> Counter:
+    return _get_or_create(Counter, name, help, labelnames)
+
+
+def histogram(name: str, help: str = "", labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+
+def register_collector(collect):
+    """
+    Thêm nguồn số liệu đọc lúc render (vd: stats() sẵn có của cache / executor).
+    collect() → iterable (name, type, help, [(labels, value)]), type là "gauge" / "counter".
+    """
+    with _registry_lock:
+        _collectors.append(collect)
+
+
+STAGE_SECONDS = histogram("rag_stage_seconds", "Thời gian từng stage (giây)", ("stage",))
+
+
+def observe_stage(stage: str, seconds: float):
+    """Ghi 1 lần đo của stage (histogram + timing của request hiện tại)."""
+    if not METRICS_ENABLED:
+        return
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+def add_request_timing(stage: str, seconds: float):
+    """Chỉ thêm vào Server-Timing của request hiện tại (vd: phần việc chung của 1 batch)."""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+class _Timer:
+    # Class thay vì @contextmanager: rẻ hơn vài lần, timer nằm trên hot path
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe_stage(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def timer(stage: str) -> _Timer:
+    """Đo thời gian khối lệnh vào rag_stage_seconds{stage=...}."""
+    return _Timer(stage)
+
+
+def stage_summary() -> dict:
+    """{stage: {"count", "total_ms", "mean_ms"}} cho mọi stage đã đo."""
+    result = {}
+    for (stage,), entry in sorted(STAGE_SECONDS.summary().items()):
+        result[stage] = {
+            "count": entry["count"],
+            "total_ms": round(entry["sum"] * 1000, 3),
+            "mean_ms": round(entry["sum"] * 1000 / entry["count"], 3) if entry["count"] else None,
+        }
+    return result
+
+
+def render() -> str:
+    """Tất cả metric ở định dạng text của Prometheus (version 0.0.4)."""
+    lines = []
+    with _registry_lock:
+        metrics = list(_metrics.values())
+        collectors = list(_collectors)
+
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    for collect in collectors:
+        try:
+            families = list(collect())
+        except Exception as e:  # 1 nguồn lỗi không làm hỏng cả /metrics
+            lines.append(f"# collector error: {_escape(e)}")
+            continue
+        for name, type, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {type}")
+            for labels, value in samples:
+                if value is None:
+                    continue
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def server_timing(timings) -> str:
+    """[(stage, giây)] → giá trị header Server-Timing (gộp các lần đo cùng stage)."""
+    totals = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in totals.items())
+
+
+HTTP_REQUESTS = counter("rag_http_requests_total", "Số request HTTP", ("method", "path", "status"))
+HTTP_SECONDS = histogram("rag_http_request_seconds", "Thời gian tới khi gửi header response (giây)", ("path",))
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware: thu timing các stage trong request, thêm header
+    Server-Timing (kèm "app" = tổng tới lúc gửi header) và đếm request / latency
+    theo route.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        timings = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - start
+                route = scope.get("route")
+                path = getattr(route, "path", None) or "other"
+                HTTP_REQUESTS.inc(method=scope["method"], path=path, status=str(message["status"]))
+                HTTP_SECONDS.observe(elapsed, path=path)
+
+                header = server_timing(timings + [("app", elapsed)])
+                message = {**message, "headers": list(message.get("headers", [])) + [
+                    (b"server-timing", header.encode("latin-1"))
+                ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
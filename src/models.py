@@ -0,0 +1,116 @@
+"""
+Registry model embedding dùng chung cho cả process.
+Model chỉ được load ở lần dùng đầu tiên và mỗi model chỉ có 1 instance,
+loader và vectorstore dùng chung qua registry này.
+"""
+
+import os
+import threading
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from src.embedding_cache import CachedEmbeddings
+
+# Model embedding chunk để lưu / truy vấn vectorstore
+CHUNK_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Model dùng cho SemanticChunker để tìm breakpoint khi split PDF
+SEMANTIC_SPLIT_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+# Cross-encoder nhỏ để re-rank (query, chunk)
+RERANK_MODEL = os.getenv("RAG_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+# Cấu hình encoder: batch size của sentence-transformers, device, số thread CPU
+ENCODE_BATCH_SIZE = int(os.getenv("RAG_ENCODE_BATCH_SIZE", "32"))
+DEVICE = os.getenv("RAG_DEVICE", "cpu")
+TORCH_THREADS = int(os.getenv("RAG_TORCH_THREADS", "0"))  # 0 = để torch tự chọn
+
+_models = {}
+_lock = threading.Lock()
+
+
+def get_embeddings(model_name: str = CHUNK_EMBEDDING_MODEL) -> CachedEmbeddings:
+    """Lấy instance embedding của model, load nếu chưa có."""
+    model = _models.get(model_name)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _models.get(model_name)
+        if model is None:
+            # Import trễ: chỉ kéo torch / sentence-transformers khi thật sự cần
+            from langchain_huggingface import HuggingFaceEmbeddings
+
+            if TORCH_THREADS > 0:
+                import torch
+
+                torch.set_num_threads(TORCH_THREADS)
+
+            print(f"⏳ Loading embedding model {model_name}...")
+            model = CachedEmbeddings(
+                HuggingFaceEmbeddings(
+                    model_name=model_name,
+                    model_kwargs={"device": DEVICE},
+                    encode_kwargs={"batch_size": ENCODE_BATCH_SIZE},
+                ),
+                model_name=model_name,
+            )
+            _models[model_name] = model
+        return model
+
+
+def get_cross_encoder(model_name: str = RERANK_MODEL):
+    """Lấy cross-encoder dùng để re-rank, load nếu chưa có."""
+    key = f"cross-encoder:{model_name}"
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            from sentence_transformers import CrossEncoder
+
+            print(f"⏳ Loading cross-encoder {model_name}...")
+            model = CrossEncoder(model_name, device=DEVICE)
+            _models[key] = model
+        return model
+
+
+def is_loaded(model_name: str) -> bool:
+    return model_name in _models
+
+
+def loaded_models() -> List[str]:
+    return list(_models)
+
+
+def embedding_stats() -> dict:
+    """{model: stats()} của các model embedding đã load (hit / miss của cache trên đĩa)."""
+    return {name: model.stats() for name, model in list(_models.items()) if isinstance(model, CachedEmbeddings)}
+
+
+def warmup(model_names: List[str] = None):
+    """Load trước các model (mặc định: model embedding chunk) và chạy thử 1 câu."""
+    for name in model_names or [CHUNK_EMBEDDING_MODEL]:
+        get_embeddings(name).embeddings.embed_query("warmup")
+        print(f"🔥 Warmed up {name}")
+
+
+class LazyEmbeddings(Embeddings):
+    """Proxy Embeddings: chỉ gọi registry (và load model) khi embed lần đầu."""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    @property
+    def model(self) -> CachedEmbeddings:
+        return get_embeddings(self.model_name)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.model.embed_queries(texts)
@@ -0,0 +1,563 @@
+"""
+Vectorstore tìm kiếm chính xác (brute-force) bằng NumPy cho collection nhỏ.
+
+Với vài nghìn chunk, 1 phép nhân ma trận + argpartition nhanh hơn và chính
+xác hơn HNSW. Dữ liệu nằm trong `<persist_dir>/numpy/`:
+- `embeddings-<gen>.npy`: ma trận (N, D) đã L2-normalize dùng để search,
+  float32, float16 hoặc int8 (kèm `scales-<gen>.npy`: 1 hệ số / vector)
+- `full-<gen>.npy`: bản float32 khi ma trận search bị nén, chỉ đọc (mmap)
+  các dòng top candidate để tính lại điểm chính xác
+- `meta.json`: ids, documents, metadatas và tên các file hiện tại
+
+Mỗi lần lưu tạo file ma trận mới rồi mới đổi `meta.json` (os.replace) nên
+reader, kể cả ở process khác, không bao giờ thấy bản ghi dở. File của lần
+lưu trước được xoá nếu được (Windows không cho xoá file còn bị mmap → thử
+lại ở lần lưu sau).
+
+Ghi (upsert / delete) đi vào 1 buffer trong RAM; ngoài chế độ ghi hoãn thì
+buffer được lưu ngay sau mỗi lần ghi. Ingest nhiều tài liệu nên bọc trong
+begin_deferred() / end_deferred() (embedded_store.deferred_writes) để chỉ
+lưu 1 lần ở cuối thay vì chép lại cả ma trận sau mỗi batch.
+
+Class này có cùng các hàm mà phần còn lại của repo dùng trên Chroma
+(`get`, `delete`, `embeddings`, `_collection.upsert/query`...) nên chỉ cần
+đổi backend trong `load_vector_db`.
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+
+STORE_DIR = "numpy"
+META_FILE = "meta.json"
+DTYPES = ("float32", "float16", "int8")
+# Ma trận nén: lấy k * RESCORE_FACTOR candidate rồi tính lại điểm bằng float32
+RESCORE_FACTOR = int(os.getenv("RAG_RESCORE_FACTOR", "4"))
+# Số dòng ma trận nén được đổi sang float32 mỗi lần khi tính điểm
+_BLOCK_ROWS = 8192
+
+
+def _quantize(full, dtype):
+    """Ma trận float32 → (ma trận search, scales). int8: scale riêng cho từng vector."""
+    if dtype == np.int8:
+        scales = np.abs(full).max(axis=1) / 127.0 if len(full) else np.zeros(0)
+        scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+        codes = np.clip(np.rint(full / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales
+    return full.astype(dtype), None
+
+
+def _match(meta: dict, where: dict) -> bool:
+    """Đánh giá 1 `where` kiểu Chroma trên metadata của 1 chunk."""
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(_match(meta, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(_match(meta, c) for c in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = meta.get(key)
+            for op, target in cond.items():
+                if op == "$eq":
+                    ok = value == target
+                elif op == "$ne":
+                    ok = value != target
+                elif op == "$in":
+                    ok = value in target
+                elif op == "$nin":
+                    ok = value not in target
+                elif op in ("$gt", "$gte", "$lt", "$lte"):
+                    if value is None:
+                        return False
+                    ok = {
+                        "$gt": value > target,
+                        "$gte": value >= target,
+                        "$lt": value < target,
+                        "$lte": value <= target,
+                    }[op]
+                else:
+                    raise ValueError(f"Unsupported where operator: {op}")
+                if not ok:
+                    return False
+        elif meta.get(key) != cond:
+            return False
+    return True
+
+
+def _remove_stale_files(directory, pattern, keep):
+    """
+    Xoá file của các lần lưu trước. File còn bị mmap ở đâu đó (Windows không
+    cho xoá) được giữ lại và thử xoá lại ở lần lưu sau.
+    """
+    for path in glob.glob(os.path.join(directory, pattern)):
+        if os.path.basename(path) in keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class _State:
+    """Snapshot bất biến của store; ghi → tạo snapshot mới rồi thay tham chiếu."""
+
+    def __init__(self, ids, documents, metadatas, matrix, token=None, scales=None, full=None):
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.matrix = matrix            # ma trận dùng để search (có thể đã nén)
+        self.scales = scales            # chỉ có với int8
+        self.full = matrix if full is None else full  # float32 để rescore
+        self.token = token
+        self.index = {chunk_id: i for i, chunk_id in enumerate(ids)}
+
+
+class _Buffer:
+    """
+    Các thay đổi chưa lưu, dựng trên 1 snapshot: dòng mới được nối thêm, dòng
+    cũ bị ghi đè / đánh dấu xoá; ma trận chỉ được chép 1 lần khi lưu.
+    """
+
+    def __init__(self, state: _State):
+        self.owner = threading.get_ident()
+        self.ids = list(state.ids)
+        self.documents = list(state.documents)
+        self.metadatas = list(state.metadatas)
+        self.index = dict(state.index)       # chỉ chứa dòng còn sống
+        self.base = state.full
+        self.replaced = {}                   # dòng của base → vector mới
+        self.appended = []                   # vector của dòng ≥ len(base)
+        self.deleted = set()
+        self.dirty = False
+
+    def rows(self):
+        return [r for r in range(len(self.ids)) if r not in self.deleted]
+
+    def vectors(self, rows):
+        n_base = len(self.base)
+        return np.asarray(
+            [
+                self.replaced.get(r, self.base[r]) if r < n_base else self.appended[r - n_base]
+                for r in rows
+            ],
+            dtype=np.float32,
+        ).reshape(len(rows), -1)
+
+    def upsert(self, ids, vectors, metadatas, documents):
+        n_base = len(self.base)
+        for chunk_id, vector, meta, text in zip(ids, vectors, metadatas, documents):
+            row = self.index.get(chunk_id)
+            if row is None:
+                self.index[chunk_id] = len(self.ids)
+                self.ids.append(chunk_id)
+                self.documents.append(text)
+                self.metadatas.append(meta or {})
+                self.appended.append(vector)
+                continue
+            self.documents[row] = text
+            self.metadatas[row] = meta or {}
+            if row < n_base:
+                self.replaced[row] = vector
+            else:  # id lặp lại trong lần ghi chưa lưu
+                self.appended[row - n_base] = vector
+        self.dirty = self.dirty or bool(len(ids))
+
+    def update(self, ids, metadatas):
+        for chunk_id, meta in zip(ids, metadatas):
+            row = self.index.get(chunk_id)
+            if row is not None:
+                self.metadatas[row] = meta or {}
+                self.dirty = True
+
+    def delete(self, ids=(), where=None):
+        drop = [chunk_id for chunk_id in ids if chunk_id in self.index]
+        if where:
+            drop.extend(
+                chunk_id for chunk_id, row in self.index.items() if _match(self.metadatas[row], where)
+            )
+        for chunk_id in drop:
+            row = self.index.pop(chunk_id, None)
+            if row is not None:
+                self.deleted.add(row)
+                self.dirty = True
+
+    def materialize(self):
+        """(ids, documents, metadatas, ma trận float32) của các dòng còn sống."""
+        parts = []
+        if len(self.base):
+            base = np.array(self.base, dtype=np.float32)
+            for row, vector in self.replaced.items():
+                base[row] = vector
+            parts.append(base)
+        if self.appended:
+            parts.append(np.asarray(self.appended, dtype=np.float32))
+        full = np.vstack(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+        keep = self.rows()
+        if self.deleted:
+            full = full[keep]
+        return (
+            [self.ids[r] for r in keep],
+            [self.documents[r] for r in keep],
+            [self.metadatas[r] for r in keep],
+            full,
+        )
+
+
+class NumpyVectorStore:
+    """Exact search trên ma trận embedding mmap, API tương thích phần Chroma mà repo dùng."""
+
+    def __init__(
+        self,
+        persist_directory: str,
+        embedding_function=None,
+        dtype: str = "float32",
+        rescore: int = RESCORE_FACTOR,
+    ):
+        """
+        Args:
+            persist_directory: Thư mục vectorstore (dữ liệu nằm trong `<dir>/numpy/`)
+            embedding_function: Model embedding (LangChain Embeddings)
+            dtype: Kiểu ma trận search: "float32", "float16" (1/2 RAM) hoặc "int8" (~1/4 RAM)
+            rescore: Với dtype nén, số candidate = k * rescore được tính lại bằng
+                float32 đọc từ đĩa (0 = không rescore)
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported numpy store dtype: {dtype}")
+        self._persist_directory = persist_directory
+        self._embedding_function = embedding_function
+        self.dtype = np.dtype(dtype)
+        self.rescore = rescore
+        self.directory = os.path.join(persist_directory, STORE_DIR)
+        self._lock = threading.Lock()
+        self._state = None
+        self._buffer = None
+        self._deferred = 0
+        self._reload()
+
+    # ---- Tương thích Chroma ----
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    # Như metadata của Chroma collection: distance = 1 - cosine
+    metadata = {"hnsw:space": "cosine"}
+
+    @property
+    def _collection(self):
+        # Code gọi vectordb._collection.upsert/query/get → dùng luôn store
+        return self
+
+    def _select_relevance_score_fn(self):
+        # distance = 1 - cosine
+        return lambda distance: 1.0 - distance
+
+    def count(self) -> int:
+        return len(self._view().index)
+
+    def __len__(self):
+        return self.count()
+
+    # ---- Đọc / ghi file ----
+
+    def _meta_path(self):
+        return os.path.join(self.directory, META_FILE)
+
+    def _token(self):
+        """(inode, mtime) của meta.json: đổi sau mỗi lần ghi, kể cả từ process khác."""
+        try:
+            st = os.stat(self._meta_path())
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns)
+
+    def _reload(self):
+        for _ in range(3):
+            token = self._token()
+            if token is None:
+                self._state = _State([], [], [], np.zeros((0, 0), dtype=self.dtype))
+                return
+            with open(self._meta_path(), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("dtype", "float32") != self.dtype.name:
+                # Vẫn search được trên dữ liệu cũ; lần ghi tiếp theo sẽ lưu theo dtype mới
+                print(f"⚠️ {self.directory} is stored as {meta.get('dtype')}, converting to {self.dtype.name} on next write")
+            try:
+                arrays = {
+                    name: np.load(os.path.join(self.directory, meta[name]), mmap_mode="r")
+                    for name in ("matrix", "scales", "full")
+                    if meta.get(name)
+                }
+            except FileNotFoundError:  # writer vừa thay file, đọc lại meta
+                continue
+            self._state = _State(
+                meta["ids"],
+                meta["documents"],
+                meta["metadatas"],
+                arrays["matrix"],
+                token,
+                scales=arrays.get("scales"),
+                full=arrays.get("full"),
+            )
+            return
+        raise RuntimeError(f"Could not load numpy store from {self.directory}")
+
+    def _current(self) -> _State:
+        """Snapshot hiện tại, load lại nếu process khác vừa ghi (1 lần stat)."""
+        token = self._token()
+        if token != self._state.token:
+            with self._lock:
+                if token != self._state.token:
+                    self._reload()
+        return self._state
+
+    def _view(self):
+        """
+        Thread đang ghi hoãn đọc được chính các thay đổi chưa lưu của nó;
+        thread khác (vd: query của API) vẫn đọc snapshot đã lưu.
+        """
+        buffer = self._buffer
+        if buffer is not None and buffer.owner == threading.get_ident():
+            return buffer
+        return self._current()
+
+    def _save(self, ids, documents, metadatas, full):
+        """Ghi snapshot mới từ ma trận float32 `full` (nén lại nếu dtype không phải float32)."""
+        os.makedirs(self.directory, exist_ok=True)
+        generation = f"{os.getpid()}-{time.time_ns()}"
+        matrix, scales = _quantize(full, self.dtype)
+        files = {"matrix": (f"embeddings-{generation}.npy", matrix)}
+        if scales is not None:
+            files["scales"] = (f"scales-{generation}.npy", scales)
+        if self.dtype != np.float32:
+            files["full"] = (f"full-{generation}.npy", full)
+        for name, array in files.values():
+            np.save(os.path.join(self.directory, name), np.ascontiguousarray(array))
+
+        tmp_path = f"{self._meta_path()}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    **{key: name for key, (name, _) in files.items()},
+                    "dtype": self.dtype.name,
+                    "ids": ids,
+                    "documents": documents,
+                    "metadatas": metadatas,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, self._meta_path())
+
+        # Bỏ snapshot cũ trước (đóng mmap của process này) rồi mới xoá file cũ
+        self._reload()
+        _remove_stale_files(self.directory, "*.npy", {name for name, _ in files.values()})
+
+    # ---- Ghi ----
+
+    def begin_deferred(self):
+        """Từ giờ ghi chỉ vào buffer, lưu 1 lần ở end_deferred() (có thể lồng nhau)."""
+        with self._lock:
+            self._deferred += 1
+
+    def end_deferred(self) -> bool:
+        """Kết thúc ghi hoãn; lần end ngoài cùng lưu buffer. True nếu có dữ liệu được lưu."""
+        with self._lock:
+            self._deferred -= 1
+            if self._deferred > 0:
+                return False
+            return self._flush_locked()
+
+    def flush(self) -> bool:
+        with self._lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> bool:
+        buffer, self._buffer = self._buffer, None
+        if buffer is None or not buffer.dirty:
+            return False
+        snapshot = buffer.materialize()
+        del buffer  # buffer còn giữ mmap của snapshot cũ
+        self._save(*snapshot)
+        return True
+
+    def _writable(self) -> _Buffer:
+        if self._buffer is None:
+            self._buffer = _Buffer(self._current_locked())
+        return self._buffer
+
+    def upsert(self, ids, embeddings, metadatas=None, documents=None):
+        """Thêm mới hoặc thay thế chunk theo id. `embeddings` đã được normalize."""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        metadatas = metadatas or [{}] * len(ids)
+        documents = documents or [""] * len(ids)
+        with self._lock:
+            self._writable().upsert(ids, vectors, metadatas, documents)
+            if not self._deferred:
+                self._flush_locked()
+
+    def update(self, ids, metadatas):
+        """Chỉ thay metadata của các id đã có (giữ nguyên vector và document)."""
+        with self._lock:
+            self._writable().update(ids, metadatas)
+            if not self._deferred:
+                self._flush_locked()
+
+    def delete(self, ids=None, where=None):
+        with self._lock:
+            self._writable().delete(ids or [], where)
+            if not self._deferred:
+                self._flush_locked()
+
+    def _current_locked(self) -> _State:
+        if self._token() != self._state.token:
+            self._reload()
+        return self._state
+
+    # ---- Đọc ----
+
+    def _rows(self, state: _State, where: dict = None):
+        if not where:
+            return None
+        return np.asarray(
+            [i for i, meta in enumerate(state.metadatas) if _match(meta, where)], dtype=np.int64
+        )
+
+    def get(self, ids=None, where=None, include=("metadatas", "documents"), limit=None, offset=None):
+        """Giống Chroma `get`: lọc theo ids và/hoặc where."""
+        view = self._view()
+        if ids is not None:
+            rows = [view.index[i] for i in ids if i in view.index]
+        elif isinstance(view, _Buffer):
+            rows = view.rows()
+        else:
+            rows = range(len(view.ids))
+        if where:
+            rows = [r for r in rows if _match(view.metadatas[r], where)]
+        rows = list(rows)[offset or 0:]
+        if limit is not None:
+            rows = rows[:limit]
+
+        result = {"ids": [view.ids[r] for r in rows]}
+        result["documents"] = [view.documents[r] for r in rows] if "documents" in include else None
+        result["metadatas"] = [view.metadatas[r] for r in rows] if "metadatas" in include else None
+        if "embeddings" not in include:
+            result["embeddings"] = None
+        elif isinstance(view, _Buffer):
+            result["embeddings"] = view.vectors(rows)
+        else:
+            result["embeddings"] = np.asarray(view.full[rows], dtype=np.float32)
+        return result
+
+    def _scores(self, matrix, queries, scales=None):
+        """
+        queries (Q, D) · matrix (N, D)ᵀ → (Q, N).
+        Ma trận nén được đổi sang float32 theo block để không tạo bản float32
+        của cả ma trận; int8 nhân thêm scale của từng vector.
+        """
+        if matrix.dtype == np.float32:
+            return queries @ matrix.T
+        out = np.empty((len(queries), len(matrix)), dtype=np.float32)
+        for start in range(0, len(matrix), _BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + _BLOCK_ROWS], dtype=np.float32)
+            out[:, start:start + len(block)] = queries @ block.T
+        if scales is not None:
+            out *= scales
+        return out
+
+    @staticmethod
+    def _top(scores, k):
+        """(chỉ số, điểm) của k điểm cao nhất mỗi hàng, đã sắp giảm dần."""
+        k = min(k, scores.shape[1])
+        if k < scores.shape[1]:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(scores.shape[1]), (len(scores), 1))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def search_vectors(self, query_embeddings, k: int, where: dict = None):
+        """
+        Top-k cho nhiều query cùng lúc (1 phép matmul).
+
+        Returns:
+            (state, rows (Q, k'), scores (Q, k')) với rows là chỉ số dòng trong state
+        """
+        state = self._current()
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = queries / norms
+
+        subset = self._rows(state, where)
+        if not len(state.ids) or (subset is not None and not len(subset)):
+            empty = np.zeros((len(queries), 0))
+            return state, empty.astype(np.int64), empty.astype(np.float32)
+
+        matrix = state.matrix if subset is None else state.matrix[subset]
+        scales = state.scales
+        if scales is not None and subset is not None:
+            scales = scales[subset]
+        compressed = state.matrix.dtype != np.float32 and state.full is not state.matrix
+        fetch = k * self.rescore if compressed and self.rescore else k
+
+        top, top_scores = self._top(self._scores(matrix, queries, scales), fetch)
+        rows = top if subset is None else subset[top]
+        if fetch == k:
+            return state, rows, top_scores
+
+        # Rescore: chỉ đọc vector float32 của các candidate từ file mmap
+        exact = np.empty(rows.shape, dtype=np.float32)
+        for i, (query, candidates) in enumerate(zip(queries, rows)):
+            exact[i] = np.asarray(state.full[candidates], dtype=np.float32) @ query
+        top, top_scores = self._top(exact, k)
+        return state, np.take_along_axis(rows, top, axis=1), top_scores
+
+    def query(self, query_embeddings, n_results: int = 4, where: dict = None, include=("metadatas", "documents", "distances")):
+        """Giống Chroma `query`: kết quả dạng list-of-lists, mỗi query 1 list."""
+        state, rows, scores = self.search_vectors(query_embeddings, n_results, where)
+        result = {
+            "ids": [[state.ids[r] for r in row] for row in rows],
+            "distances": [[1.0 - float(s) for s in row] for row in scores],
+        }
+        result["documents"] = (
+            [[state.documents[r] for r in row] for row in rows] if "documents" in include else None
+        )
+        result["metadatas"] = (
+            [[state.metadatas[r] for r in row] for row in rows] if "metadatas" in include else None
+        )
+        return result
+
+    def close(self):
+        """Bỏ snapshot đang mmap (vd: version cũ sau hot reload); lần dùng sau sẽ load lại."""
+        with self._lock:
+            self._buffer = None
+            self._state = _State([], [], [], np.zeros((0, 0), dtype=self.dtype), token=False)
+
+    def memory_bytes(self) -> int:
+        """
+        Số byte ma trận search (+ scales): phần luôn nằm trong RAM khi phục vụ
+        truy vấn. Bản float32 để rescore chỉ được đọc vài dòng mỗi query.
+        """
+        state = self._current()
+        scales = state.scales.nbytes if state.scales is not None else 0
+        return int(state.matrix.nbytes + scales)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None):
+        vector = self._embedding_function.embed_query(query)
+        result = self.query([vector], n_results=k, where=filter)
+        return [
+            Document(id=chunk_id, page_content=text, metadata=meta or {})
+            for chunk_id, text, meta in zip(
+                result["ids"][0], result["documents"][0], result["metadatas"][0]
+            )
+        ]
@@ -0,0 +1,334 @@
+"""
+Pipeline ingest nhiều file song song, gồm 3 stage nối bằng queue có giới hạn:
+
+    download (thread pool, I/O) → parse + chunk PDF (process pool, CPU)
+    → embed + ghi vectorstore (1 writer duy nhất)
+
+Các stage chạy chồng lên nhau nên tổng thời gian ≈ stage chậm nhất,
+thay vì tổng thời gian của cả 3 stage.
+
+Chạy:
+    python -m src.pipeline data/
+    python -m src.pipeline https://.../paper.pdf --parse-workers 4
+"""
+
+import argparse
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from urllib.parse import unquote, urlparse
+
+import requests
+
+_DONE = object()
+
+
+def is_url(source: str) -> bool:
+    return urlparse(source).scheme in ("http", "https")
+
+
+def collect_sources(inputs, pattern=".pdf"):
+    """Mở rộng thư mục thành danh sách file PDF, giữ nguyên file lẻ và URL."""
+    sources = []
+    for item in inputs:
+        if not is_url(item) and os.path.isdir(item):
+            for name in sorted(os.listdir(item)):
+                if name.lower().endswith(pattern):
+                    sources.append(os.path.join(item, name))
+        else:
+            sources.append(item)
+    return sources
+
+
+def download_to_temp(source: str, target_dir: str = None) -> str:
+    """
+    Tải URL về 1 file tạm riêng (tên không trùng giữa các lần tải song song);
+    file local thì trả về nguyên đường dẫn. Caller xoá file tạm khi dùng xong.
+    """
+    if not is_url(source):
+        return source
+
+    response = requests.get(source, timeout=60)
+    response.raise_for_status()
+
+    name = os.path.basename(unquote(urlparse(source).path)) or "download.pdf"
+    stem, ext = os.path.splitext(name)
+    fd, temp_path = tempfile.mkstemp(suffix=ext or ".pdf", prefix=f"{stem}-", dir=target_dir)
+    with os.fdopen(fd, "wb") as f:
+        f.write(response.content)
+
+    print(f"✅ File downloaded: {source} → {temp_path}")
+    return temp_path
+
+
+def _remove_temp(path: str):
+    try:
+        os.remove(path)
+    except OSError as e:
+        print(f"⚠️ Không xoá được file tạm {path}: {e}")
+
+
+def _init_parse_worker(threads: int):
+    # Mỗi process chỉ dùng 1 phần CPU để các worker không tranh nhau
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+
+
+def _timed(fn, item):
+    """Chạy fn(item), trả về (item, kết quả, lỗi, số giây) thay vì raise."""
+    start = time.perf_counter()
+    try:
+        return item, fn(item), None, time.perf_counter() - start
+    except Exception as e:
+        return item, None, e, time.perf_counter() - start
+
+
+def _parse_file(path: str):
+    # Import trong worker process để process cha không phải load model split
+    from src.loader import load_and_split
+
+    return _timed(load_and_split, path)
+
+
+def _defer_parse(pool, path):
+    # Chế độ stream: không parse trong worker, writer tự đọc PDF từng trang
+    future = Future()
+    future.set_result((path, None, None, 0.0))
+    return future
+
+
+def _run_stage(pool, submit, inputs, out_q, max_pending):
+    """
+    Đẩy từng input vào pool (tối đa max_pending việc đang chạy),
+    kết quả hoàn thành được put vào out_q (block khi queue đầy → backpressure).
+    """
+    pending = {}
+
+    def drain(block):
+        done, _ = wait(
+            pending, timeout=None if block else 0, return_when=FIRST_COMPLETED
+        )
+        for future in done:
+            item = pending.pop(future)
+            try:
+                out_q.put(future.result())
+            except Exception as e:
+                # Worker chết (vd: BrokenProcessPool) → báo lỗi cho item đó
+                out_q.put((item, None, e, 0.0))
+
+    for item in inputs:
+        while len(pending) >= max_pending:
+            drain(block=True)
+        pending[submit(pool, item)] = item
+        drain(block=False)
+
+    while pending:
+        drain(block=True)
+    out_q.put(_DONE)
+
+
+class _StageStats:
+    def __init__(self):
+        self.busy = 0.0
+        self.count = 0
+        self.errors = []
+
+    def record(self, seconds, error=None, item=None):
+        self.busy += seconds
+        self.count += 1
+        if error is not None:
+            self.errors.append((item, error))
+
+    def as_dict(self):
+        return {
+            "items": self.count,
+            "busy_seconds": round(self.busy, 3),
+            "errors": len(self.errors),
+        }
+
+
+def run_pipeline(
+    sources,
+    persist_dir: str = "vectorstore",
+    download=download_to_temp,
+    download_workers: int = 4,
+    parse_workers: int = 2,
+    queue_size: int = 4,
+    stream: bool = False,
+):
+    """
+    Ingest danh sách nguồn (file local, URL, hoặc bất kỳ item nào `download` hiểu).
+
+    Args:
+        sources: Danh sách nguồn cần ingest
+        persist_dir: Thư mục lưu vector database
+        download: Hàm item → đường dẫn file local (chạy trong thread pool).
+            Đường dẫn khác item được coi là file tạm: xoá sau khi ghi xong,
+            còn source_file trong metadata vẫn là item gốc (vd: URL)
+        download_workers: Số thread tải file
+        parse_workers: Số process parse + chunk PDF
+        queue_size: Kích thước queue giữa các stage
+        stream: Writer đọc + split PDF từng trang và ghi theo batch
+            (RAM gần như cố định với PDF rất lớn, nhưng không dùng process pool)
+
+    Returns:
+        dict thống kê thời gian từng stage
+    """
+    from src.embedded_store import create_or_update_vector_db, deferred_writes, load_vector_db
+
+    if stream:
+        from src.loader import iter_split
+
+    paths_q = queue.Queue(maxsize=queue_size)
+    chunks_q = queue.Queue(maxsize=queue_size)
+    stats = {"download": _StageStats(), "parse": _StageStats(), "write": _StageStats()}
+    threads_per_worker = max(1, (os.cpu_count() or 1) // parse_workers)
+    temp_files = {}  # file tạm → nguồn gốc (vd: URL)
+
+    def downloaded_paths():
+        # Lấy kết quả download, ghi thống kê, bỏ qua item lỗi
+        for item, path, error, seconds in iter(paths_q.get, _DONE):
+            stats["download"].record(seconds, error, item)
+            if error is not None:
+                print(f"⚠️ Lỗi tải {item}: {error}")
+                continue
+            if path != item:
+                temp_files[path] = item if isinstance(item, str) else path
+            yield path
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(download_workers) as download_pool, ProcessPoolExecutor(
+        parse_workers,
+        initializer=_init_parse_worker,
+        initargs=(threads_per_worker,),
+    ) as parse_pool:
+        download_thread = threading.Thread(
+            target=_run_stage,
+            args=(
+                download_pool,
+                lambda pool, item: pool.submit(_timed, download, item),
+                sources,
+                paths_q,
+                download_workers,
+            ),
+            daemon=True,
+        )
+        parse_thread = threading.Thread(
+            target=_run_stage,
+            args=(
+                parse_pool,
+                _defer_parse if stream else (lambda pool, path: pool.submit(_parse_file, path)),
+                downloaded_paths(),
+                chunks_q,
+                parse_workers,
+            ),
+            daemon=True,
+        )
+        download_thread.start()
+        parse_thread.start()
+
+        # Writer duy nhất: Chroma / SQLite không cần ghi song song.
+        # Ghi hoãn: numpy / faiss chỉ lưu ma trận 1 lần ở cuối lần ingest
+        vectordb = load_vector_db(persist_dir)
+        with deferred_writes(vectordb):
+            for path, chunks, error, seconds in iter(chunks_q.get, _DONE):
+                is_temp = path in temp_files
+                source = temp_files.pop(path, path)
+                stats["parse"].record(seconds, error, source)
+                try:
+                    if error is not None:
+                        print(f"⚠️ Lỗi parse {source}: {error}")
+                        continue
+                    write_start = time.perf_counter()
+                    if stream:
+                        chunks = iter_split(path)
+                    try:
+                        create_or_update_vector_db(
+                            chunks, path, persist_dir=persist_dir, vectordb=vectordb, source=source
+                        )
+                        error = None
+                    except Exception as e:
+                        error = e
+                        print(f"⚠️ Lỗi ghi vectorstore cho {source}: {e}")
+                    stats["write"].record(time.perf_counter() - write_start, error, source)
+                finally:
+                    if is_temp:
+                        _remove_temp(path)
+
+        download_thread.join()
+        parse_thread.join()
+
+    if stats["write"].count > len(stats["write"].errors):
+        # BM25 build 1 lần ở cuối ingest thay vì ở query hybrid đầu tiên
+        from src.sparse_index import refresh_sparse_index
+
+        refresh_sparse_index(vectordb)
+
+    wall = time.perf_counter() - start
+    summary = {name: s.as_dict() for name, s in stats.items()}
+    summary["wall_seconds"] = round(wall, 3)
+
+    print("\n📊 Pipeline summary:")
+    for name in ("download", "parse", "write"):
+        s = summary[name]
+        print(f"   - {name}: {s['items']} items, busy {s['busy_seconds']}s, {s['errors']} errors")
+    print(f"   - wall time: {summary['wall_seconds']}s")
+    return summary
+
+
+def main(argv=None, default_sources=None):
+    parser = argparse.ArgumentParser(description="Ingest PDF files/URLs vào vectorstore.")
+    parser.add_argument("sources", nargs="*", help="File PDF, thư mục chứa PDF, hoặc URL")
+    parser.add_argument("--persist-dir", default="vectorstore")
+    parser.add_argument("--download-workers", type=int, default=4)
+    parser.add_argument("--parse-workers", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Split PDF từng trang và ghi theo batch (giới hạn RAM cho file lớn)",
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="Ghi vào version mới rồi mới đổi CURRENT (API đang chạy không thấy bản ghi dở)",
+    )
+    args = parser.parse_args(argv)
+
+    sources = collect_sources(args.sources or default_sources or [])
+    if not sources:
+        print("❌ No PDF files found!")
+        return None
+
+    print(f"🚀 Ingesting {len(sources)} sources...")
+    from src.snapshots import new_snapshot, resolve_persist_dir
+
+    def run(persist_dir):
+        return run_pipeline(
+            sources,
+            persist_dir=persist_dir,
+            download_workers=args.download_workers,
+            parse_workers=args.parse_workers,
+            queue_size=args.queue_size,
+            stream=args.stream,
+        )
+
+    if not args.snapshot:
+        return run(resolve_persist_dir(args.persist_dir))
+    with new_snapshot(args.persist_dir) as persist_dir:
+        summary = run(persist_dir)
+    print("💡 Reload the API to serve it: POST /admin/reload or kill -HUP <pid>")
+    return summary
+
+
+if __name__ == "__main__":
+    main()
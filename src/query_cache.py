@@ -0,0 +1,91 @@
+"""
+Cache trong process cho đường truy vấn:
+- query string → embedding vector (LRU + TTL)
+- (query, k, filter, index version) → kết quả search (LRU + TTL)
+
+Kết quả search gắn với index version nên tự hết hiệu lực khi ingest
+thay đổi vectorstore.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_TTL = float(os.getenv("RAG_QUERY_CACHE_TTL", "3600"))
+RESULT_CACHE_SIZE = int(os.getenv("RAG_RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL = float(os.getenv("RAG_RESULT_CACHE_TTL", "300"))
+RESULT_CACHE_ENABLED = os.getenv("RAG_RESULT_CACHE", "1") == "1"
+RERANK_CACHE_SIZE = int(os.getenv("RAG_RERANK_CACHE_SIZE", "20000"))
+RERANK_CACHE_TTL = float(os.getenv("RAG_RERANK_CACHE_TTL", "3600"))
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU cache có thời hạn (TTL) cho từng entry, an toàn khi dùng đa luồng."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        Args:
+            maxsize: Số entry tối đa, vượt quá thì bỏ entry ít dùng nhất
+            ttl: Số giây mỗi entry còn hiệu lực
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                expires, value = item
+                if expires > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+query_embeddings = TTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+search_results = TTLCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+# (model, query, hash nội dung chunk) → điểm cross-encoder
+rerank_scores = TTLCache(RERANK_CACHE_SIZE, RERANK_CACHE_TTL)
+
+
+def stats() -> dict:
+    return {
+        "query_embeddings": query_embeddings.stats(),
+        "search_results": search_results.stats(),
+        "rerank_scores": rerank_scores.stats(),
+    }
@@ -1,29 +1,343 @@
 from collections import defaultdict
+import hashlib
 import json
+import os
+import time
+from langchain_core.documents import Document
+from src import query_cache
+from src.embedded_store import index_version
+from src.metrics import timer
+from src.models import RERANK_MODEL, get_cross_encoder
+from src.sparse_index import get_sparse_index, reciprocal_rank_fusion
 
-def retrieve_chunks(vectordb, query: str, k: int = 3):
-    """Truy vấn theo chunk (fine-grained)."""
-    retriever = vectordb.as_retriever(search_kwargs={"k": k})
-    docs = retriever.get_relevant_documents(query)
-    return docs
+RRF_K = 60
 
-def retrieve_documents(vectordb, query: str, k: int = 2, chunk_k: int = 5):
-    """Truy vấn theo document (gom chunk -> vote)."""
-    retriever = vectordb.as_retriever(search_kwargs={"k": chunk_k})
-    docs = retriever.get_relevant_documents(query)
-
-    doc_scores = defaultdict(int)
-    for d in docs:
-        src = d.metadata.get("source", "unknown")
-        doc_scores[src] += 1
-    
-    ranked_docs = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)[:k]
+# Re-rank: số candidate tối đa đưa vào cross-encoder, batch size và giới hạn thời gian
+RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "20"))
+RERANK_BATCH_SIZE = int(os.getenv("RAG_RERANK_BATCH_SIZE", "16"))
+RERANK_TIMEOUT_MS = float(os.getenv("RAG_RERANK_TIMEOUT_MS", "500"))
+
+
+def embed_query(vectordb, query: str):
+    """Embedding của câu truy vấn, lấy từ LRU cache nếu đã hỏi trước đó."""
+    embedder = vectordb.embeddings
+    key = (getattr(embedder, "model_name", None), query)
+    vector = query_cache.query_embeddings.get(key)
+    if vector is None:
+        with timer("embed"):
+            vector = embedder.embed_query(query)
+        query_cache.query_embeddings.put(key, vector)
+    return vector
+
+
+def embed_queries(vectordb, queries: list[str]):
+    """Embedding cho nhiều câu truy vấn: lấy từ cache, phần còn lại embed 1 batch."""
+    embedder = vectordb.embeddings
+    model_name = getattr(embedder, "model_name", None)
+    vectors = [query_cache.query_embeddings.get((model_name, q)) for q in queries]
+
+    missing = list(dict.fromkeys(q for q, v in zip(queries, vectors) if v is None))
+    if missing:
+        with timer("embed"):
+            if hasattr(embedder, "embed_queries"):
+                computed = embedder.embed_queries(missing)
+            else:
+                computed = [embedder.embed_query(q) for q in missing]
+        computed = dict(zip(missing, computed))
+        for q, v in computed.items():
+            query_cache.query_embeddings.put((model_name, q), v)
+        vectors = [v if v is not None else computed[q] for q, v in zip(queries, vectors)]
+    return vectors
+
+
+def _search(vectordb, query: str, k: int, filter: dict = None, vector=None):
+    """
+    Tìm k chunk gần nhất → [(Document, distance)].
+    Kết quả được cache theo (query, k, filter, index version).
+    `vector` là embedding đã tính sẵn của query (vd: từ micro-batcher).
+    """
+    key = None
+    if query_cache.RESULT_CACHE_ENABLED:
+        key = _result_key(vectordb, query, k, filter)
+        cached = query_cache.search_results.get(key)
+        if cached is not None:
+            return _copy_results(cached)
+
+    if vector is None:
+        vector = embed_query(vectordb, query)
+    results = _query_by_vector(vectordb, vector, k, filter)
+    if key is not None:
+        query_cache.search_results.put(key, results)
+        return _copy_results(results)
+    return results
+
+
+def _copy_results(results):
+    """
+    Bản sao Document của kết quả trong cache: caller (vd: pack_context, /chat)
+    được sửa thoải mái mà không làm hỏng các lần cache hit sau.
+    """
+    return [
+        (Document(id=doc.id, page_content=doc.page_content, metadata=dict(doc.metadata)), distance)
+        for doc, distance in results
+    ]
+
+
+def _result_key(vectordb, query: str, k: int, filter: dict = None):
+    persist_dir = getattr(vectordb, "_persist_directory", None)
+    return (
+        persist_dir,
+        index_version(persist_dir),
+        query,
+        k,
+        json.dumps(filter, sort_keys=True) if filter else None,
+    )
+
+
+def _search_many(vectordb, queries: list[str], k: int, filter: dict = None):
+    """
+    Như _search cho nhiều query: lấy từ cache, phần còn lại embed 1 batch và
+    search bằng 1 lần query nhiều vector → {query: [(Document, distance)]}.
+    """
+    queries = list(dict.fromkeys(queries))
+    results = {}
+    keys = {}
+    if query_cache.RESULT_CACHE_ENABLED:
+        for q in queries:
+            keys[q] = _result_key(vectordb, q, k, filter)
+            cached = query_cache.search_results.get(keys[q])
+            if cached is not None:
+                results[q] = _copy_results(cached)
+
+    missing = [q for q in queries if q not in results]
+    if missing:
+        vectors = embed_queries(vectordb, missing)
+        for q, hits in zip(missing, _query_by_vectors(vectordb, vectors, k, filter)):
+            results[q] = hits
+            if q in keys:
+                query_cache.search_results.put(keys[q], hits)
+                results[q] = _copy_results(hits)
+    return results
+
+
+def _query_by_vector(vectordb, vector, k: int, filter: dict = None):
+    """Search Chroma theo vector → [(Document, distance)], Document có kèm id chunk."""
+    return _query_by_vectors(vectordb, [vector], k, filter)[0]
+
+
+def _query_by_vectors(vectordb, vectors, k: int, filter: dict = None):
+    """Search nhiều vector trong 1 lần gọi → mỗi vector 1 list [(Document, distance)]."""
+    with timer("search"):
+        result = vectordb._collection.query(
+            query_embeddings=list(vectors),
+            n_results=k,
+            where=filter,
+            include=["documents", "metadatas", "distances"],
+        )
+    return [
+        [
+            (Document(id=chunk_id, page_content=text, metadata=meta or {}), distance)
+            for chunk_id, text, meta, distance in zip(ids, texts, metas, distances)
+        ]
+        for ids, texts, metas, distances in zip(
+            result["ids"], result["documents"], result["metadatas"], result["distances"]
+        )
+    ]
+
+
+def _get_by_ids(vectordb, ids):
+    """Lấy Document theo danh sách id chunk (giữ nguyên thứ tự)."""
+    if not ids:
+        return {}
+    data = vectordb.get(ids=list(ids), include=["documents", "metadatas"])
+    return {
+        chunk_id: Document(id=chunk_id, page_content=text, metadata=meta or {})
+        for chunk_id, text, meta in zip(data["ids"], data["documents"], data["metadatas"])
+    }
+
+
+def hybrid_search(vectordb, query: str, k: int, filter: dict = None, vector=None, candidates: int = None):
+    """
+    Kết hợp vector search và BM25, gộp bằng reciprocal rank fusion.
+    Mỗi bên lấy `candidates` kết quả (mặc định 4*k, tối thiểu 20).
+
+    Returns:
+        [(Document, rrf_score)]
+    """
+    candidates = candidates or max(4 * k, 20)
+    dense = _search(vectordb, query, candidates, filter=filter, vector=vector)
+
+    accept = None
+    if filter:
+        # Chỉ kiểm tra filter trên các candidate BM25, không lấy mọi ID khớp filter
+        def accept(ids):
+            return set(vectordb.get(ids=ids, where=filter, include=[])["ids"])
+
+    with timer("bm25"):
+        sparse = get_sparse_index(vectordb).search(query, candidates, accept=accept)
+
+    fused = reciprocal_rank_fusion(
+        [[doc.id for doc, _ in dense], [chunk_id for chunk_id, _ in sparse]], k=RRF_K
+    )[:k]
+
+    docs = {doc.id: doc for doc, _ in dense}
+    docs.update(_get_by_ids(vectordb, [cid for cid, _ in fused if cid not in docs]))
+    return [(docs[cid], score) for cid, score in fused if cid in docs]
+
+
+def rerank(
+    query: str,
+    docs,
+    k: int,
+    max_candidates: int = RERANK_CANDIDATES,
+    timeout_ms: float = RERANK_TIMEOUT_MS,
+    batch_size: int = RERANK_BATCH_SIZE,
+    timings: dict = None,
+):
+    """
+    Xếp hạng lại `docs` (đã theo thứ tự vector search) bằng cross-encoder.
+
+    Chỉ `max_candidates` doc đầu được chấm điểm, theo từng batch. Điểm của cặp
+    (query, chunk) được cache. Nếu vượt `timeout_ms` (kiểm tra giữa các batch)
+    thì bỏ re-rank và giữ nguyên thứ tự vector search.
+    """
+    start = time.perf_counter()
+    candidates = list(docs[:max_candidates])
+    keys = [
+        (RERANK_MODEL, query, hashlib.md5(doc.page_content.encode("utf-8")).hexdigest())
+        for doc in candidates
+    ]
+    scores = [query_cache.rerank_scores.get(key) for key in keys]
+    missing = [i for i, score in enumerate(scores) if score is None]
+
+    timed_out = False
+    if missing:
+        model = get_cross_encoder()
+        # Thời gian load model (lần đầu) không tính vào giới hạn
+        deadline = time.perf_counter() + timeout_ms / 1000
+        with timer("rerank"):
+            for i in range(0, len(missing), batch_size):
+                if time.perf_counter() > deadline:
+                    timed_out = True
+                    break
+                batch = missing[i:i + batch_size]
+                predicted = model.predict(
+                    [(query, candidates[j].page_content) for j in batch], batch_size=batch_size
+                )
+                for j, score in zip(batch, predicted):
+                    scores[j] = float(score)
+                    query_cache.rerank_scores.put(keys[j], scores[j])
+
+    if timings is not None:
+        timings["rerank_ms"] = (time.perf_counter() - start) * 1000
+        timings["rerank_candidates"] = len(candidates)
+        timings["rerank_cached"] = len(candidates) - len(missing)
+        timings["rerank_fallback"] = timed_out
+    if timed_out:
+        print(f"⚠️ Re-rank exceeded {timeout_ms:.0f}ms, falling back to vector order")
+        return list(docs[:k])
+
+    order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+    return [candidates[i] for i in order[:k]]
+
+
+def retrieve_chunks(
+    vectordb,
+    query: str,
+    k: int = 3,
+    vector=None,
+    mode: str = "vector",
+    filter: dict = None,
+    rerank_results: bool = False,
+    rerank_candidates: int = RERANK_CANDIDATES,
+    rerank_timeout_ms: float = RERANK_TIMEOUT_MS,
+    timings: dict = None,
+):
+    """
+    Truy vấn theo chunk (fine-grained).
+    mode="hybrid" → kết hợp vector search với BM25 (hợp với query nhiều từ khoá).
+    filter: `where` của Chroma (xem src.filters.build_where), chỉ search trong tập chunk khớp.
+    rerank_results=True → lấy dư `rerank_candidates` kết quả rồi re-rank bằng cross-encoder.
+    `timings` (dict) nếu có sẽ được ghi thời gian từng bước (ms).
+    """
+    fetch_k = max(k, rerank_candidates) if rerank_results else k
+    start = time.perf_counter()
+    if mode == "hybrid":
+        docs = [doc for doc, _ in hybrid_search(vectordb, query, fetch_k, filter=filter, vector=vector)]
+    elif mode == "vector":
+        docs = [doc for doc, _ in _search(vectordb, query, fetch_k, filter=filter, vector=vector)]
+    else:
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+    if timings is not None:
+        timings["retrieve_ms"] = (time.perf_counter() - start) * 1000
+
+    if not rerank_results:
+        return docs
+    return rerank(
+        query, docs, k,
+        max_candidates=rerank_candidates,
+        timeout_ms=rerank_timeout_ms,
+        timings=timings,
+    )
+
+def _relevance_fn(vectordb):
+    """
+    Hàm đổi distance của vectorstore → độ tương đồng trong [0, 1] (càng lớn càng gần).
+
+    Vector đã normalize nên mọi loại distance quy về (1 + cosine) / 2. Không âm
+    → "sum" không xếp document có nhiều chunk khớp xuống thấp hơn.
+    """
+    space = (getattr(vectordb._collection, "metadata", None) or {}).get("hnsw:space", "l2")
+    scale = 4.0 if space == "l2" else 2.0  # Chroma l2 là bình phương: 2 - 2·cosine
+    return lambda distance: min(max(1.0 - distance / scale, 0.0), 1.0)
+
+
+def _vote_documents(vectordb, results, k: int, aggregate: str = "count"):
+    """
+    Gom chunk theo document rồi xếp hạng.
+
+    Args:
+        results: [(Document, distance)] từ _search
+        k: Số document trả về
+        aggregate: "count" (số chunk), "sum" hoặc "max" (theo độ tương đồng)
+    """
+    if aggregate not in ("count", "sum", "max"):
+        raise ValueError(f"Unknown aggregate: {aggregate}")
+
+    with timer("vote"):
+        to_similarity = _relevance_fn(vectordb)
+        doc_scores = defaultdict(float) if aggregate != "count" else defaultdict(int)
+        for d, distance in results:
+            src = d.metadata.get("source", "unknown")
+            if aggregate == "count":
+                doc_scores[src] += 1
+            elif aggregate == "sum":
+                doc_scores[src] += to_similarity(distance)
+            else:
+                doc_scores[src] = max(doc_scores.get(src, float("-inf")), to_similarity(distance))
+
+        ranked_docs = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)[:k]
     return ranked_docs
 
-def query_both_levels(vectordb, query: str, k_doc: int = 2, k_chunk: int = 3):
-    """Kết hợp document-level và chunk-level retrieval."""
-    chunk_docs = retrieve_chunks(vectordb, query, k_chunk)
-    ranked_docs = retrieve_documents(vectordb, query, k_doc, chunk_k=k_chunk*2)
+
+def retrieve_documents(
+    vectordb, query: str, k: int = 2, chunk_k: int = 5, aggregate: str = "count", vector=None, filter: dict = None
+):
+    """Truy vấn theo document (gom chunk -> vote)."""
+    results = _search(vectordb, query, chunk_k, filter=filter, vector=vector)
+    return _vote_documents(vectordb, results, k, aggregate)
+
+def query_both_levels(
+    vectordb, query: str, k_doc: int = 2, k_chunk: int = 3, aggregate: str = "count", vector=None, filter: dict = None
+):
+    """
+    Kết hợp document-level và chunk-level retrieval.
+    Chỉ search 1 lần (2*k_chunk kết quả): k_chunk kết quả đầu là chunk-level,
+    toàn bộ kết quả dùng để vote document-level.
+    """
+    results = _search(vectordb, query, max(k_chunk, k_chunk * 2), filter=filter, vector=vector)
+    chunk_docs = [doc for doc, _ in results[:k_chunk]]
+    ranked_docs = _vote_documents(vectordb, results, k_doc, aggregate)
     return {"documents": ranked_docs, "chunks": chunk_docs}
 
 
@@ -72,32 +386,55 @@ def show_results(docs):
 def build_topic_doc_graph(vectordb, topics: list[str], top_k: int = 5):
     """
     Xây dựng graph JSON topic ↔ document từ vectorstore.
+
+    Các topic (bỏ trùng) được embed 1 batch và search bằng 1 lần query nhiều
+    vector; kết quả từng topic được cache như các query thường.
+
+    Returns:
+        {
+            "nodes": [{"id", "type", "label", ...}],
+            "edges": [{"source", "target", "weight", "chunks"}],   # weight = similarity cao nhất
+            "documents": [{"doc_id", "label", "score", "topics", "chunks"}],  # gom theo document
+        }
     """
-    nodes = []
-    edges = []
-    node_ids = set()
+    topics = list(dict.fromkeys(t for t in topics if t))
+    results = _search_many(vectordb, topics, top_k)
+    to_similarity = _relevance_fn(vectordb)  # cùng thang [0, 1] với _vote_documents
 
+    nodes = [{"id": topic, "type": "topic", "label": topic} for topic in topics]
+    edges = {}
+    documents = {}
     for topic in topics:
-        # Add topic node nếu chưa có
-        if topic not in node_ids:
-            nodes.append({"id": topic, "type": "topic", "label": topic})
-            node_ids.add(topic)
-
-        # Query top-k docs liên quan
-        docs = vectordb.similarity_search(topic, k=top_k)
-        for doc in docs:
+        for doc, distance in results[topic]:
             doc_id = doc.metadata.get("doc_id", None)
-            source = doc.metadata.get("source_file", "unknown")
-
             if not doc_id:
                 continue
+            similarity = float(to_similarity(distance))
+
+            edge = edges.setdefault((topic, doc_id), {"source": topic, "target": doc_id, "weight": similarity, "chunks": 0})
+            edge["weight"] = max(edge["weight"], similarity)
+            edge["chunks"] += 1
 
-            # Add document node nếu chưa có
-            if doc_id not in node_ids:
-                nodes.append({"id": doc_id, "type": "document", "label": source})
-                node_ids.add(doc_id)
+            info = documents.setdefault(doc_id, {
+                "doc_id": doc_id,
+                "label": doc.metadata.get("source_file", "unknown"),
+                "chunks": 0,
+                "topics": {},
+            })
+            info["chunks"] += 1
+            info["topics"][topic] = max(info["topics"].get(topic, similarity), similarity)
 
-            # Add edge topic ↔ doc
-            edges.append({"source": topic, "target": doc_id})
+    doc_list = []
+    for info in documents.values():
+        info["score"] = sum(info["topics"].values())
+        info["topics"] = sorted(info["topics"], key=info["topics"].get, reverse=True)
+        doc_list.append(info)
+        nodes.append({
+            "id": info["doc_id"],
+            "type": "document",
+            "label": info["label"],
+            "score": info["score"],
+        })
+    doc_list.sort(key=lambda d: d["score"], reverse=True)
 
-    return {"nodes": nodes, "edges": edges}
\ No newline at end of file
+    return {"nodes": nodes, "edges": list(edges.values()), "documents": doc_list}
\ No newline at end of file
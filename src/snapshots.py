@@ -0,0 +1,342 @@
+"""
+Snapshot có phiên bản cho vectorstore + hot reload trong API.
+
+Bố cục thư mục gốc (vd: `vectorstore/`):
+    versions/<version>/   mỗi version là 1 persist_dir đầy đủ
+    CURRENT               tên version đang dùng (đổi bằng os.replace)
+
+Ingest với --snapshot: copy version hiện tại sang version mới, ghi vào bản
+copy, xong mới đổi CURRENT → reader không bao giờ thấy bản ghi dở. Thư mục
+chưa có CURRENT (bố cục cũ) vẫn dùng được như trước.
+
+Trong API, IndexManager giữ vectordb của version hiện tại; reload() load
+version mới ở background, đổi tham chiếu nguyên tử và chờ các query đang
+chạy trên version cũ xong rồi mới giải phóng nó.
+
+Process đang phục vụ 1 version giữ khoá OS trên `leases/<version>.<pid>-<n>`;
+_prune bỏ qua các version còn bị khoá (kể cả của process khác) nên không
+bao giờ xoá dữ liệu đang được query.
+"""
+
+import gc
+import glob
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from src.catalog import close_catalog
+from src.embedded_store import load_vector_db
+from src.sparse_index import forget_sparse_index
+
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+LEASES_DIR = "leases"
+# Số version cũ giữ lại (để rollback) sau mỗi lần publish
+KEEP_SNAPSHOTS = int(os.getenv("RAG_KEEP_SNAPSHOTS", "3"))
+
+
+def current_version(root: str):
+    """Tên version trong CURRENT, None nếu thư mục chưa dùng snapshot."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def resolve_persist_dir(root: str) -> str:
+    """persist_dir thật của version hiện tại (hoặc chính root với bố cục cũ)."""
+    version = current_version(root)
+    return os.path.join(root, VERSIONS_DIR, version) if version else root
+
+
+def _publish(root: str, version: str):
+    path = os.path.join(root, CURRENT_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+
+
+def _try_lock(f) -> bool:
+    """Khoá độc quyền không chờ; False nếu process / handle khác đang giữ."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class VersionLease:
+    """Khoá trên 1 file trong `<root>/leases/`: version này đang được phục vụ."""
+
+    def __init__(self, root: str, version: str):
+        os.makedirs(os.path.join(root, LEASES_DIR), exist_ok=True)
+        # pid + thời điểm: reload cùng version trong 1 process vẫn có lease riêng
+        self.path = os.path.join(root, LEASES_DIR, f"{version}.{os.getpid()}-{time.time_ns()}")
+        self._file = open(self.path, "a+")
+        if not _try_lock(self._file):
+            self._file.close()
+            raise RuntimeError(f"Lease {self.path} is already held")
+
+    def release(self):
+        if self._file is None:
+            return
+        _unlock(self._file)
+        self._file.close()
+        self._file = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass  # Windows: process khác đang mở để kiểm tra, _prune dọn sau
+
+
+def _in_use(root: str, version: str) -> bool:
+    """True nếu còn process giữ lease của version; lease của process đã chết bị xoá."""
+    in_use = False
+    for path in glob.glob(os.path.join(root, LEASES_DIR, f"{version}.*")):
+        try:
+            f = open(path, "a+")
+        except OSError:
+            in_use = True
+            continue
+        with f:
+            if not _try_lock(f):
+                in_use = True
+                continue
+            _unlock(f)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return in_use
+
+
+def _prune(root: str, keep: int):
+    """Xoá version cũ quá `keep`, trừ version hiện tại và version còn được phục vụ."""
+    versions_dir = os.path.join(root, VERSIONS_DIR)
+    current = current_version(root)
+    versions = sorted(v for v in os.listdir(versions_dir) if v != current)
+    for version in versions[: max(len(versions) - keep, 0)]:
+        if _in_use(root, version):
+            print(f"⏳ Keeping snapshot {version}: still served")
+            continue
+        try:
+            shutil.rmtree(os.path.join(versions_dir, version))
+        except OSError as e:
+            print(f"⚠️ Could not remove snapshot {version} (will retry on next publish): {e}")
+
+
+@contextmanager
+def new_snapshot(root: str, keep: int = KEEP_SNAPSHOTS):
+    """
+    Tạo version mới từ version hiện tại, yield persist_dir của nó để ingest.
+    Thoát bình thường → publish (đổi CURRENT); lỗi → xoá version dở.
+    """
+    source = resolve_persist_dir(root)
+    # Sắp theo tên = theo thời gian; phần nano giây để 2 lần publish trong cùng 1 giây không trùng
+    now = time.time_ns()
+    version = time.strftime("%Y%m%d-%H%M%S", time.localtime(now // 10**9)) + f"-{now % 10**9:09d}-{os.getpid()}"
+    target = os.path.join(root, VERSIONS_DIR, version)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.isdir(source):
+        # Bố cục cũ: root chứa luôn dữ liệu → bỏ qua versions/ và CURRENT khi copy
+        shutil.copytree(
+            source, target,
+            ignore=shutil.ignore_patterns(VERSIONS_DIR, CURRENT_FILE, f"{CURRENT_FILE}.*"),
+        )
+    else:
+        os.makedirs(target)
+
+    print(f"📸 Writing snapshot {version} (from {source})")
+    try:
+        yield target
+    except BaseException:
+        shutil.rmtree(target, ignore_errors=True)
+        raise
+    _publish(root, version)
+    _prune(root, keep)
+    print(f"✅ Published snapshot {version}")
+
+
+class _Handle:
+    """1 version đã load + số query đang dùng nó."""
+
+    def __init__(self, vectordb, version, path, load_seconds, lease=None):
+        self.vectordb = vectordb
+        self.version = version
+        self.path = path
+        self.load_seconds = load_seconds
+        self.lease = lease
+        self.loaded_at = time.time()
+        self.inflight = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def drain(self, timeout: float = None) -> bool:
+        """Chờ tới khi không còn query nào dùng version này."""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.inflight == 0, timeout)
+
+
+class IndexManager:
+    """Giữ vectordb của version hiện tại, hot reload không downtime."""
+
+    def __init__(self, root: str, loader=load_vector_db, drain_timeout: float = 30.0):
+        """
+        Args:
+            root: Thư mục gốc vectorstore (có thể chứa CURRENT + versions/)
+            loader: Hàm persist_dir → vectordb
+            drain_timeout: Số giây tối đa chờ query cũ xong trước khi bỏ version cũ
+        """
+        self.root = root
+        self.loader = loader
+        self.drain_timeout = drain_timeout
+        self.reloads = 0
+        self.last_error = None
+        self._listeners = []
+        self._reload_lock = threading.Lock()
+        self._reloading = False
+        self._handle = self._load()
+
+    def _load(self) -> _Handle:
+        start = time.perf_counter()
+        version = current_version(self.root)
+        path = os.path.join(self.root, VERSIONS_DIR, version) if version else self.root
+        # Giữ lease trước khi đọc để _prune của process ingest không xoá version này
+        lease = VersionLease(self.root, version) if version else None
+        try:
+            vectordb = self.loader(path)
+            vectordb._collection.count()  # mở collection / index trước khi nhận query
+        except BaseException:
+            if lease is not None:
+                lease.release()
+            raise
+        return _Handle(vectordb, version, path, time.perf_counter() - start, lease)
+
+    @property
+    def vectordb(self):
+        return self._handle.vectordb
+
+    @property
+    def version(self):
+        return self._handle.version
+
+    def on_swap(self, callback):
+        """Đăng ký callback(vectordb) được gọi sau mỗi lần đổi version."""
+        self._listeners.append(callback)
+
+    @contextmanager
+    def acquire(self):
+        """Dùng vectordb của version hiện tại cho 1 query (version cũ chờ query này xong)."""
+        while True:
+            handle = self._handle
+            with handle.cond:
+                if not handle.closed:  # version vừa bị thay và giải phóng → lấy lại
+                    handle.inflight += 1
+                    break
+        try:
+            yield handle.vectordb
+        finally:
+            with handle.cond:
+                handle.inflight -= 1
+                if handle.inflight == 0:
+                    handle.cond.notify_all()
+
+    def run(self, fn, *args, **kwargs):
+        """fn(vectordb, *args, **kwargs) trên version hiện tại."""
+        with self.acquire() as vectordb:
+            return fn(vectordb, *args, **kwargs)
+
+    def reload(self, force: bool = False) -> dict:
+        """
+        Load version trong CURRENT (nếu khác version đang dùng) rồi đổi sang nó.
+        Chặn tới khi load xong; query mới dùng version mới ngay sau khi đổi.
+        """
+        with self._reload_lock:
+            self._reloading = True
+            try:
+                if not force and current_version(self.root) == self._handle.version:
+                    return {"reloaded": False, **self.stats()}
+                new = self._load()
+                old, self._handle = self._handle, new
+                self.reloads += 1
+                self.last_error = None
+                print(f"🔄 Index reloaded: {old.version} → {new.version} ({new.load_seconds:.2f}s)")
+                for callback in self._listeners:
+                    callback(new.vectordb)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"⚠️ Index reload failed: {e}")
+                raise
+            finally:
+                self._reloading = False
+
+        # Chờ query cũ xong ở thread khác, không chặn người gọi
+        threading.Thread(target=self._retire, args=(old,), daemon=True).start()
+        return {"reloaded": True, **self.stats()}
+
+    def reload_async(self, force: bool = False) -> bool:
+        """Reload ở thread nền. False nếu đang có 1 lần reload khác chạy."""
+        if self._reloading:
+            return False
+
+        def run():
+            try:
+                self.reload(force=force)
+            except Exception:
+                pass  # đã ghi vào last_error
+
+        threading.Thread(target=run, name="index-reload", daemon=True).start()
+        return True
+
+    def _retire(self, handle: _Handle):
+        if not handle.drain(self.drain_timeout):
+            print(f"⚠️ Version {handle.version} still has {handle.inflight} queries after {self.drain_timeout}s")
+            handle.drain()  # không giải phóng khi còn query: file của version phải còn
+        with handle.cond:
+            handle.closed = True
+        if handle.path != self._handle.path:
+            forget_sparse_index(handle.path)
+            close_catalog(handle.path)  # đã drain: không còn query nào đọc catalog này
+            close = getattr(handle.vectordb, "close", None)
+            if close is not None:
+                close()
+        # Đóng mmap / file trước khi trả lease (Windows không xoá được file đang mở)
+        handle.vectordb = None
+        gc.collect()
+        if handle.lease is not None:
+            handle.lease.release()
+
+    def stats(self) -> dict:
+        handle = self._handle
+        return {
+            "version": handle.version,
+            "persist_dir": handle.path,
+            "loaded_at": handle.loaded_at,
+            "load_seconds": handle.load_seconds,
+            "inflight": handle.inflight,
+            "reloads": self.reloads,
+            "reloading": self._reloading,
+            "available_version": current_version(self.root),
+            "last_error": self.last_error,
+        }
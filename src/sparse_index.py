@@ -0,0 +1,337 @@
+"""
+Inverted index BM25 cục bộ cho chunk text, đặt cạnh vectorstore.
+
+Postings lưu dạng mảng (CSR): offsets / doc / tf trong các file .npy,
+load bằng mmap nên mở index gần như tức thì và chỉ trang nào được đọc
+mới nằm trong RAM. Mỗi lần build ghi ra 1 thư mục mới `bm25/<gen>/` rồi
+mới đổi `bm25/CURRENT`, nên không bao giờ ghi đè file mà reader đang mmap.
+
+Index được build lại ở cuối mỗi lần ingest / sync (refresh_sparse_index).
+Trên đường truy vấn, nếu index version của vectorstore đã đổi mà chưa có
+bản mới thì vẫn dùng bản cũ và build lại ở thread nền.
+"""
+
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from src.embedded_store import index_version
+
+INDEX_DIR = "bm25"
+CURRENT_FILE = "CURRENT"
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# Filter metadata: kiểm tra candidate theo từng lô (theo thứ tự điểm BM25)
+FILTER_BATCH_MIN = 64
+
+
+def tokenize(text: str):
+    return TOKEN_RE.findall(text.lower())
+
+
+class SparseIndex:
+    """BM25 trên các chunk, postings dạng mảng NumPy."""
+
+    def __init__(self, chunk_ids, vocab, offsets, postings_doc, postings_tf, doc_len, idf, meta):
+        self.chunk_ids = chunk_ids
+        self.vocab = vocab
+        self.offsets = offsets
+        self.postings_doc = postings_doc
+        self.postings_tf = postings_tf
+        self.doc_len = doc_len
+        self.idf = idf
+        self.meta = meta
+        self.k1 = meta.get("k1", 1.5)
+        self.b = meta.get("b", 0.75)
+        self.avgdl = meta.get("avgdl", 1.0) or 1.0
+        self._norm = None
+
+    @property
+    def version(self):
+        return self.meta.get("version")
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    @classmethod
+    def build(cls, chunk_ids, texts, version=None, k1: float = 1.5, b: float = 0.75):
+        """Build index từ danh sách (chunk_id, text)."""
+        vocab = {}
+        term_ids = []
+        doc_idx = []
+        tfs = []
+        doc_len = np.zeros(len(texts), dtype=np.int32)
+
+        for i, text in enumerate(texts):
+            tokens = tokenize(text or "")
+            doc_len[i] = len(tokens)
+            counts = {}
+            for tok in tokens:
+                counts[tok] = counts.get(tok, 0) + 1
+            for tok, tf in counts.items():
+                term_ids.append(vocab.setdefault(tok, len(vocab)))
+                doc_idx.append(i)
+                tfs.append(min(tf, 65535))
+
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")
+        df = np.bincount(term_ids, minlength=len(vocab))
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=offsets[1:])
+
+        n = max(len(texts), 1)
+        idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        meta = {
+            "version": version,
+            "k1": k1,
+            "b": b,
+            "avgdl": float(doc_len.mean()) if len(texts) else 0.0,
+        }
+        return cls(
+            list(chunk_ids),
+            vocab,
+            offsets,
+            np.asarray(doc_idx, dtype=np.int32)[order],
+            np.asarray(tfs, dtype=np.uint16)[order],
+            doc_len,
+            idf,
+            meta,
+        )
+
+    @classmethod
+    def build_from_vectordb(cls, vectordb, version=None):
+        data = vectordb.get(include=["documents"])
+        return cls.build(data["ids"], data["documents"], version=version)
+
+    def save(self, directory: str):
+        """
+        Ghi index vào thư mục con mới của `directory` rồi đổi CURRENT (os.replace)
+        → reader không thấy bản ghi dở, file đang được mmap không bị ghi đè.
+        """
+        generation = f"{os.getpid()}-{time.time_ns()}"
+        target = os.path.join(directory, generation)
+        os.makedirs(target)
+
+        np.save(os.path.join(target, "offsets.npy"), self.offsets)
+        np.save(os.path.join(target, "postings_doc.npy"), self.postings_doc)
+        np.save(os.path.join(target, "postings_tf.npy"), self.postings_tf)
+        np.save(os.path.join(target, "doc_len.npy"), self.doc_len)
+        np.save(os.path.join(target, "idf.npy"), self.idf)
+        with open(os.path.join(target, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+        with open(os.path.join(target, "chunk_ids.json"), "w", encoding="utf-8") as f:
+            json.dump(self.chunk_ids, f)
+        with open(os.path.join(target, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+
+        current = os.path.join(directory, CURRENT_FILE)
+        tmp_path = f"{current}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(generation)
+        os.replace(tmp_path, current)
+        _remove_old_generations(directory, keep=generation)
+        return target
+
+    @classmethod
+    def load(cls, directory: str):
+        """Load bản hiện tại trong `directory`, các mảng postings được mmap (không đọc hết vào RAM)."""
+        directory = _current_dir(directory)
+
+        def arr(name):
+            return np.load(os.path.join(directory, name), mmap_mode="r")
+
+        with open(os.path.join(directory, "vocab.json"), "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        with open(os.path.join(directory, "chunk_ids.json"), "r", encoding="utf-8") as f:
+            chunk_ids = json.load(f)
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(
+            chunk_ids,
+            vocab,
+            arr("offsets.npy"),
+            arr("postings_doc.npy"),
+            arr("postings_tf.npy"),
+            np.load(os.path.join(directory, "doc_len.npy")),
+            arr("idf.npy"),
+            meta,
+        )
+
+    def search(self, query: str, k: int, accept=None):
+        """
+        Top-k chunk theo BM25 → [(chunk_id, score)].
+
+        Args:
+            accept: Nếu có, hàm list chunk_id → tập chunk_id được phép (metadata
+                filter). Chỉ được gọi trên các candidate theo thứ tự điểm, từng
+                lô, tới khi đủ k kết quả.
+        """
+        if not len(self.chunk_ids):
+            return []
+
+        scores = np.zeros(len(self.chunk_ids), dtype=np.float32)
+        if self._norm is None:
+            self._norm = (self.k1 * (1 - self.b + self.b * self.doc_len / self.avgdl)).astype(np.float32)
+        norm = self._norm
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.postings_doc[start:end]
+            tf = self.postings_tf[start:end].astype(np.float32)
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + norm[docs])
+
+        candidates = np.flatnonzero(scores)
+        if not len(candidates):
+            return []
+        if accept is not None:
+            return self._accepted(candidates, scores, k, accept)
+        if len(candidates) > k:
+            top = np.argpartition(-scores[candidates], k - 1)[:k]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(self.chunk_ids[i], float(scores[i])) for i in candidates]
+
+    def _accepted(self, candidates, scores, k, accept):
+        """Duyệt candidate theo điểm giảm dần, giữ chunk được accept() cho phép."""
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        batch = max(4 * k, FILTER_BATCH_MIN)
+        results = []
+        for start in range(0, len(candidates), batch):
+            rows = candidates[start:start + batch]
+            ids = [self.chunk_ids[i] for i in rows]
+            allowed = accept(ids)
+            results.extend((cid, float(scores[i])) for cid, i in zip(ids, rows) if cid in allowed)
+            if len(results) >= k:
+                break
+        return results[:k]
+
+
+def _current_dir(directory: str) -> str:
+    """Thư mục của bản index hiện tại (theo CURRENT), hoặc chính directory với bố cục cũ."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return os.path.join(directory, f.read().strip())
+    except FileNotFoundError:
+        return directory
+
+
+def _remove_old_generations(directory: str, keep: str):
+    """
+    Xoá các bản cũ (và file của bố cục cũ). Bản đang được mmap (Windows không
+    cho xoá) được giữ lại và thử xoá lại ở lần save sau.
+    """
+    for name in os.listdir(directory):
+        if name in (keep, CURRENT_FILE) or name.startswith(f"{CURRENT_FILE}."):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def _exists(directory: str) -> bool:
+    return os.path.exists(os.path.join(_current_dir(directory), "meta.json"))
+
+
+_indexes = {}
+_rebuilds = {}  # persist_dir → thread đang build lại ở nền
+_lock = threading.Lock()
+_first_build_lock = threading.Lock()
+
+
+def refresh_sparse_index(vectordb) -> SparseIndex:
+    """
+    Build lại BM25 index từ các chunk đang có và lưu cạnh vectorstore.
+    Gọi ở cuối ingest / sync để truy vấn hybrid không phải build trên đường request.
+    """
+    persist_dir = getattr(vectordb, "_persist_directory", None)
+    version = index_version(persist_dir)
+    start = time.perf_counter()
+    index = SparseIndex.build_from_vectordb(vectordb, version=version)
+    if persist_dir:
+        index = SparseIndex.load(index.save(os.path.join(persist_dir, INDEX_DIR)))
+    with _lock:
+        _indexes[persist_dir] = index
+    print(f"🔎 Built BM25 index: {len(index)} chunks in {time.perf_counter() - start:.2f}s")
+    return index
+
+
+def _rebuild_in_background(vectordb, persist_dir):
+    def run():
+        try:
+            refresh_sparse_index(vectordb)
+        except Exception as e:
+            print(f"⚠️ BM25 rebuild failed: {e}")
+        finally:
+            with _lock:
+                _rebuilds.pop(persist_dir, None)
+
+    thread = threading.Thread(target=run, name="bm25-rebuild", daemon=True)
+    _rebuilds[persist_dir] = thread
+    thread.start()
+
+
+def get_sparse_index(vectordb) -> SparseIndex:
+    """
+    BM25 index đồng bộ với vectorstore: load từ `<persist_dir>/bm25`.
+
+    Nếu index version của vectorstore đã đổi kể từ lần build trước thì trả về
+    bản cũ ngay và build lại ở thread nền (chunk mới chỉ thiếu phần BM25 tới
+    khi build xong). Chỉ lần đầu tiên, khi chưa có bản nào, mới build đồng bộ.
+    """
+    persist_dir = getattr(vectordb, "_persist_directory", None)
+    version = index_version(persist_dir)
+    index = _indexes.get(persist_dir)
+    if index is not None and (index.version == version or persist_dir in _rebuilds):
+        return index
+
+    with _lock:
+        index = _indexes.get(persist_dir)
+        if index is not None and (index.version == version or persist_dir in _rebuilds):
+            return index
+
+        directory = os.path.join(persist_dir, INDEX_DIR) if persist_dir else None
+        if directory and _exists(directory):
+            stored = SparseIndex.load(directory)
+            if index is None or stored.version == version:
+                index = _indexes[persist_dir] = stored
+        if index is not None:
+            if index.version != version:
+                _rebuild_in_background(vectordb, persist_dir)
+            return index
+
+    # Chưa có bản nào để dùng tạm → build đồng bộ (1 lần cho mỗi persist_dir)
+    with _first_build_lock:
+        index = _indexes.get(persist_dir)
+        if index is not None:
+            return index
+        print("⏳ Building BM25 index...")
+        return refresh_sparse_index(vectordb)
+
+
+def forget_sparse_index(persist_dir):
+    """Bỏ BM25 index đã cache của 1 persist_dir (vd: snapshot cũ sau khi reload)."""
+    with _lock:
+        _indexes.pop(persist_dir, None)
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60):
+    """
+    Gộp nhiều danh sách xếp hạng (list các ID) bằng RRF: score = Σ 1 / (k + rank).
+    Trả về [(id, score)] giảm dần.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
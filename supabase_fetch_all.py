@@ -1,7 +1,8 @@
 import os
+from functools import partial
 from supabase import create_client, Client
-from src.loader import load_and_split
-from src.embedded_store import create_or_update_vector_db, load_vector_db
+from src.pipeline import run_pipeline
+from src.embedded_store import load_vector_db
 from src.retriever import build_topic_doc_graph
 import tempfile
 import requests
@@ -65,18 +66,23 @@ def download_all_files(bucket: str, folder_prefix: str = ""):
 
     return local_files
 
+def list_files(bucket: str, folder_prefix: str = ""):
+    """Danh sách file (bỏ qua folder con) trong thư mục Supabase Storage."""
+    files = supabase.storage.from_(bucket).list(folder_prefix)
+    return [f for f in files if f.get("metadata") is not None]
+
 if __name__ == "__main__":
     # ví dụ: bucket = "documents", folder_prefix = "69e130e0-c26c-471e-8512-db516de6c35b/uncategorized"
     bucket = "documents"
     folder_prefix = "69e130e0-c26c-471e-8512-db516de6c35b/uncategorized"
-    files = download_all_files(bucket, folder_prefix)
-    print("\n📦 Files downloaded locally:")
-    for f in files:
-        print(" -", f)
-
-    for file in files:
-        chunks = load_and_split(file)
-        vectordb = create_or_update_vector_db(chunks, file)
+    files = list_files(bucket, folder_prefix)
+    print(f"\n📦 {len(files)} files to ingest")
+
+    # Tải (thread pool) → split (process pool) → upsert (1 writer) chạy chồng lên nhau
+    run_pipeline(
+        files,
+        download=partial(download_temp_file_from_res, bucket, folder_prefix),
+    )
 
     
 # Update vectorstore cho từng file
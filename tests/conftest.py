@@ -0,0 +1,72 @@
+"""
+Fixture dùng chung: embedding giả (không cần model) và vectorstore trong thư
+mục tạm (NumPy và Chroma: cùng test chạy trên cả 2 backend).
+"""
+
+import hashlib
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.numpy_store import NumpyVectorStore
+
+DIM = 32
+
+
+class FakeEmbeddings(Embeddings):
+    """Bag-of-words băm → vector: text chung nhiều từ thì gần nhau. Đếm số text đã embed."""
+
+    model_name = "fake"
+
+    def __init__(self):
+        self.calls = 0
+        self.texts = 0
+
+    def _vector(self, text):
+        vector = np.zeros(DIM, dtype=np.float32)
+        for word in text.lower().split():
+            seed = int(hashlib.md5(word.encode("utf-8")).hexdigest()[:8], 16)
+            vector += np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+        if not vector.any():
+            vector[0] = 1.0
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+@pytest.fixture
+def embedder():
+    return FakeEmbeddings()
+
+
+@pytest.fixture(params=["numpy", "chroma"])
+def store(request, tmp_path, embedder):
+    persist_dir = str(tmp_path / "vs")
+    if request.param == "numpy":
+        yield NumpyVectorStore(persist_dir, embedding_function=embedder)
+        return
+
+    pytest.importorskip("chromadb")
+    from langchain_community.vectorstores import Chroma
+
+    # Tên collection riêng mỗi test: client Chroma dùng chung trong process
+    vectordb = Chroma(
+        collection_name=f"test-{tmp_path.name}"[:63],
+        persist_directory=persist_dir,
+        embedding_function=embedder,
+    )
+    yield vectordb
+    vectordb.delete_collection()
+
+
+def make_chunks(texts, **metadata):
+    """Document mới cho mỗi text (upsert gắn thêm metadata vào chunk)."""
+    return [Document(page_content=text, metadata=dict(metadata)) for text in texts]
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src import metrics
+from src.batcher import QueryBatcher
+from src.executor import ExecutorBusyError, InferenceExecutor
+
+
+def test_each_batched_query_takes_an_executor_slot():
+    executor = InferenceExecutor(max_workers=1, max_queue=2)
+    release = threading.Event()
+
+    def embed(queries):
+        release.wait(5)
+        return [[float(len(q))] for q in queries]
+
+    batcher = QueryBatcher(executor, embed, window_ms=50, max_batch=16)
+
+    async def run():
+        tasks = [asyncio.ensure_future(batcher.submit(f"q{i}", lambda v: v[0])) for i in range(5)]
+        await asyncio.sleep(0.1)  # batch đã flush, đang chờ embed
+        assert executor.stats()["in_flight"] == 3
+        release.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        executor.shutdown()
+
+    rejected = [r for r in results if isinstance(r, ExecutorBusyError)]
+    assert len(rejected) == 2
+    assert [r for r in results if not isinstance(r, Exception)] == [2.0, 2.0, 2.0]
+    assert executor.stats()["in_flight"] == 0
+    assert executor.stats()["rejected"] == 2
+
+
+def test_batched_searches_run_in_parallel():
+    executor = InferenceExecutor(max_workers=2, max_queue=2)
+    # Search chạy lần lượt trên 1 thread thì không bao giờ đủ 2 bên → lỗi sau timeout
+    barrier = threading.Barrier(2, timeout=5)
+
+    def search(vector):
+        barrier.wait()
+        return vector[0]
+
+    batcher = QueryBatcher(executor, lambda queries: [[float(len(q))] for q in queries], window_ms=20)
+
+    async def run():
+        return await asyncio.gather(batcher.submit("a", search), batcher.submit("bb", search))
+
+    try:
+        assert asyncio.run(run()) == [1.0, 2.0]
+    finally:
+        executor.shutdown()
+    assert "rag_batcher_batch_size_count" in metrics.render()
+
+
+def test_submit_rejects_when_full():
+    executor = InferenceExecutor(max_workers=1, max_queue=0)
+    release = threading.Event()
+    try:
+        job = executor.submit(release.wait, 5)
+        with pytest.raises(ExecutorBusyError):
+            executor.submit(lambda: None)
+        release.set()
+        job.result(5)
+        deadline = time.monotonic() + 1
+        while executor.stats()["in_flight"] and time.monotonic() < deadline:
+            time.sleep(0.01)  # slot được trả trong done callback, ngay sau result
+    finally:
+        executor.shutdown()
+    assert executor.stats()["in_flight"] == 0
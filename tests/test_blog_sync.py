@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from src.blog_sync import collection_name_for, post_doc_id, sync_blog_dir
+
+
+def _write(path, title, body, tags="[net]"):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"---\ntitle: {title}\ndate: 2024-05-01\ntags: {tags}\n---\n{body}\n")
+
+
+def _doc_ids(store):
+    return {meta["doc_id"] for meta in store.get(include=["metadatas"])["metadatas"]}
+
+
+@pytest.fixture
+def blog(tmp_path):
+    blog_dir = tmp_path / "blogs"
+    blog_dir.mkdir()
+    return blog_dir
+
+
+def _sync(blog, store, **kwargs):
+    return sync_blog_dir(str(blog), store._persist_directory, vectordb=store, **kwargs)
+
+
+def _post_id(blog, name):
+    return post_doc_id(collection_name_for(str(blog)), str(blog / name))
+
+
+def test_add_modify_delete(blog, store):
+    _write(blog / "a.md", "A", "tcp socket handshake")
+    _write(blog / "b.md", "B", "udp datagram checksum")
+
+    summary = _sync(blog, store)
+    assert len(summary["added"]) == 2
+    assert summary["chunks_written"] == 2
+    assert _doc_ids(store) == {_post_id(blog, "a.md"), _post_id(blog, "b.md")}
+
+    summary = _sync(blog, store)
+    assert summary["unchanged"] == 2 and summary["chunks_written"] == 0
+
+    _write(blog / "a.md", "A", "tcp socket handshake and teardown")
+    summary = _sync(blog, store)
+    assert [os.path.basename(p) for p in summary["modified"]] == ["a.md"]
+    assert (summary["chunks_written"], summary["chunks_deleted"]) == (1, 1)
+
+    os.remove(blog / "b.md")
+    summary = _sync(blog, store)
+    assert [os.path.basename(p) for p in summary["deleted"]] == ["b.md"]
+    assert _doc_ids(store) == {_post_id(blog, "a.md")}
+
+
+def test_full_after_delete_removes_post(blog, store):
+    _write(blog / "a.md", "A", "tcp socket handshake")
+    _write(blog / "b.md", "B", "udp datagram checksum")
+    _sync(blog, store)
+
+    os.remove(blog / "b.md")
+    summary = _sync(blog, store, full=True)
+    assert [os.path.basename(p) for p in summary["deleted"]] == ["b.md"]
+    assert [os.path.basename(p) for p in summary["modified"]] == ["a.md"]
+    assert summary["chunks_deleted"] == 1
+    assert _doc_ids(store) == {_post_id(blog, "a.md")}
+
+
+def test_unreadable_post_keeps_chunks_and_is_retried(blog, store):
+    _write(blog / "a.md", "A", "tcp socket handshake")
+    _sync(blog, store)
+    before = store.get(include=[])["ids"]
+
+    with open(blog / "a.md", "wb") as f:
+        f.write(b"---\ntitle: A\n---\n\xff\xfe broken")
+    summary = _sync(blog, store)
+    assert [os.path.basename(p) for p in summary["skipped"]] == ["a.md"]
+    assert store.get(include=[])["ids"] == before
+
+    # Vẫn bị coi là đã sửa ở lần sau → được sync khi file đọc được
+    _write(blog / "a.md", "A", "tcp socket fixed")
+    summary = _sync(blog, store)
+    assert [os.path.basename(p) for p in summary["modified"]] == ["a.md"]
+    assert store.get(include=["documents"])["documents"] == ["tcp socket fixed"]
+
+
+def test_empty_new_post_is_not_recorded(blog, store):
+    _write(blog / "a.md", "A", "")
+    summary = _sync(blog, store)
+    assert [os.path.basename(p) for p in summary["skipped"]] == ["a.md"]
+
+    _write(blog / "a.md", "A", "now with content")
+    summary = _sync(blog, store)
+    assert [os.path.basename(p) for p in summary["added"]] == ["a.md"]
+    assert summary["chunks_written"] == 1
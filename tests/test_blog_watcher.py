@@ -0,0 +1,21 @@
+from src import blog_watcher
+from src.blog_watcher import BlogWatcher
+
+
+def test_failed_initial_sync_keeps_watcher_running(tmp_path, store, monkeypatch):
+    calls = []
+
+    def failing_sync(*args, **kwargs):
+        calls.append(1)
+        raise ValueError("malformed post")
+
+    monkeypatch.setattr(blog_watcher, "sync_blog_dir", failing_sync)
+    watcher = BlogWatcher(str(tmp_path), vectordb=store, poll_interval=0.01)
+    thread = watcher.start()
+    thread.join(0.2)
+    try:
+        assert thread.is_alive()
+        assert calls
+        assert watcher.stats()["last_error"] == "malformed post"
+    finally:
+        watcher.stop(timeout=1)
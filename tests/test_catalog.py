@@ -0,0 +1,45 @@
+"""Catalog tài liệu: tìm theo chuỗi con, metadata của chunk đầu, đóng khi bỏ snapshot."""
+
+import sqlite3
+
+import pytest
+
+from src.catalog import DocumentCatalog, close_catalog, get_catalog
+from src.embedded_store import upsert_document_chunks
+from tests.conftest import make_chunks
+
+
+def test_q_matches_literal_wildcards(tmp_path):
+    catalog = DocumentCatalog(str(tmp_path))
+    catalog.record("a", {"source_file": "100%_done.pdf"}, chunks=1, size=1)
+    catalog.record("b", {"source_file": "1000 done.pdf"}, chunks=1, size=1)
+    catalog.record("c", {"source_file": "my_notes.md", "title": "C:\\path"}, chunks=1, size=1)
+    catalog.record("d", {"source_file": "my notes.md"}, chunks=1, size=1)
+
+    def ids(q):
+        return [doc["doc_id"] for doc in catalog.list(q=q)["documents"]]
+
+    assert ids("0%_") == ["a"]
+    assert ids("my_") == ["c"]
+    assert ids("C:\\") == ["c"]
+    assert ids("notes") == ["c", "d"]
+
+
+def test_catalog_uses_first_chunk_metadata(store):
+    chunks = make_chunks(["", "second chunk text"])
+    chunks[0].metadata["title"] = "First title"
+    chunks[1].metadata["title"] = "Second title"
+    upsert_document_chunks(chunks, "doc1", {"source_file": "post.md"}, vectordb=store)
+
+    [doc] = get_catalog(store._persist_directory).list()["documents"]
+    assert doc["title"] == "First title"
+    assert doc["chunks"] == 2
+
+
+def test_close_catalog_closes_connection(tmp_path):
+    catalog = get_catalog(str(tmp_path))
+    close_catalog(str(tmp_path))
+    with pytest.raises(sqlite3.ProgrammingError):
+        catalog.list()
+    assert get_catalog(str(tmp_path)) is not catalog
+    close_catalog(str(tmp_path))
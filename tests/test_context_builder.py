@@ -0,0 +1,90 @@
+"""pack_context: gộp chunk chồng lấn, khử trùng lặp, cắt theo ngân sách token."""
+
+import pytest
+from langchain_core.documents import Document
+
+from src import context_builder
+from src.context_builder import count_tokens, merge_chunks, pack_context
+
+TEXT = " ".join(f"Sentence number {i} talks about topic {i % 7} in detail." for i in range(40))
+
+
+@pytest.fixture(autouse=True)
+def approximate_tokens(monkeypatch):
+    # Không phụ thuộc tiktoken có sẵn hay không: ~4 ký tự / token
+    monkeypatch.setattr(context_builder, "_encoding", False)
+
+
+def _chunk(start, end, doc_id="d1", **metadata):
+    return Document(
+        page_content=TEXT[start:end],
+        metadata={"doc_id": doc_id, "start_index": start, **metadata},
+    )
+
+
+def test_merges_overlapping_chunks_by_start_index():
+    blocks = merge_chunks([_chunk(300, 600), _chunk(0, 350), _chunk(550, 800)])
+    assert len(blocks) == 1
+    doc, count = blocks[0]
+    assert count == 3
+    assert doc.page_content == TEXT[0:800]
+    assert doc.metadata["start_index"] == 0
+
+
+def test_merges_overlapping_text_without_positions():
+    a = Document(page_content=TEXT[0:300], metadata={"doc_id": "d1"})
+    b = Document(page_content=TEXT[250:500], metadata={"doc_id": "d1"})
+    [(doc, count)] = merge_chunks([b, a])
+    assert count == 2
+    assert doc.page_content == TEXT[0:500]
+
+
+def test_keeps_separate_blocks_across_documents_and_gaps():
+    blocks = merge_chunks([_chunk(0, 300), _chunk(200, 400, doc_id="d2"), _chunk(600, 800)])
+    assert [count for _, count in blocks] == [1, 1, 1]
+    # Thứ tự theo độ liên quan (thứ tự retrieve) được giữ nguyên
+    assert [doc.metadata["doc_id"] for doc, _ in blocks] == ["d1", "d2", "d1"]
+
+
+def test_drops_near_duplicate_sentences_across_blocks():
+    shared = "The event loop schedules coroutines cooperatively on a single thread. "
+    docs = [
+        Document(page_content=shared + "Tasks wrap coroutines.", metadata={"doc_id": "a"}),
+        Document(page_content="Intro. " + shared + "Futures hold results.", metadata={"doc_id": "b"}),
+        Document(page_content=shared, metadata={"doc_id": "c"}),
+    ]
+    stats = {}
+    packed = pack_context(docs, token_budget=1000, stats=stats)
+    assert [doc.metadata["doc_id"] for doc in packed] == ["a", "b"]
+    assert packed[1].page_content == "Intro. Futures hold results."  # câu ngắn không bị bỏ
+    assert stats["dropped_segments"] == 2
+    assert packed[0].metadata["merged_chunks"] == 1
+
+
+def test_respects_token_budget_and_truncates_last_block():
+    docs = [_chunk(0, 400), _chunk(1200, 2000, doc_id="d2")]
+    stats = {}
+    packed = pack_context(docs, token_budget=200, stats=stats)
+    assert len(packed) == 2
+    assert packed[0].page_content == TEXT[0:400]
+    assert packed[1].page_content.endswith(" ...")
+    assert sum(count_tokens(doc.page_content) for doc in packed) <= 200
+    assert stats["tokens"] <= stats["token_budget"] == 200
+    assert stats["truncated"] is True
+    assert stats["input_chunks"] == 2 and stats["blocks"] == 2
+
+
+def test_skips_block_when_remaining_budget_is_too_small():
+    first = _chunk(0, 560)  # 140 token
+    large = _chunk(1200, 2000, doc_id="d2")
+    small = Document(page_content="Short closing note about asyncio.", metadata={"doc_id": "d3"})
+    packed = pack_context([first, large, small], token_budget=150)
+    # Còn 10 token (< MIN_TRUNCATE_TOKENS) → không cắt khối lớn, khối nhỏ phía sau vẫn vừa
+    assert [doc.metadata["doc_id"] for doc in packed] == ["d1", "d3"]
+
+
+def test_first_block_is_truncated_even_under_minimum():
+    packed = pack_context([_chunk(0, 2000)], token_budget=20)
+    assert len(packed) == 1
+    assert count_tokens(packed[0].page_content) <= 20
+    assert pack_context([_chunk(0, 2000)], token_budget=0) == []
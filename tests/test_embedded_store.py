@@ -0,0 +1,120 @@
+from langchain_core.documents import Document
+
+from src.embedded_store import create_or_update_vector_db, delete_document, upsert_document_chunks
+from src.markdown_loader import split_markdown_documents
+from tests.conftest import make_chunks
+
+DOC = "doc-1"
+TEXTS = ["alpha beta gamma", "delta epsilon zeta", "eta theta iota"]
+
+
+def _ids(store, doc_id=DOC):
+    return set(store.get(where={"doc_id": doc_id}, include=[])["ids"])
+
+
+def test_reingest_unchanged_writes_nothing(store, embedder):
+    assert upsert_document_chunks(make_chunks(TEXTS), DOC, vectordb=store) == (3, 3, 0)
+    ids = _ids(store)
+    embedded = embedder.texts
+
+    assert upsert_document_chunks(make_chunks(TEXTS), DOC, vectordb=store) == (3, 0, 0)
+    assert embedder.texts == embedded
+    assert _ids(store) == ids
+
+
+def test_edit_writes_only_changed_chunks(store, embedder):
+    upsert_document_chunks(make_chunks(TEXTS), DOC, vectordb=store)
+    before = _ids(store)
+    embedded = embedder.texts
+
+    edited = [TEXTS[0], "delta epsilon zeta edited", TEXTS[2]]
+    assert upsert_document_chunks(make_chunks(edited), DOC, vectordb=store) == (3, 1, 1)
+    assert embedder.texts == embedded + 1
+
+    after = _ids(store)
+    assert len(after) == 3
+    assert len(before & after) == 2
+    texts = store.get(ids=sorted(after))["documents"]
+    assert sorted(texts) == sorted(edited)
+
+
+def test_removed_chunks_are_deleted(store):
+    upsert_document_chunks(make_chunks(TEXTS), DOC, vectordb=store)
+    assert upsert_document_chunks(make_chunks(TEXTS[:1]), DOC, vectordb=store) == (1, 0, 2)
+    assert len(_ids(store)) == 1
+
+
+def test_duplicate_chunk_text_gets_distinct_ids(store, embedder):
+    texts = ["same text here", "other text", "same text here"]
+    assert upsert_document_chunks(make_chunks(texts), DOC, vectordb=store) == (3, 3, 0)
+    ids = _ids(store)
+    assert len(ids) == 3
+
+    embedded = embedder.texts
+    assert upsert_document_chunks(make_chunks(texts), DOC, vectordb=store) == (3, 0, 0)
+    assert embedder.texts == embedded
+    assert _ids(store) == ids
+
+    # Bớt 1 bản trùng → chỉ xoá đúng 1 chunk
+    assert upsert_document_chunks(make_chunks(texts[:2]), DOC, vectordb=store) == (2, 0, 1)
+    assert len(_ids(store)) == 2
+
+
+def test_documents_do_not_share_chunks(store):
+    upsert_document_chunks(make_chunks(TEXTS), DOC, vectordb=store)
+    upsert_document_chunks(make_chunks(TEXTS), "doc-2", vectordb=store)
+    assert not _ids(store) & _ids(store, "doc-2")
+
+    assert delete_document(DOC, vectordb=store) == 3
+    assert not _ids(store)
+    assert len(_ids(store, "doc-2")) == 3
+
+
+def test_new_file_version_replaces_previous_one(store, tmp_path):
+    path, other = tmp_path / "paper.pdf", tmp_path / "other.pdf"
+    path.write_bytes(b"version 1")
+    other.write_bytes(b"other")
+    create_or_update_vector_db(make_chunks(TEXTS), str(path), vectordb=store)
+    create_or_update_vector_db(make_chunks(TEXTS), str(other), vectordb=store)
+
+    # Nội dung file đổi → doc_id mới, chunk của doc_id cũ cùng source_file bị xoá
+    path.write_bytes(b"version 2")
+    create_or_update_vector_db(make_chunks(TEXTS[:2]), str(path), vectordb=store)
+    stored = store.get(where={"source_file": str(path)})
+    assert len(stored["ids"]) == 2
+    assert len({meta["doc_id"] for meta in stored["metadatas"]}) == 1
+    assert len(store.get(where={"source_file": str(other)})["ids"]) == 3
+
+
+def test_metadata_change_updates_without_reembedding(store, embedder):
+    upsert_document_chunks(make_chunks(TEXTS, title="old"), DOC, vectordb=store)
+    ids = _ids(store)
+    embedded = embedder.texts
+
+    assert upsert_document_chunks(make_chunks(TEXTS, title="new"), DOC, vectordb=store) == (3, 0, 0)
+    assert embedder.texts == embedded
+    assert _ids(store) == ids
+    metadatas = store.get(where={"doc_id": DOC})["metadatas"]
+    assert {meta["title"] for meta in metadatas} == {"new"}
+
+
+def test_editing_post_start_keeps_later_chunks(store, embedder):
+    paragraphs = [f"Paragraph {i} explains topic {i} with enough words to fill a chunk." for i in range(12)]
+    post = "\n\n".join(paragraphs)
+
+    def chunks(text):
+        return split_markdown_documents([Document(page_content=text, metadata={"title": "Post"})], 100, 0)
+
+    assert upsert_document_chunks(chunks(post), DOC, vectordb=store) == (12, 12, 0)
+    before = _ids(store)
+    embedded = embedder.texts
+
+    # Thêm câu mở đầu (ghép vào chunk đầu) → start_index của mọi chunk sau đổi
+    edited = "New intro line.\n\n" + post
+    assert upsert_document_chunks(chunks(edited), DOC, vectordb=store) == (12, 1, 1)
+    assert embedder.texts == embedded + 1
+    assert len(before & _ids(store)) == 11
+
+    stored = store.get(where={"doc_id": DOC})
+    for text, meta in zip(stored["documents"], stored["metadatas"]):
+        assert edited[meta["start_index"]:].startswith(text)
@@ -0,0 +1,110 @@
+"""FaissVectorStore: record trong SQLite, ghi hoãn, chuyển meta.json cũ."""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from src.embedded_store import deferred_writes
+from src.faiss_store import FaissVectorStore
+
+DIM = 16
+
+
+def _vectors(n, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _open(tmp_path, index_type="flat"):
+    return FaissVectorStore(
+        str(tmp_path), index_type=index_type, nlist=4, pq_m=4, pq_bits=4, train_size=64
+    )
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivfpq"])
+def test_round_trip(tmp_path, index_type):
+    store = _open(tmp_path, index_type)
+    vectors = _vectors(100)
+    ids = [f"c{i}" for i in range(100)]
+    store.upsert(ids, vectors, [{"n": i % 2} for i in range(100)], [f"text {i}" for i in range(100)])
+
+    reopened = _open(tmp_path, index_type)
+    assert reopened.count() == 100
+    got = reopened.get(ids=["c3", "c1"])
+    assert got["ids"] == ["c3", "c1"]
+    assert got["documents"] == ["text 3", "text 1"]
+    assert got["metadatas"] == [{"n": 1}, {"n": 1}]
+
+    result = reopened.query(vectors[:1], n_results=3, where={"n": 0})
+    assert result["ids"][0][0] == "c0"
+    assert result["documents"][0][0] == "text 0"
+    assert all(meta == {"n": 0} for meta in result["metadatas"][0])
+
+    store.upsert(["c0"], vectors[5:6], [{"n": 9}], ["moved"])
+    store.delete(ids=["c5"])
+    store.delete(where={"n": 1})
+    reopened = _open(tmp_path, index_type)
+    assert reopened.count() == 50
+    assert reopened.get(ids=["c0"])["documents"] == ["moved"]
+    assert reopened.query(vectors[5:6], n_results=1)["ids"] == [["c0"]]
+
+
+def test_meta_json_holds_no_records(tmp_path):
+    store = _open(tmp_path)
+    store.upsert(["a"], _vectors(1), [{"k": "v"}], ["secret text"])
+    with open(os.path.join(store.directory, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    assert "records" not in meta
+    assert "secret text" not in json.dumps(meta)
+    # Reader không giữ document trong RAM
+    assert store._current().records[0] == ("a", {"k": "v"})
+
+
+def test_deferred_writes_save_index_once(tmp_path):
+    store = _open(tmp_path)
+    store.upsert(["a"], _vectors(1), None, ["a"])
+    saves = []
+    original = store._save
+    store._save = lambda state: (saves.append(state.next_label), original(state))
+
+    vectors = _vectors(10, seed=1)
+    with deferred_writes(store):
+        for i in range(10):
+            store.upsert([f"b{i}"], vectors[i:i + 1], [{"i": i}], [f"b{i}"])
+        store.delete(ids=["a", "b0"])
+        store.upsert(["b1"], vectors[1:2], [{"i": "again"}], ["b1 again"])
+        assert store.get(ids=["b1"])["documents"] == ["b1 again"]
+        assert _open(tmp_path).count() == 1
+        assert saves == []
+
+    assert len(saves) == 1
+    reopened = _open(tmp_path)
+    assert reopened.count() == 9
+    assert reopened.get(ids=["b1"]) == {
+        "ids": ["b1"], "documents": ["b1 again"], "metadatas": [{"i": "again"}], "embeddings": None,
+    }
+    assert len([name for name in os.listdir(store.directory) if name.endswith(".faiss")]) == 2
+
+
+def test_legacy_meta_json_is_migrated(tmp_path):
+    directory = tmp_path / "faiss"
+    directory.mkdir()
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(DIM))
+    index.add_with_ids(_vectors(2), np.asarray([0, 1], dtype=np.int64))
+    faiss.write_index(index, str(directory / "index-old.faiss"))
+    faiss.write_index(faiss.IndexIDMap2(faiss.IndexFlatIP(DIM)), str(directory / "pending-old.faiss"))
+    (directory / "meta.json").write_text(json.dumps({
+        "index_type": "flat", "index": "index-old.faiss", "pending": "pending-old.faiss",
+        "dim": DIM, "next_label": 2, "tombstones": [],
+        "records": [[0, "x", "doc x", {"a": 1}], [1, "y", "doc y", {}]],
+    }))
+
+    store = _open(tmp_path)
+    assert store.get(ids=["y", "x"])["documents"] == ["doc y", "doc x"]
+    assert "records" not in json.loads((directory / "meta.json").read_text())
+    store.upsert(["z"], _vectors(1, seed=3), None, ["doc z"])
+    assert _open(tmp_path).count() == 3
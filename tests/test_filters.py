@@ -0,0 +1,72 @@
+import pytest
+
+from src.embedded_store import upsert_document_chunks
+from src.filters import build_where, parse_date, tag_flags, tag_key
+from tests.conftest import make_chunks
+
+
+def test_tag_key_normalizes_separators_and_case():
+    assert tag_key("Java Socket") == "tag_java_socket"
+    assert tag_key(" java-socket ") == "tag_java_socket"
+    assert tag_key("java_socket") == "tag_java_socket"
+
+
+def test_tag_key_escapes_symbols_without_collisions():
+    keys = {tag_key(t) for t in ("C", "C++", "C#", "c+", "node.js", "nodejs")}
+    assert len(keys) == 6
+    assert tag_key("C++") == "tag_c_2b_2b"
+    assert tag_key("C#") == "tag_c_23"
+
+
+def test_tag_flags_skips_blank_tags():
+    assert tag_flags(["Java", " ", ""]) == {"tag_java": True}
+
+
+def test_build_where_without_filters():
+    assert build_where() is None
+    assert build_where(tags=["", " "]) is None
+
+
+def test_build_where_single_condition_is_not_wrapped():
+    assert build_where(collection="hugo_blogs_blogs") == {"collection": "hugo_blogs_blogs"}
+
+
+def test_build_where_combines_fields_tags_and_dates():
+    where = build_where(
+        type="blog_post",
+        tags=["Java", "C++"],
+        date_from="2024-01-01",
+        date_to="2024-01-31",
+    )
+    assert where == {
+        "$and": [
+            {"type": "blog_post"},
+            {"tag_java": True},
+            {"tag_c_2b_2b": True},
+            {"date_ts": {"$gte": parse_date("2024-01-01")}},
+            # Chỉ có ngày → tính tới hết ngày đó
+            {"date_ts": {"$lte": parse_date("2024-01-31") + 86399}},
+        ]
+    }
+
+
+def test_build_where_keeps_exact_datetime_bound():
+    where = build_where(date_to="2024-01-31T12:00:00+00:00")
+    assert where == {"date_ts": {"$lte": parse_date("2024-01-31T12:00:00+00:00")}}
+
+
+def test_build_where_rejects_bad_date():
+    with pytest.raises(ValueError):
+        build_where(date_from="yesterday")
+
+
+def test_build_where_rejects_unknown_field():
+    with pytest.raises(TypeError):
+        build_where(author="me")
+
+
+def test_filtered_search_matches_tagged_chunks(store):
+    upsert_document_chunks(make_chunks(["tcp socket"], **tag_flags(["C++"])), "doc-1", vectordb=store)
+    upsert_document_chunks(make_chunks(["tcp socket"], **tag_flags(["C#"])), "doc-2", vectordb=store)
+    found = store.get(where=build_where(tags=["c++"]))["metadatas"]
+    assert [meta["doc_id"] for meta in found] == ["doc-1"]
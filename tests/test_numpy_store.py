@@ -0,0 +1,145 @@
+"""NumpyVectorStore: get / upsert / delete / query, ghi hoãn và dọn file cũ."""
+
+import glob
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from src.embedded_store import deferred_writes, index_version
+from src.numpy_store import NumpyVectorStore
+from tests.conftest import FakeEmbeddings
+
+TEXTS = {
+    "a": "python asyncio event loop",
+    "b": "numpy matrix multiplication",
+    "c": "hugo blog markdown post",
+}
+
+
+@pytest.fixture
+def store(tmp_path, embedder):
+    # Test riêng của NumpyVectorStore: không chạy trên Chroma như fixture chung
+    return NumpyVectorStore(str(tmp_path / "vs"), embedding_function=embedder)
+
+
+def _upsert(store, ids, **metadata):
+    embedder = FakeEmbeddings()
+    store.upsert(
+        ids,
+        embedder.embed_documents([TEXTS[i] for i in ids]),
+        metadatas=[{"key": i, **metadata} for i in ids],
+        documents=[TEXTS[i] for i in ids],
+    )
+
+
+def _npy_files(store):
+    return sorted(os.path.basename(p) for p in glob.glob(os.path.join(store.directory, "*.npy")))
+
+
+def test_round_trip_get_upsert_delete_query(store):
+    _upsert(store, ["a", "b", "c"], lang="en")
+
+    reopened = NumpyVectorStore(store._persist_directory, embedding_function=FakeEmbeddings())
+    got = reopened.get(ids=["c", "a", "missing"], include=("documents", "metadatas", "embeddings"))
+    assert got["ids"] == ["c", "a"]
+    assert got["documents"] == [TEXTS["c"], TEXTS["a"]]
+    assert got["metadatas"][0] == {"key": "c", "lang": "en"}
+    assert got["embeddings"].shape == (2, 32)
+    assert reopened.get(where={"key": "b"})["ids"] == ["b"]
+
+    result = reopened.query(FakeEmbeddings().embed_documents([TEXTS["b"]]), n_results=2)
+    assert result["ids"][0][0] == "b"
+    assert result["distances"][0][0] < 1e-5
+
+    # Ghi đè giữ nguyên vị trí, id mới nối thêm
+    store.upsert(["a"], FakeEmbeddings().embed_documents([TEXTS["b"]]), [{"key": "a2"}], ["replaced"])
+    assert store.get()["ids"] == ["a", "b", "c"]
+    assert store.get(ids=["a"])["documents"] == ["replaced"]
+
+    store.delete(ids=["b"])
+    store.delete(where={"key": "c"})
+    assert store.get()["ids"] == ["a"]
+    assert store.count() == 1
+    result = store.query(FakeEmbeddings().embed_documents([TEXTS["b"]]), n_results=3)
+    assert result["ids"] == [["a"]]
+
+
+def test_deferred_writes_save_once(store):
+    _upsert(store, ["a"])
+    before = _npy_files(store)
+    saves = []
+    original = store._save
+    store._save = lambda *args: (saves.append(args[0]), original(*args))
+    version = index_version(store._persist_directory)
+
+    with deferred_writes(store):
+        _upsert(store, ["b", "c"])
+        store.delete(ids=["a"])
+        _upsert(store, ["a"], again=True)
+
+        # Thread đang ghi thấy thay đổi của nó; thread khác vẫn thấy snapshot đã lưu
+        assert store.get()["ids"] == ["b", "c", "a"]
+        assert store.get(ids=["a"])["metadatas"] == [{"key": "a", "again": True}]
+        other = {}
+        thread = threading.Thread(target=lambda: other.update(store.get()))
+        thread.start()
+        thread.join()
+        assert other["ids"] == ["a"]
+        assert _npy_files(store) == before
+        assert saves == []
+
+    assert saves == [["b", "c", "a"]]
+    assert index_version(store._persist_directory) != version
+    reopened = NumpyVectorStore(store._persist_directory)
+    assert reopened.get(include=("embeddings",))["embeddings"].shape == (3, 32)
+
+
+def test_deferred_writes_without_changes_do_not_save(store):
+    _upsert(store, ["a"])
+    version = index_version(store._persist_directory)
+    with deferred_writes(store):
+        store.delete(ids=["missing"])
+    assert index_version(store._persist_directory) == version
+
+
+def test_stale_files_removed_on_next_save(store, monkeypatch):
+    _upsert(store, ["a"])
+    first = _npy_files(store)
+
+    # Windows: file còn bị mmap → os.remove lỗi, lần lưu sau thử lại
+    real_remove = os.remove
+
+    def locked_remove(path):
+        raise PermissionError(path)
+
+    monkeypatch.setattr(os, "remove", locked_remove)
+    _upsert(store, ["b"])
+    assert set(first) < set(_npy_files(store))
+    assert store.get()["ids"] == ["a", "b"]
+
+    monkeypatch.setattr(os, "remove", real_remove)
+    _upsert(store, ["c"])
+    assert len(_npy_files(store)) == 1
+    assert not set(first) & set(_npy_files(store))
+
+
+def test_compressed_dtypes_rescore_to_float32_ranking(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, 32)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [f"id{i}" for i in range(len(vectors))]
+    queries = rng.standard_normal((20, 32)).astype(np.float32)
+
+    results = {}
+    for dtype in ("float32", "float16", "int8"):
+        store = NumpyVectorStore(str(tmp_path / dtype), dtype=dtype)
+        store.upsert(ids, vectors, documents=ids)
+        results[dtype] = store.query(queries, n_results=5)
+
+    exact = results["float32"]
+    for dtype in ("float16", "int8"):
+        assert results[dtype]["ids"] == exact["ids"]
+        # Điểm sau rescore lấy từ vector float32 nên trùng với float32
+        assert np.allclose(results[dtype]["distances"], exact["distances"], atol=1e-5)
@@ -0,0 +1,25 @@
+"""download_to_temp: mỗi lần tải 1 file tạm riêng."""
+
+from types import SimpleNamespace
+
+from src import pipeline
+
+URL = "https://example.com/files/paper.pdf"
+
+
+def test_parallel_downloads_get_distinct_temp_files(tmp_path, monkeypatch):
+    bodies = iter([b"first", b"second"])
+    monkeypatch.setattr(
+        pipeline.requests, "get",
+        lambda url, timeout: SimpleNamespace(content=next(bodies), raise_for_status=lambda: None),
+    )
+    first = pipeline.download_to_temp(URL, str(tmp_path))
+    second = pipeline.download_to_temp(URL, str(tmp_path))
+
+    assert first != second
+    assert first.endswith(".pdf") and second.endswith(".pdf")
+    with open(first, "rb") as f:
+        assert f.read() == b"first"
+    with open(second, "rb") as f:
+        assert f.read() == b"second"
+    assert pipeline.download_to_temp("local.pdf") == "local.pdf"
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+
+from src import query_cache
+from src.embedded_store import upsert_document_chunks
+from src.retriever import _search, _vote_documents, build_topic_doc_graph
+from tests.conftest import make_chunks
+
+# Vectorstore giả chỉ có metadata collection: Chroma mặc định (bình phương L2) và cosine
+CHROMA_L2 = SimpleNamespace(_collection=SimpleNamespace(metadata=None))
+COSINE = SimpleNamespace(_collection=SimpleNamespace(metadata={"hnsw:space": "cosine"}))
+
+
+def _results(space, cosines):
+    """[(Document, distance)] với distance tính từ cosine theo loại distance của store."""
+    to_distance = {"l2": lambda c: 2 - 2 * c, "cosine": lambda c: 1 - c}[space]
+    return [
+        (Document(page_content="", metadata={"source": source}), to_distance(cosine))
+        for source, cosine in cosines
+    ]
+
+
+def test_cached_results_are_copies(store):
+    query_cache.search_results.clear()
+    upsert_document_chunks(make_chunks(["alpha beta", "gamma delta"]), "doc-1", vectordb=store)
+
+    first = _search(store, "alpha", 2)
+    first[0][0].page_content = "mutated"
+    first[0][0].metadata["doc_id"] = "mutated"
+
+    second = _search(store, "alpha", 2)
+    assert second[0][0].page_content == "alpha beta"
+    assert second[0][0].metadata["doc_id"] == "doc-1"
+    assert second[0][0] is not first[0][0]
+
+
+@pytest.mark.parametrize("vectordb,space", [(CHROMA_L2, "l2"), (COSINE, "cosine")])
+def test_vote_sum_prefers_documents_with_more_matching_chunks(vectordb, space):
+    # cosine thấp (âm) vẫn là chunk khớp: thêm chunk không được làm điểm giảm
+    results = _results(space, [("many", -0.2), ("many", -0.2), ("many", -0.2), ("one", -0.1)])
+    ranked = _vote_documents(vectordb, results, 2, aggregate="sum")
+    assert [source for source, _ in ranked] == ["many", "one"]
+    assert all(0.0 <= score for _, score in ranked)
+
+
+@pytest.mark.parametrize("vectordb,space", [(CHROMA_L2, "l2"), (COSINE, "cosine")])
+def test_vote_max_uses_best_chunk(vectordb, space):
+    results = _results(space, [("many", 0.3), ("many", 0.4), ("one", 0.9)])
+    ranked = _vote_documents(vectordb, results, 2, aggregate="max")
+    assert [source for source, _ in ranked] == ["one", "many"]
+    assert ranked[0][1] == pytest.approx((1 + 0.9) / 2)
+    assert ranked[1][1] == pytest.approx((1 + 0.4) / 2)
+
+
+def test_topic_graph_scores_match_edge_weights(store):
+    query_cache.search_results.clear()
+    upsert_document_chunks(make_chunks(["alpha beta", "gamma delta"]), "doc-1", vectordb=store)
+    upsert_document_chunks(make_chunks(["epsilon zeta", "eta theta"]), "doc-2", vectordb=store)
+
+    graph = build_topic_doc_graph(store, ["alpha", "unrelated words"], top_k=4)
+    weights = {(edge["source"], edge["target"]): edge["weight"] for edge in graph["edges"]}
+    assert all(0.0 <= weight <= 1.0 for weight in weights.values())
+    for info in graph["documents"]:
+        # Điểm document = tổng weight cao nhất của từng topic, không bị kẹp ở 0
+        assert info["score"] == pytest.approx(
+            sum(weight for (_, doc_id), weight in weights.items() if doc_id == info["doc_id"])
+        )
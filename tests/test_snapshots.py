@@ -0,0 +1,97 @@
+"""Snapshot: lease giữ version đang phục vụ khỏi _prune, watcher ghi qua snapshot mới."""
+
+import os
+import time
+
+from src import snapshots
+from src.blog_watcher import BlogWatcher
+from src.numpy_store import NumpyVectorStore
+from src.snapshots import IndexManager, current_version, new_snapshot
+
+
+def _publish(root):
+    with new_snapshot(str(root), keep=0) as persist_dir:
+        os.makedirs(persist_dir, exist_ok=True)
+    return current_version(str(root))
+
+
+def _versions(root):
+    return sorted(os.listdir(root / snapshots.VERSIONS_DIR))
+
+
+def test_prune_keeps_leased_versions(tmp_path, monkeypatch):
+    names = iter(f"v{i}" for i in range(10))
+    monkeypatch.setattr(snapshots.time, "strftime", lambda fmt, *args: next(names))
+    first = _publish(tmp_path)
+    lease = snapshots.VersionLease(str(tmp_path), first)
+
+    second = _publish(tmp_path)
+    assert _versions(tmp_path) == [first, second]
+
+    lease.release()
+    third = _publish(tmp_path)
+    assert _versions(tmp_path) == [third]
+
+
+def test_stale_lease_does_not_block_prune(tmp_path, monkeypatch):
+    names = iter(f"v{i}" for i in range(10))
+    monkeypatch.setattr(snapshots.time, "strftime", lambda fmt, *args: next(names))
+    first = _publish(tmp_path)
+    # Process đã chết: file lease còn nhưng không ai khoá
+    stale = tmp_path / snapshots.LEASES_DIR / f"{first}.99999-1"
+    stale.parent.mkdir(exist_ok=True)
+    stale.write_text("")
+
+    _publish(tmp_path)
+    assert first not in _versions(tmp_path)
+    assert not stale.exists()
+
+
+def test_reload_releases_old_version(tmp_path, monkeypatch):
+    names = iter(f"v{i}" for i in range(10))
+    monkeypatch.setattr(snapshots.time, "strftime", lambda fmt, *args: next(names))
+    first = _publish(tmp_path)
+    index = IndexManager(str(tmp_path), loader=NumpyVectorStore)
+    old = index._handle
+
+    second = _publish(tmp_path)
+    assert first in _versions(tmp_path)  # vẫn đang phục vụ
+
+    with index.acquire():
+        index.reload()
+        # Query đang chạy giữ version cũ; query mới dùng version mới
+        assert index.version == second
+        time.sleep(0.05)
+        assert old.lease._file is not None
+    deadline = time.time() + 2
+    while old.lease._file is not None and time.time() < deadline:
+        time.sleep(0.01)
+    assert old.closed and old.lease._file is None
+
+    _publish(tmp_path)
+    assert first not in _versions(tmp_path)
+    assert second in _versions(tmp_path)
+
+
+def test_watcher_publishes_snapshot_when_posts_change(tmp_path, embedder, monkeypatch):
+    monkeypatch.setattr(
+        "src.embedded_store._open_store",
+        lambda persist_dir, backend=None, **options: NumpyVectorStore(persist_dir, embedding_function=embedder),
+    )
+    root = tmp_path / "vs"
+    blog = tmp_path / "blog"
+    blog.mkdir()
+    _publish(root)
+    published = []
+    watcher = BlogWatcher(str(blog), snapshot_root=str(root), on_publish=lambda: published.append(1))
+
+    (blog / "post.md").write_text("---\ntitle: Hello\n---\n\nHello snapshot world, this is a post.\n")
+    before = current_version(str(root))
+    assert watcher._sync_logged()
+    served = current_version(str(root))
+    assert served != before and published == [1]
+    assert not os.listdir(root / snapshots.VERSIONS_DIR / before)  # version cũ không bị ghi
+    assert NumpyVectorStore(str(root / snapshots.VERSIONS_DIR / served)).count() == 1
+
+    assert watcher.sync() is None  # không đổi gì → không tạo version mới
+    assert current_version(str(root)) == served and published == [1]
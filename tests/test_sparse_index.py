@@ -0,0 +1,56 @@
+import os
+
+from src import sparse_index
+from src.embedded_store import upsert_document_chunks
+from src.retriever import hybrid_search
+from src.sparse_index import INDEX_DIR, SparseIndex, get_sparse_index
+from tests.conftest import make_chunks
+
+
+def test_stale_index_is_served_while_rebuilding(store):
+    upsert_document_chunks(make_chunks(["tcp socket"]), "doc-1", vectordb=store)
+    first = get_sparse_index(store)
+    assert len(first) == 1
+
+    upsert_document_chunks(make_chunks(["udp socket"]), "doc-2", vectordb=store)
+    assert get_sparse_index(store) is first  # không build trên đường request
+    sparse_index._rebuilds[store._persist_directory].join(5)
+
+    fresh = get_sparse_index(store)
+    assert fresh is not first
+    assert len(fresh) == 2
+    assert [cid for cid, _ in fresh.search("udp", 5)] == store.get(where={"doc_id": "doc-2"})["ids"]
+
+
+def test_saved_generations_replace_each_other(tmp_path):
+    directory = str(tmp_path / INDEX_DIR)
+    SparseIndex.build(["a"], ["tcp"], version=1).save(directory)
+    SparseIndex.build(["a", "b"], ["tcp", "udp"], version=2).save(directory)
+
+    loaded = SparseIndex.load(directory)
+    assert loaded.version == 2 and len(loaded) == 2
+    assert len([name for name in os.listdir(directory) if name != "CURRENT"]) == 1
+
+
+def test_filter_checks_only_ranked_candidates():
+    texts = [f"socket {'tcp ' * (i % 5)}chunk{i}" for i in range(200)]
+    index = SparseIndex.build([f"c{i}" for i in range(200)], texts)
+    checked = []
+
+    def accept(ids):
+        checked.extend(ids)
+        return {cid for cid in ids if int(cid[1:]) % 2 == 0}
+
+    results = index.search("tcp socket", 5, accept=accept)
+    assert len(results) == 5
+    assert all(int(cid[1:]) % 2 == 0 for cid, _ in results)
+    assert len(checked) < 200
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_hybrid_search_applies_filter(store):
+    upsert_document_chunks(make_chunks(["tcp socket basics"]), "doc-1", {"type": "a"}, vectordb=store)
+    upsert_document_chunks(make_chunks(["tcp socket advanced"]), "doc-2", {"type": "b"}, vectordb=store)
+    results = hybrid_search(store, "tcp socket", 5, filter={"type": "b"})
+    assert [doc.metadata["doc_id"] for doc, _ in results] == ["doc-2"]
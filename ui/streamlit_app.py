@@ -126,7 +126,12 @@ elif page == "Knowledge Graph":
 
                 # Add edges
                 for edge in graph_data["edges"]:
-                    net.add_edge(edge["source"], edge["target"])
+                    weight = edge.get("weight")
+                    if weight is None:
+                        net.add_edge(edge["source"], edge["target"])
+                    else:
+                        net.add_edge(edge["source"], edge["target"], value=weight,
+                                     title=f"similarity {weight:.2f}, {edge.get('chunks', 1)} chunks")
 
                 net.save_graph("graph.html")
                 st.components.v1.html(open("graph.html", "r", encoding="utf-8").read(), height=650)